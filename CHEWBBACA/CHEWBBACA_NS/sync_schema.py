@@ -68,12 +68,14 @@ from Bio import SeqIO
 
 try:
     from utils import constants as cnst
+    from utils import incremental
     from utils import sqlite_functions as sq
     from utils import auxiliary_functions as aux
     from utils import parameters_validation as pv
     from PrepExternalSchema import PrepExternalSchema
 except:
     from CHEWBBACA.utils import constants as cnst
+    from CHEWBBACA.utils import incremental
     from CHEWBBACA.utils import sqlite_functions as sq
     from CHEWBBACA.utils import auxiliary_functions as aux
     from CHEWBBACA.utils import parameters_validation as pv
@@ -1064,6 +1066,9 @@ def main(schema_dir, core_num, base_url, submit):
     # change identifiers in SQLite DB
     if len(rearranged) > 0:
         print('\nUpdating local allele identifiers...')
+        # results folders updated with AlleleCall --incremental
+        # apply the reassignments recorded after their last update
+        incremental.record_reassignments(schema_dir, rearranged)
         altered = sq.update_profiles(schema_dir, rearranged)
         if altered is not None:
             print('Updated {0} profiles.\n'.format(altered))
@@ -1,6 +1,4 @@
 #!/usr/bin/env python3
-from Bio import SeqIO
-from Bio.Seq import Seq
 import os
 import argparse
 import json
@@ -9,46 +7,12 @@ from Bio.Align.Applications import ClustalwCommandline
 import multiprocessing
 import copy
 
-def reverseComplement(strDNA):
-
-    basecomplement = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A'}
-    strDNArevC = ''
-    for l in strDNA:
-
-        strDNArevC += basecomplement[l]
-
-    return strDNArevC[::-1]
-
-def translateSeq(DNASeq,transTable):
-    seq=DNASeq
-    tableid=transTable
-    reversedSeq=False
-    try:
-        myseq= Seq(seq)
-        protseq=Seq.translate(myseq, table=tableid,cds=True)
-    except:
-        reversedSeq=True
-        try:
-            seq=reverseComplement(seq)
-            myseq= Seq(seq)
-            protseq=Seq.translate(myseq, table=tableid,cds=True)
-
-        except:
-            try:
-                seq=seq[::-1]
-                myseq= Seq(seq)
-                protseq=Seq.translate(myseq, table=tableid,cds=True)
-            except:
-                reversedSeq=False
-                try:
-                    seq=seq[::-1]
-                    seq=reverseComplement(seq)
-                    myseq= Seq(seq)
-                    protseq=Seq.translate(myseq, table=tableid,cds=True)
-                except Exception as e:
-
-                    raise ValueError(e)
-    return protseq,seq,reversedSeq
+try:
+    from utils import translation, task_runner
+    from utils import auxiliary_functions as aux
+except ImportError:
+    from CHEWBBACA.utils import translation, task_runner
+    from CHEWBBACA.utils import auxiliary_functions as aux
 
 
 def call_mafft(path_to_save,genefile):
@@ -77,6 +41,36 @@ def call_clustalw(genefile,htmlpath):
     except Exception as e:
         print(e)
         return False
+
+def translated_loci(listgenes,transTable,cpu):
+    """ Translates the alleles of the loci in a pool of processes, one
+    locus per task, yielding the loci in order. Loci are translated in
+    batches of a few loci per process, so that only the translations of
+    a batch are kept in memory. The pool is closed when all loci are
+    yielded or the generator is closed.
+
+    Args:
+        listgenes (list): paths to the loci files.
+        transTable (int): translation table identifier.
+        cpu (int): number of processes.
+
+    Yields:
+        The path to each locus file and the elements
+        returned by aux.translate_fasta.
+    """
+    batchSize=cpu*task_runner.TASKS_PER_PROCESS
+    pool=multiprocessing.Pool(cpu)
+    try:
+        for i in range(0,len(listgenes),batchSize):
+            batch=listgenes[i:i+batchSize]
+            # alleles with ambiguous bases are valid if they are CDSs
+            translated=pool.starmap(aux.translate_fasta,[(gene,transTable,0,None,True) for gene in batch])
+            for gene,result in zip(batch,translated):
+                yield gene,result
+    finally:
+        pool.close()
+        pool.join()
+
 #~ def main():
 #~ 
     #~ parser = argparse.ArgumentParser(description="This program analyses cds")
@@ -120,8 +114,7 @@ def main(genes,transTable,ReturnValues,outputpath,cpu,skipClustalMafft):
 
 
     if not skipClustalMafft:
-        pool = multiprocessing.Pool(cpu)
-
+        mafftTasks=[]
         for gene in listgenes:
 
             gene = gene.rstrip('\n')
@@ -129,30 +122,16 @@ def main(genes,transTable,ReturnValues,outputpath,cpu,skipClustalMafft):
 
             alignFileName=os.path.join(htmlgenespath,(os.path.basename(gene)).replace(".fasta","_aligned.fasta"))
 
-            pool.apply_async(call_mafft,args=[alignFileName,gene])
-
-        pool.close()
-        pool.join()
-
-        pool = multiprocessing.Pool(cpu)
-
-        for gene in listgenes:
-
-            gene = gene.rstrip('\n')
-            gene = gene.rstrip('\r')
+            mafftTasks.append((alignFileName,gene))
 
-            alignFileName=os.path.join(htmlgenespath,(os.path.basename(gene)).replace(".fasta","_aligned.fasta"))
+        task_runner.run_tasks(call_mafft,mafftTasks,cpu,progress=task_runner.report_progress)
 
-            pool.apply_async(call_clustalw,args=[gene,htmlgenespath])
-
-        pool.close()
-        pool.join()
+        clustalTasks=[(gene,htmlgenespath) for gene in listgenes]
+        task_runner.run_tasks(call_clustalw,clustalTasks,cpu,progress=task_runner.report_progress)
 
     toPrintCDSStats="Locus\tFrameshift\tNo Start or Stop\tMore than 1 Stop\t Other\n"
-    for gene in listgenes:
-
-        gene = gene.rstrip('\n')
-        gene = gene.rstrip('\r')
+    # loci are translated in parallel, one locus per process
+    for gene,translated in translated_loci(listgenes,transTable,cpu):
 
         alignFileName=os.path.join(htmlgenespath,(os.path.basename(gene)).replace(".fasta","_aligned.fasta"))
 
@@ -175,23 +154,30 @@ def main(genes,transTable,ReturnValues,outputpath,cpu,skipClustalMafft):
         alleleSizesNotMultipleNames=[]
         alleleSizesTransError=[]
         alleleSizesTransErrorNames=[]
-        # translate each allele and report the error if unable to translate
-        for allele in SeqIO.parse(gene, "fasta"):
+        # translate all alleles and report the error if unable to translate
+        seqids,seqs,prots,strands,codes=translated
+        for alleleID,seq,code in zip(seqids,seqs,codes):
 
             k+=1
-            realAlleleID=allele.id.split("_")[-1]
+            realAlleleID=alleleID.split("_")[-1]
             # if allele is not multiple of 3 it's useless to try to translate
-            if (len(str(allele.seq)) % 3 != 0):
+            if (len(seq) % 3 != 0):
                 multiple=False
                 listnotMultiple.append(realAlleleID)
                 alleleSizesNotMultipleNames.append(realAlleleID)
-                alleleSizesNotMultiple.append(len(str(allele.seq)))
+                alleleSizesNotMultiple.append(len(seq))
                 pass
             else:
                 try:
-                    protseq,seq,reversedSeq=translateSeq(allele.seq, transTable)
+                    if code == translation.INVALID_CHARACTERS:
+                        raise ValueError('ambiguous or invalid characters')
+                    elif code != translation.VALID:
+                        # reason why the allele is not valid in the sense
+                        # orientation, without the 'sense(...)' wrapper
+                        reason=translation.orientation_errors(seq, transTable)[0]
+                        raise ValueError(reason[len(translation.SENSE)+1:-1])
                     alleleNames.append(realAlleleID)
-                    alleleSizes.append(len(str(allele.seq)))
+                    alleleSizes.append(len(seq))
 
                 except Exception as err:
                     if "Extra in frame stop codon found" in str(err):
@@ -208,7 +194,7 @@ def main(genes,transTable,ReturnValues,outputpath,cpu,skipClustalMafft):
                         print(err)
 
                     alleleSizesTransErrorNames.append(realAlleleID)
-                    alleleSizesTransError.append(len(str(allele.seq)))
+                    alleleSizesTransError.append(len(seq))
                     #print "allele "+str(k)+" is not translating"
                     pass
 
@@ -541,6 +527,7 @@ def main(genes,transTable,ReturnValues,outputpath,cpu,skipClustalMafft):
             if not listOther:
                 listOther.append("-")
             toPrintCDSStats+= os.path.basename(gene)+"\t"+','.join(listnotMultiple)+"\t"+','.join(listnotStart)+"\t"+','.join(listStopc)+"\t"+','.join(listOther)+"\n"
+
     #print str(stopc) + " alleles have stop codons inside"
     #print str(notStart) + " alleles don't have start codons"
     print("total of alleles : " + str(totalalleles))
@@ -12,14 +12,21 @@ import datetime as dt
 import multiprocessing
 
 from Bio import SeqIO
-from Bio.Seq import Seq
+from Bio.Blast.Applications import NcbiblastpCommandline
 
 try:
     from allelecall import callAlleles_protein3
-    from utils import ParalogPrunning, runProdigal, Create_Genome_Blastdb
+    from utils import ParalogPrunning, runProdigal, Create_Genome_Blastdb, schema_index, self_scores, cds_store, prediction_cache, translation, task_runner, results_matrix, schema_writer
 except:
     from CHEWBBACA.allelecall import callAlleles_protein3
-    from CHEWBBACA.utils import ParalogPrunning, runProdigal, Create_Genome_Blastdb
+    from CHEWBBACA.utils import ParalogPrunning, runProdigal, Create_Genome_Blastdb, schema_index, self_scores, cds_store, prediction_cache, translation, task_runner, results_matrix, schema_writer
+
+
+# basename of the BLAST database with the representatives of all loci
+LOCI_DB = 'all_loci'
+
+# cost of comparing an allele relative to BLASTing a representative
+ALLELE_COST = 0.05
 
 
 def which(program):
@@ -44,7 +51,15 @@ def which(program):
     return "Not found"
 
 
-def prepGenomes(genomeFile, basepath, verbose, inputCDS):
+def genome_cds(genomeFile, currentGenomeDict, verbose, inputCDS, chosenTaxon, translation_table):
+    """ Gets the CDSs of a genome, predicted with Prodigal or read
+        from the input file if the input already has CDSs.
+
+        Yields:
+            Tuple with the CDS identifier, the DNA sequence in the
+            coding orientation and the protein sequence.
+    """
+
     if verbose:
         def verboseprint(*args):
             for arg in args:
@@ -53,85 +68,117 @@ def prepGenomes(genomeFile, basepath, verbose, inputCDS):
     else:
         verboseprint = lambda *a: None  # do-nothing function
 
-    listOfCDS = {}
-    genomeProts = ""
-    currentCDSDict = {}
-    currentGenomeDict = {}
-
     j = 0
     if inputCDS is False:
 
-        filepath = os.path.join(basepath, str(os.path.basename(genomeFile)) + "_ORF.txt")
-        with open(filepath, 'rb') as f:
-            currentCDSDict = pickle.load(f)
-
-        for contig in SeqIO.parse(genomeFile, "fasta"):
-            sequence = str(contig.seq.upper())
-            currentGenomeDict[contig.id] = sequence
-
-        for contigTag, value in currentCDSDict.items():
+        # CDSs are translated while Prodigal runs, using the strand it predicted
+        for contigTag, start, end, strand in runProdigal.stream_genes(genomeFile, chosenTaxon, translation_table):
+            # CDSs are only translated in the strand predicted by Prodigal, CDSs
+            # with ambiguous bases are kept to be classified by the allele call
+            orientation = translation.SENSE if strand == '+' else translation.ANTISENSE
+            code, protseq, seq, orientation = translation.translate_cds(currentGenomeDict[contigTag][start:end],
+                                                                        11, [orientation], ambiguous=True)
+            if code != translation.VALID:
+                verboseprint(("CDS is not translatable " + str(genomeFile)))
+                continue
 
-            for protein in value:
-                try:
-                    seq = currentGenomeDict[contigTag][protein[0]:protein[1]].upper()
-                    protseq, inverted, seq = translateSeq(seq, verbose)
-                    j += 1
-                    if inverted:
-                        idstr = ">" + contigTag + "&protein" + str(j) + "&" + str(protein[1]) + "-" + str(protein[0])
-                    else:
-                        idstr = ">" + contigTag + "&protein" + str(j) + "&" + str(protein[0]) + "-" + str(protein[1])
-                    genomeProts += idstr + "\n"
-                    listOfCDS[idstr] = seq
-                    genomeProts += str(protseq) + "\n"
-                except Exception as e:
-                    verboseprint((str(e) + " " + str(genomeFile)))
-                    pass
+            j += 1
+            if strand == '-':
+                idstr = ">" + contigTag + "&protein" + str(j) + "&" + str(end) + "-" + str(start)
+            else:
+                idstr = ">" + contigTag + "&protein" + str(j) + "&" + str(start) + "-" + str(end)
+            yield (idstr, seq, str(protseq))
 
     else:
-        for contig in SeqIO.parse(genomeFile, "fasta"):
-            sequence = str(contig.seq.upper())
-            currentGenomeDict[contig.id] = sequence
+        for contigTag, sequence in currentGenomeDict.items():
             try:
                 protseq, inverted, seq = translateSeq(sequence, verbose)
-                j += 1
-                if inverted:
-                    idstr = ">" + contig.id + "&protein" + str(j) + "&0-" + str(len(sequence))
-                else:
-                    idstr = ">" + contig.id + "&protein" + str(j) + "&0-" + str(len(sequence))
-                genomeProts += idstr + "\n"
-                listOfCDS[idstr] = seq
-                genomeProts += str(protseq) + "\n"
             except:
-                print(contig.id + " is not translatable to protein, sequence ignored")
-                pass
+                print(contigTag + " is not translatable to protein, sequence ignored")
+                continue
 
-    if j < 2:
-        raise ValueError("your genome has something wrong, are you using a genome as a CDS fasta file or vice versa?")
+            j += 1
+            idstr = ">" + contigTag + "&protein" + str(j) + "&0-" + str(len(sequence))
+            yield (idstr, seq, str(protseq))
+
+
+def prepared_files(basepath, genomeFile):
+    """ Files created by prepGenomes for a genome.
+
+        Returns:
+            Dictionary with the names of the files in the gene
+            prediction cache as keys and their paths as values.
+    """
+
+    seqFile, offsetsFile, contigsFile = cds_store.store_paths(basepath, genomeFile)
+    proteinFile = os.path.join(basepath, str(os.path.basename(genomeFile)) + "_Protein.fasta")
+
+    return {'CDS.seq': seqFile,
+            'CDS.offsets': offsetsFile,
+            'contigs.txt': contigsFile,
+            'Protein.fasta': proteinFile,
+            'CDS_hashes.txt': schema_index.genome_hashes_path(basepath, genomeFile),
+            'protein_hashes.txt': schema_index.genome_protein_hashes_path(basepath, genomeFile)}
 
-    filepath = os.path.join(basepath, str(os.path.basename(genomeFile)) + "_ORF_Protein.txt")
-    with open(filepath, 'wb') as f:
-        var = listOfCDS
-        pickle.dump(var, f)
-    listOfCDS = ''
 
-    filepath = os.path.join(basepath, str(os.path.basename(genomeFile)) + "_Protein.fasta")
-    with open(filepath, 'w') as f:
-        f.write(genomeProts)
-    genomeProts = ''
-    var = ''
-    currentGenomeDict = ''
-    currentCDSDict = ''
+def prepGenomes(genomeFile, basepath, verbose, inputCDS, chosenTaxon, translation_table,
+                cacheDirectory=None):
+    """ Predicts the CDSs of a genome and creates the CDS store, the
+        FASTA file with the proteins and the hash tables used by the
+        allele call. Genomes found in the gene prediction cache are
+        copied from it instead of running Prodigal.
 
-    return True
+        Returns:
+            True if the files were copied from the cache, False otherwise.
+    """
 
+    files = prepared_files(basepath, genomeFile)
 
-def reverseComplement(strDNA):
-    basecomplement = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A'}
-    strDNArevC = ''
-    for l in strDNA:
-        strDNArevC += basecomplement[l]
+    cacheKey = None
+    if cacheDirectory is not None and inputCDS is False:
+        cacheKey = prediction_cache.cache_key(genomeFile, chosenTaxon, translation_table)
+        if prediction_cache.fetch(cacheDirectory, cacheKey, files):
+            return True
+
+    currentGenomeDict = {}
+    for contig in SeqIO.parse(genomeFile, "fasta"):
+        currentGenomeDict[contig.id] = str(contig.seq.upper())
 
-    return strDNArevC[::-1]
+    # hash tables used to find exact matches against the schema alleles
+    cdsHashes = {}
+    protHashes = {}
+
+    # CDSs are written to the store and the proteins to the FASTA
+    # file as soon as they are translated
+    storeWriter = cds_store.open_writer(basepath, genomeFile)
+    j = 0
+    with open(files['Protein.fasta'], 'w') as f:
+        for idstr, seq, protseq in genome_cds(genomeFile, currentGenomeDict, verbose, inputCDS,
+                                              chosenTaxon, translation_table):
+            f.write(idstr + "\n" + protseq + "\n")
+            cds_store.add_cds(storeWriter, seq)
+            cdsHashes.setdefault(schema_index.sequence_hash(seq), []).append(idstr)
+            protHashes.setdefault(schema_index.sequence_hash(protseq), []).append(idstr)
+            j += 1
+
+    if j < 2:
+        storeWriter[0].close()
+        raise ValueError("your genome has something wrong, are you using a genome as a CDS fasta file or vice versa?")
+
+    # store with the CDSs, ordered by CDS number, and the contig
+    # lengths, shared by all the processes that classify the loci
+    cds_store.close_writer(storeWriter, basepath, genomeFile,
+                           {contig: len(sequence) for contig, sequence in currentGenomeDict.items()})
+
+    with open(files['CDS_hashes.txt'], 'wb') as f:
+        pickle.dump(cdsHashes, f)
+    with open(files['protein_hashes.txt'], 'wb') as f:
+        pickle.dump(protHashes, f)
+
+    if cacheKey is not None:
+        prediction_cache.store(cacheDirectory, cacheKey, files)
+
+    return False
 
 
 def translateSeq(DNASeq, verbose):
@@ -143,37 +190,159 @@ def translateSeq(DNASeq, verbose):
     else:
         verboseprint = lambda *a: None  # do-nothing function
 
-    seq = DNASeq
-    tableid = 11
-    inverted = False
-    try:
-        myseq = Seq(seq)
-        protseq = Seq.translate(myseq, table=tableid, cds=True)
-    except:
-        try:
-            seq = reverseComplement(seq)
-            myseq = Seq(seq)
-            protseq = Seq.translate(myseq, table=tableid, cds=True)
-            inverted = True
-        except:
-            try:
-                seq = seq[::-1]
-                myseq = Seq(seq)
-                protseq = Seq.translate(myseq, table=tableid, cds=True)
-                inverted = True
-            except:
-                try:
-                    seq = seq[::-1]
-                    seq = reverseComplement(seq)
-                    myseq = Seq(seq)
-                    protseq = Seq.translate(myseq, table=tableid, cds=True)
-                    inverted = False
-                except Exception as e:
-                    verboseprint("translation error")
-                    verboseprint(e)
-                    raise
-
-    return protseq, inverted, str(seq)
+    code, protseq, seq, orientation = translation.translate_cds(DNASeq, 11, ambiguous=True)
+    if code != translation.VALID:
+        verboseprint("translation error")
+        raise ValueError("sequence is not translatable to a protein")
+
+    inverted = orientation in [translation.ANTISENSE, translation.REVSENSE]
+
+    return protseq, inverted, seq
+
+
+def create_genomes_blastdb(listOfGenomes, basepath):
+    """ Creates a BLAST database with the translated CDSs of all genomes.
+
+        Args:
+            listOfGenomes (list): paths to the genome files, in the order
+            that is used by the allele calling workers.
+            basepath (str): path to the temporary directory.
+
+        Returns:
+            The path to the BLAST database. The identifier of each subject
+            is prefixed with the index of the genome it belongs to
+            ('<index>|<cds id>'). The number of CDSs in the database is
+            written to a file next to it.
+    """
+
+    combinedFasta = os.path.join(basepath, callAlleles_protein3.GENOMES_DB + "_Protein.fasta")
+    totalCDSs = 0
+    with open(combinedFasta, 'w') as outfile:
+        for i, genomeFile in enumerate(listOfGenomes):
+            filepath = os.path.join(basepath, str(os.path.basename(genomeFile)) + "_Protein.fasta")
+            with open(filepath, 'r') as infile:
+                for line in infile:
+                    if line.startswith('>'):
+                        line = '>{0}|{1}'.format(i, line[1:])
+                        totalCDSs += 1
+                    outfile.write(line)
+
+    Create_Genome_Blastdb.main(combinedFasta, basepath, callAlleles_protein3.GENOMES_DB, False)
+
+    genomesDB = callAlleles_protein3.genomes_db_path(basepath)
+    with open(callAlleles_protein3.genomes_db_count_path(genomesDB), 'w') as outfile:
+        outfile.write(str(totalCDSs))
+
+    return genomesDB
+
+
+def create_loci_blastdb(lGenesFiles, basepath, verbose):
+    """ Creates a BLAST database with the translated representative
+        alleles of all loci.
+
+        Args:
+            lGenesFiles (list): paths to the loci files, in the order
+            that is used to tag the representatives.
+            basepath (str): path to the temporary directory.
+            verbose (bool): increased output verbosity.
+
+        Returns:
+            List with the path to the BLAST database and the total number
+            of representatives. The identifier of each subject is the index
+            of the locus and the ordinal of the representative in the locus
+            short file ('<locus index>|<ordinal>').
+    """
+
+    totalReps = 0
+
+    lociFasta = os.path.join(basepath, LOCI_DB + "_Protein.fasta")
+    with open(lociFasta, 'w') as outfile:
+        for i, gene in enumerate(lGenesFiles):
+            shortgene = os.path.join(os.path.dirname(gene), "short", os.path.basename(gene))
+            shortgene = shortgene.replace(".fasta", "_short.fasta")
+            for j, allele in enumerate(SeqIO.parse(shortgene, "fasta")):
+                protseq, inverted, seq = translateSeq(str(allele.seq.upper()), verbose)
+                outfile.write('>{0}|{1}\n{2}\n'.format(i, j+1, str(protseq)))
+                totalReps += 1
+
+    Create_Genome_Blastdb.main(lociFasta, basepath, LOCI_DB, False)
+
+    return [os.path.join(basepath, LOCI_DB + "_db"), totalReps]
+
+
+def genome_blaster(genomeFile, genomeIndex, basepath, lociDB, blastPath, totalReps):
+    """ BLASTs the translated CDSs of a genome against the database with
+        the representatives of all loci (genome-major mode).
+
+        Args:
+            genomeFile (str): path to the genome file.
+            genomeIndex (int): index of the genome in the sorted list
+            of genomes.
+            basepath (str): path to the temporary directory.
+            lociDB (str): path to the BLAST database with the
+            representatives of all loci.
+            blastPath (str): path to the blastp executable.
+            totalReps (int): total number of representatives.
+
+        Returns:
+            Path to a pickled file with a dictionary with loci indexes as
+            keys and the list of hits in that locus as values. Hits have the
+            same structure as the ones used by the locus workers: the ordinal
+            of the representative, the CDS identifier, the raw score and the
+            start and end positions of the alignment in the representative.
+    """
+
+    proteinFile = os.path.join(basepath, str(os.path.basename(genomeFile)) + "_Protein.fasta")
+
+    # use the size of the genome proteome as database size to get
+    # e-values equivalent to BLASTing representatives against the genome
+    dbsize = 0
+    with open(proteinFile, 'r') as infile:
+        for line in infile:
+            if not line.startswith('>'):
+                dbsize += len(line.strip())
+
+    cline = NcbiblastpCommandline(cmd=blastPath, query=proteinFile, db=lociDB, evalue=0.001,
+                                  dbsize=dbsize, outfmt=callAlleles_protein3.BLAST_OUTFMT,
+                                  max_target_seqs=totalReps, max_hsps=10, num_threads=1)
+    out, err = cline()
+
+    lociHits = {}
+    for hit in callAlleles_protein3.parse_tabular_hits(out):
+        cdsStrName, score, qstart, qend, sstart, send, sseqid = hit
+        locusIndex, repOrdinal = sseqid.split("|")
+        lociHits.setdefault(int(locusIndex), []).append((int(repOrdinal), cdsStrName, score,
+                                                         sstart, send))
+
+    # order hits as if representatives were the queries
+    for locusIndex in lociHits:
+        lociHits[locusIndex].sort(key=lambda x: (x[0], -x[2]))
+
+    hitsFile = os.path.join(basepath, str(os.path.basename(genomeFile)) + "_hits.txt")
+    with open(hitsFile, 'wb') as f:
+        pickle.dump(lociHits, f)
+
+    return hitsFile
+
+
+def split_hits_by_locus(listOfGenomes, lGenesFiles, basepath):
+    """ Groups the hits determined per genome in the genome-major mode
+        into one file per locus, in the format expected by the locus
+        workers (genome indexes as keys and lists of hits as values).
+    """
+
+    lociHits = {}
+    for genomeIndex, genomeFile in enumerate(listOfGenomes):
+        hitsFile = os.path.join(basepath, str(os.path.basename(genomeFile)) + "_hits.txt")
+        with open(hitsFile, 'rb') as f:
+            genomeHits = pickle.load(f)
+        for locusIndex, hits in genomeHits.items():
+            lociHits.setdefault(locusIndex, {})[genomeIndex] = hits
+        os.remove(hitsFile)
+
+    for locusIndex, gene in enumerate(lGenesFiles):
+        with open(callAlleles_protein3.locus_hits_path(basepath, gene), 'wb') as f:
+            pickle.dump(lociHits.get(locusIndex, {}), f)
 
 
 def loci_translation(genesList, listOfGenomes2, verbose):
@@ -230,8 +399,98 @@ def loci_translation(genesList, listOfGenomes2, verbose):
     return genepath, basepath, lGenesFiles, argumentsList, noshortgeneFile
 
 
+def fasta_counts(fastaFile):
+    """ Counts the records and the total length of the
+        sequences in a FASTA file.
+    """
+
+    records = 0
+    length = 0
+    with open(fastaFile, 'rb') as f:
+        for line in f:
+            if line.startswith(b'>'):
+                records += 1
+            else:
+                length += len(line.strip())
+
+    return records, length
+
+
+def locus_cost(gene):
+    """ Estimates the time needed to call the alleles of a locus.
+
+        The representatives are BLASTed against the CDSs of all genomes
+        and the alleles are only used to find exact matches and BSR
+        values, so the cost is dominated by the number of representatives
+        and grows with the length of the sequences.
+
+        Args:
+            gene (str): path to the locus file.
+
+        Returns:
+            Estimated cost, in arbitrary units.
+    """
+
+    shortgene = os.path.join(os.path.dirname(gene), "short", os.path.basename(gene))
+    shortgene = shortgene.replace(".fasta", "_short.fasta")
+
+    alleles, length = fasta_counts(gene)
+    representatives, repsLength = fasta_counts(shortgene)
+    if alleles == 0:
+        return 0
+
+    return (representatives + ALLELE_COST*alleles) * (length / alleles)
+
+
+def run_locus(args):
+    """ Calls the alleles of a locus, recording the process
+        that called them and when.
+
+        Args:
+            args (tuple): arguments of callAlleles_protein3.main.
+
+        Returns:
+            List with the process identifier, the path to the locus
+            arguments file and the start and end times of the call.
+    """
+
+    start = time.time()
+    callAlleles_protein3.main(*args)
+
+    return [os.getpid(), args[0], start, time.time()]
+
+
+def utilization_report(taskTimes, start, end):
+    """ Creates a report with the number of loci processed and the
+        fraction of time that each worker was busy.
+
+        Args:
+            taskTimes (list): lists returned by run_locus.
+            start (float): time when the allele call started.
+            end (float): time when the allele call ended.
+
+        Returns:
+            Report text.
+    """
+
+    workers = {}
+    for pid, argList, taskStart, taskEnd in taskTimes:
+        loci, busy = workers.get(pid, (0, 0))
+        workers[pid] = (loci + 1, busy + taskEnd - taskStart)
+
+    elapsed = max(end - start, 1e-9)
+    lines = ["Worker utilization ({0:.1f}s):".format(elapsed),
+             "{:>10} {:>8} {:>10} {:>12}".format('Worker', 'Loci', 'Busy (s)', 'Utilization')]
+    for pid in sorted(workers):
+        loci, busy = workers[pid]
+        lines.append("{:>10} {:>8} {:>10.1f} {:>11.1f}%".format(pid, loci, busy, 100*busy/elapsed))
+
+    return '\n'.join(lines)
+
+
 def main(genomeFiles, genes, cpuToUse, gOutFile, BSRTresh, BlastpPath, forceContinue, jsonReport,
-         verbose, forceReset, contained, chosenTrainingFile, inputCDS, sizeTresh, translation_table, ns):
+         verbose, forceReset, contained, chosenTrainingFile, inputCDS, sizeTresh, translation_table, ns,
+         genome_major=False, predictionCache=None):
 
     divideOutput = False
 
@@ -336,7 +595,12 @@ def main(genomeFiles, genes, cpuToUse, gOutFile, BSRTresh, BlastpPath, forceCont
     genepath = os.path.dirname(first_gene)
     basepath = os.path.join(genepath, "temp")
     testVar = ""
-    if os.path.isdir(basepath) and not forceContinue and not forceReset:
+    # runs with the same genomes and loci continue without asking,
+    # loci that were interrupted continue from their journals
+    if os.path.isdir(basepath) and not forceReset and results_matrix.same_run(basepath, lGenesFiles, listOfGenomes):
+        print('\nFound files from an unfinished run with the same genomes and loci.')
+        forceContinue = True
+    elif os.path.isdir(basepath) and not forceContinue and not forceReset:
         testVar = input('\nWe found files from an unfinished run. '
                         'Do you wish to continue from where it stopped?\n'
                         'Answer (Y/yes): ')
@@ -356,8 +620,14 @@ def main(genomeFiles, genes, cpuToUse, gOutFile, BSRTresh, BlastpPath, forceCont
         for filee in os.listdir(basepath):
             if filee.endswith("_argList.txt"):
                 argumentsList.append(os.path.join(basepath, str(filee)))
-            elif filee.endswith("_result.txt"):
-                resultsList.append((os.path.join(basepath, str(filee))).replace("_result.txt", "_argList.txt"))
+
+        # loci are marked as done in the results matrix when their
+        # worker has written all its calls
+        if results_matrix.matrix_exists(basepath):
+            matrix = results_matrix.open_matrix(basepath)
+            resultsList = [os.path.join(basepath, os.path.basename(locus) + "_argList.txt")
+                           for locus, done in zip(matrix['loci'], matrix['done']) if done]
+            matrix = None
 
         # remove unfinished directories
         todelFolders = next(os.walk(genepath))[1]
@@ -390,63 +660,94 @@ def main(genomeFiles, genes, cpuToUse, gOutFile, BSRTresh, BlastpPath, forceCont
                 raise ValueError('ERROR! These loci have no short gene file: ' + str(noShort))
 
             # ------------------------------------------------- #
-            #           RUN PRODIGAL OVER ALL GENOMES           #
+            #    RUN PRODIGAL AND TRANSLATE THE GENOMES' CDSs    #
             # ------------------------------------------------- #
 
-            # if the input is a draft genome
+            # the output of Prodigal is translated and written to the CDS
+            # stores and FASTA files while it runs, one genome per core
             if inputCDS is False:
-
                 print("\nStarting Prodigal at: " + time.strftime("%H:%M:%S-%d/%m/%Y"))
+            else:
+                print("\nTranslating genomes...")
 
-                # Prodigal run on the genomes, one genome per core using n-2 cores (n number of cores)
-
-                pool = multiprocessing.Pool(cpuToUse)
-                for genome in listOfGenomes:
-                    pool.apply_async(runProdigal.main, (str(genome), basepath, str(chosenTaxon), translation_table))
-
-                pool.close()
-                pool.join()
+            # a genome that fails stops the run, the error is
+            # reported with the genome and the traceback of the worker
+            prepTasks = [(str(genomeFile), basepath, verbose, inputCDS, str(chosenTaxon),
+                          translation_table, predictionCache) for genomeFile in listOfGenomes]
+            try:
+                prepResults = task_runner.run_tasks(prepGenomes, prepTasks, cpuToUse,
+                                                    progress=task_runner.report_progress)
+            except task_runner.TaskError as e:
+                shutil.rmtree(basepath)
+                raise ValueError("Could not process genome {0}:\n{1}".format(e.task, e.remote_traceback))
 
+            if inputCDS is False:
                 print("Finishing Prodigal at: " + time.strftime("%H:%M:%S-%d/%m/%Y"))
+                cached = sum([1 for r in prepResults if r is True])
+                if predictionCache is not None:
+                    print("Gene predictions of {0} out of {1} genomes were "
+                          "reused from {2}".format(cached, len(listOfGenomes), predictionCache))
+                    prediction_cache.prune(predictionCache)
 
-                print("\nChecking if Prodigal created all the necessary files...")
-
-                listOfORFCreated = []
-                for orffile in os.listdir(basepath):
-                    if orffile.endswith("_ORF.txt"):
-                        listOfORFCreated.append(orffile)
-
-                if len(listOfGenomes) > len(listOfORFCreated):
-                    message = "Missing some files from prodigal. " + str(
-                        (len(listOfGenomes)) - (len(listOfORFCreated))) + " missing files out of " + str(len(listOfGenomes))
-                    shutil.rmtree(basepath)
-                    raise ValueError(message)
-                else:
-                    print("All files were created.")
+            print("\nChecking if all the necessary files were created...")
 
-            # ---CDS to protein---#
+            listOfStoresCreated = [genomeFile for genomeFile in listOfGenomes
+                                   if os.path.isfile(cds_store.store_paths(basepath, genomeFile)[1])]
 
-            # translate the genome CDSs, load them into dictionaries and fasta files to be used further ahead
-            print("\nTranslating genomes...")
+            if len(listOfGenomes) > len(listOfStoresCreated):
+                message = "Missing some files from prodigal. " + str(
+                    (len(listOfGenomes)) - (len(listOfStoresCreated))) + " missing files out of " + str(len(listOfGenomes))
+                shutil.rmtree(basepath)
+                raise ValueError(message)
+            else:
+                print("All files were created.")
+
+            # resolve all exact matches in a single pass before any BLAST
+            print('Finding exact matches against the schema alleles...')
+            schemaIndex = schema_index.load_schema_index(lGenesFiles, genepath)
+            totalExact = schema_index.find_exact_matches(schemaIndex, listOfGenomes,
+                                                         lGenesFiles, basepath)
+            schemaIndex = None
+            print('Found exact matches for {0} of {1} locus/genome pairs.\n'.format(totalExact,
+                                                                                  len(lGenesFiles)*len(listOfGenomes)))
+
+            # self-scores of the representatives come from the schema store,
+            # only the ones missing from the store are computed
+            print('Getting the self-scores of the representative alleles...')
+            shortFiles = [os.path.join(os.path.dirname(gene), "short",
+                                       os.path.basename(gene).replace(".fasta", "_short.fasta"))
+                          for gene in lGenesFiles]
+            analyticScores = self_scores.analytic_scores_valid(shortFiles, genepath, str(BlastpPath), basepath)
             pool = multiprocessing.Pool(cpuToUse)
-            for genomeFile in listOfGenomes:
-                pool.apply_async(prepGenomes, args=[str(genomeFile), basepath, verbose, inputCDS])
-            pool.close()
-            pool.join()
-
-            print('Creating Blast databases for all genomes...\n')
-            # creation of the Databases for each genome, one genome per core using n cores
-            pool = multiprocessing.Pool(cpuToUse)
-            for genomeFile in listOfGenomes:
-                filepath = os.path.join(basepath, str(os.path.basename(genomeFile)) + "_Protein.fasta")
-                os.makedirs(os.path.join(basepath, str(os.path.basename(genomeFile))))
-
-                pool.apply_async(Create_Genome_Blastdb.main, (
-                    filepath, os.path.join(basepath, str(os.path.basename(genomeFile))), str(os.path.basename(genomeFile)),
-                    False))
-
+            totalComputed = self_scores.update_schema_scores(shortFiles, genepath, str(BlastpPath),
+                                                             basepath, pool, analyticScores)
             pool.close()
             pool.join()
+            print('Computed {0} new self-scores.\n'.format(totalComputed))
+
+            print('Creating Blast database with the CDSs of all genomes...\n')
+            # single database for all genomes, each locus is BLASTed
+            # once against all genomes instead of once per genome
+            create_genomes_blastdb(listOfGenomes, basepath)
+
+            # genome-major mode, BLAST each genome against the representatives
+            # of all loci and give the locus workers the hits already grouped
+            if genome_major:
+                print('Blasting genomes against the representatives of all loci...\n')
+                lociDB, totalReps = create_loci_blastdb(lGenesFiles, basepath, verbose)
+                blasterTasks = [(str(genomeFile), genomeIndex, basepath, lociDB,
+                                 str(BlastpPath), totalReps)
+                                for genomeIndex, genomeFile in enumerate(listOfGenomes)]
+                task_runner.run_tasks(genome_blaster, blasterTasks, cpuToUse,
+                                      progress=task_runner.report_progress)
+
+                split_hits_by_locus(listOfGenomes, lGenesFiles, basepath)
+
+            # locus workers write their calls to a matrix with one row per
+            # locus and one column per genome, created when all the files
+            # that the workers need exist so that runs with a matrix can
+            # be resumed
+            results_matrix.create_matrix(basepath, lGenesFiles, listOfGenomes)
 
         except Exception as e:
             exc_type, exc_obj, tb = sys.exc_info()
@@ -466,178 +767,79 @@ def main(genomeFiles, genes, cpuToUse, gOutFile, BSRTresh, BlastpPath, forceCont
         argumentsList = list(set(argumentsList) - set(resultsList))
         argumentsList = sorted(argumentsList)
 
+        # compute new self-scores as validated before the run was stopped
+        validationKey = ('validation',) + self_scores.store_key(str(BlastpPath))
+        analyticScores = self_scores.read_store(genepath).get(validationKey, False)
+
     print
     print("Starting Allele Calling at: " + time.strftime("%H:%M:%S-%d/%m/%Y"))
 
-    # Run the allele call, one gene per core using n cores
-    pool = multiprocessing.Pool(cpuToUse)
-    for argList in argumentsList:
-        pool.apply_async(callAlleles_protein3.main,
-                         (str(argList), basepath, str(BlastpPath), str(verbose), BSRTresh, sizeTresh, ns))
+    # loci are dispatched from the most to the least expensive and each
+    # worker takes the next locus when it finishes the previous one, so
+    # that expensive loci do not keep a few cores busy at the end
+    lociFiles = {os.path.join(basepath, os.path.basename(gene) + "_argList.txt"): gene
+                 for gene in lGenesFiles}
+    lociCosts = {argList: locus_cost(lociFiles[argList]) if argList in lociFiles else 0
+                 for argList in argumentsList}
+    argumentsList = sorted(argumentsList, key=lambda argList: (-lociCosts[argList], argList))
 
-    pool.close()
-    pool.join()
+    # Run the allele call, one gene per core using n cores
+    callStart = time.time()
+    taskTimes = []
+    # task arguments are created as workers take loci, a locus
+    # that fails stops the run with the traceback of the worker
+    tasks = ((str(argList), basepath, str(BlastpPath), str(verbose), BSRTresh, sizeTresh, ns,
+              analyticScores) for argList in argumentsList)
+    for index, taskTime in task_runner.imap_tasks(run_locus, tasks, cpuToUse):
+        taskTimes.append(taskTime)
+        task_runner.report_progress(len(taskTimes), len(argumentsList))
 
     print("\nFinished Allele Calling at: " + time.strftime("%H:%M:%S-%d/%m/%Y"))
+    print(utilization_report(taskTimes, callStart, time.time()))
+
+    # add the new alleles of all loci to the schema, including the
+    # loci of an interrupted run whose changes were not committed
+    committedLoci, committedAlleles = schema_writer.commit_all(basepath)
+    print("Added {0} new alleles to {1} loci of the schema".format(committedAlleles, committedLoci))
 
     print("\nWrapping up the results...")
 
-    output = []
-    output2 = []
-    for gene in lGenesFiles:
-        filepath = os.path.join(basepath, os.path.basename(gene) + "_result.txt")
-        filepath2 = os.path.join(basepath, os.path.basename(gene) + "_result2.txt")
-        with open(filepath, 'rb') as f:
-            var = pickle.load(f)
-            output.append(var)
-        with open(filepath2, 'rb') as f:
-            var = pickle.load(f)
-            output2.append(var)
-
-    numberOfLoci = len(output[0][1])
-    print('{0}\n {1} genomes used for {2} loci'.format('#'*50, numberOfLoci, len(output)))
-    numberexactmatches = 0
-    for gene in output:
-        for gAllele in gene[1]:
-            try:
-                allele_id = int(gAllele) if '*' not in gAllele else int(gAllele.replace('*', ''))
-                numberexactmatches += 1
-            except:
-                pass
+    # loci that were called, in the order of the matrix rows, and
+    # genomes in the order of the columns
+    matrix = results_matrix.open_matrix(basepath)
+    lGenesFiles = matrix['loci']
+    genomeNames = [os.path.basename(genomeFile) for genomeFile in matrix['genomes']]
+
+    numberOfLoci = len(genomeNames)
+    print('{0}\n {1} genomes used for {2} loci'.format('#'*50, numberOfLoci, len(lGenesFiles)))
+    numberexactmatches = int((matrix['status'][:len(lGenesFiles), :numberOfLoci] == results_matrix.EXC).sum())
 
     print('\n Used a BSR of: {0}'.format(BSRTresh))
-    print('\n {0} exact matches found out of {1}'.format(numberexactmatches, len(output[0][1])*len(lGenesFiles)))
+    print('\n {0} exact matches found out of {1}'.format(numberexactmatches, numberOfLoci*len(lGenesFiles)))
     exact_percentage = float((numberexactmatches*100) / (numberOfLoci*len(lGenesFiles)))
     exact_percentage = '{:.2f}'.format(exact_percentage)
     print('\n {0} percent of exact matches\n{1}'.format(exact_percentage, '#'*50))
     print('\nWriting output files...\n')
 
-    # wrapping up the results into a matrix and save in a file
+    # the output files are written one genome at a time from the columns
+    # of the results matrix, only the calls of one genome are kept in memory
+    def allele_rows():
+        for genome, currentGenome in enumerate(genomeNames):
+            yield [currentGenome] + results_matrix.genome_alleles(matrix, genome)
+
+    def contig_rows():
+        for genome, currentGenome in enumerate(genomeNames):
+            names = results_matrix.contig_names(basepath, matrix['genomes'][genome])
+            yield [currentGenome] + results_matrix.genome_contigs(matrix, genome, names)
+
+    def statistics_rows():
+        for genome, currentGenome in enumerate(genomeNames):
+            yield [currentGenome] + results_matrix.genome_statistics(matrix, genome)
+
     try:
-        phylovout = []
-        phylovout2 = []
-        genesnames = []
-        statistics = []
-
-        for gene in lGenesFiles:
-            genename = gene.split("/")
-            genename = genename[len(genename) - 1]
-            genesnames.append(genename)
-        gene = 0
-
-        containedOutpWrite = ''
-        for geneOut in output:
-            genome = 0
-            alleleschema = []
-            while genome < numberOfLoci:
-
-                genename = (geneOut[1][genome]).split("_")
-                if len(genename) != 1:
-                    alleleschema.append(genename[1])
-                else:
-                    alleleschema.append(genename[0])
-                genome += 1
-
-            phylovout.append(alleleschema)
-            if len(geneOut[0]) > 0:
-                containedOutpWrite += lGenesFiles[gene] + "\n"
-            for contained2 in geneOut[0]:
-                containedOutpWrite += contained2[0] + "\t" + contained2[1] + "-->" + contained2[2] + "\n"
-            gene += 1
-
-        for geneOut in output2:
-            gene = 0
-            alleleschema = []
-            while gene < len(output2[0]):
-                genename = (geneOut[gene])
-
-                alleleschema.append(genename)
-                gene += 1
-            phylovout2.append(alleleschema)
-
-        genome = 0
-
-        genesHeader = "FILE" + "\t" + ('\t'.join(map(str, genesnames)))
-        finalphylovinput = genesHeader
-        finalphylovinput2 = genesHeader
-
-        if divideOutput:
-            allelesDict = {}
-            contigDict = {}
-            statsDict = {}
-
-        while genome < len(listOfGenomes):
-            auxList = []
-            currentGenome = listOfGenomesBasename[genome]
-            statsaux = [0] * 7  # EXC INF LNF PLOT NIPH ALM ASM
-            finalphylovinput += "\n" + currentGenome + "\t"
-            for gene in phylovout:
-
-                val = str(gene[genome])
-                auxList.append(val)
-                if "INF" in val:
-                    statsaux[1] += 1
-                elif "LNF" in val:
-                    statsaux[2] += 1
-                elif "PLOT" in val:
-                    statsaux[3] += 1
-                elif "NIPH" in val:
-                    statsaux[4] += 1
-                elif "ALM" in val:
-                    statsaux[5] += 1
-                elif "ASM" in val:
-                    statsaux[6] += 1
-                else:
-                    statsaux[0] += 1
-
-            if divideOutput:
-                allelesDict[currentGenome] = ('\t'.join(map(str, auxList)))
-            finalphylovinput += ('\t'.join(map(str, auxList)))
-            # append genome profile to list with new profiles to append
-            # to schema profiles master file
-            genome += 1
-            statistics.append(statsaux)
-
-        #########################
-        # This is removes INF from the matrix
-        # finalphylovinput = finalphylovinput.replace("INF-","")
-
-        genome = 0
-        while genome < len(listOfGenomes):
-            auxList = []
-            currentGenome = listOfGenomesBasename[genome]
-            finalphylovinput2 += "\n" + currentGenome + "\t"
-            for gene in phylovout2:
-                val = str(gene[genome])
-                auxList.append(val)
-
-            if divideOutput:
-                contigDict[currentGenome] = ('\t'.join(map(str, auxList)))
-            finalphylovinput2 += ('\t'.join(map(str, auxList)))
-            genome += 1
-
-        statsHeader = 'Genome\tEXC\tINF\tLNF\tPLOT\tNIPH\tALM\tASM'
-        statswrite = statsHeader
-        # create formatted stats for stdout
-        width = max([len(g) for g in listOfGenomesBasename]) + 2
-        stdout_Header = ('{:<{width}}  {:^5}  {:^5}  {:^5}  {:^5}  {:^5}  {:^5}  {:^5}'
-                         ''.format('Genome', 'EXC', 'INF', 'LNF', 'PLOT', 'NIPH', 'ALM', 'ASM', width=width))
-        stdout_line = '-'*len(stdout_Header)
-        stdout_stats = [stdout_line, stdout_Header, stdout_line]
-        genome = 0
-        while genome < len(listOfGenomes):
-            auxList = []
-            currentGenome = listOfGenomesBasename[genome]
-            statswrite += "\n" + currentGenome + "\t"
-            for k in statistics[genome]:
-                auxList.append(str(k))
-
-            if divideOutput:
-                statsDict[currentGenome] = ('\t'.join(map(str, auxList)))
-            statswrite += ('\t'.join(map(str, auxList)))
-            stdout_stats.append('{:<{width}}  {:^5}  {:^5}  {:^5}  {:^5}  {:^5}  {:^5}  {:^5}'
-                                ''.format(currentGenome, *auxList, width=width))
-            genome += 1
+        genesnames = [os.path.basename(gene) for gene in lGenesFiles]
+        genesHeader = ["FILE"] + genesnames
+        statsHeader = ['Genome'] + results_matrix.STATISTICS
 
         if not os.path.exists(gOutFile):
             os.makedirs(gOutFile)
@@ -645,59 +847,48 @@ def main(genomeFiles, genes, cpuToUse, gOutFile, BSRTresh, BlastpPath, forceCont
         outputfolder = os.path.join(gOutFile, "results_" + str(time.strftime("%Y%m%dT%H%M%S")))
         os.makedirs(outputfolder)
 
-        stdout_stats.append(stdout_line)
-        stdout_stats = '\n'.join(stdout_stats)
-        print(stdout_stats)
+        # create formatted stats for stdout
+        width = max([len(g) for g in genomeNames]) + 2
+        stdout_Header = ('{:<{width}}  {:^5}  {:^5}  {:^5}  {:^5}  {:^5}  {:^5}  {:^5}'
+                         ''.format(*statsHeader, width=width))
+        stdout_line = '-'*len(stdout_Header)
+        print(stdout_line)
+        print(stdout_Header)
+        print(stdout_line)
+        for row in statistics_rows():
+            print('{:<{width}}  {:^5}  {:^5}  {:^5}  {:^5}  {:^5}  {:^5}  {:^5}'
+                  ''.format(*row, width=width))
+        print(stdout_line)
 
         if jsonReport:
             runReport = {'finalStatus': 'success'}
             with open(os.path.join(outputfolder, "reportStatus.json"), 'w') as outfile:
                 json.dump(runReport, outfile)
 
-            aux = []
-            runReport = {}
-            for allelename in ((finalphylovinput.splitlines()[0]).split('\t'))[1:]:
-                aux.append(allelename)
-            runReport['header'] = aux
-
-            for line in (finalphylovinput.splitlines())[1:]:
-                aux2 = line.split('\t')
-                genome = aux2[0]
-                runReport[genome] = aux2[1:]
-
-            with open(os.path.join(outputfolder, "results_alleles.json"), 'w') as outfile:
-                json.dump(runReport, outfile)
-
-            aux = []
-            runReport = {}
-            for allelename in ((statswrite.splitlines()[0]).split('\t'))[1:]:
-                aux.append(allelename)
-            runReport['header'] = aux
-
-            for line in (statswrite.splitlines())[1:]:
-                aux2 = line.split('\t')
-                genome = aux2[0]
-                runReport[genome] = aux2[1:]
-
-            with open(os.path.join(outputfolder, "results_statistics.json"), 'w') as outfile:
-                json.dump(runReport, outfile)
+            results_matrix.write_json(os.path.join(outputfolder, "results_alleles.json"),
+                                      genesHeader[1:], allele_rows())
+            results_matrix.write_json(os.path.join(outputfolder, "results_statistics.json"),
+                                      statsHeader[1:], statistics_rows())
 
         elif not divideOutput:
-            with open(os.path.join(outputfolder, "results_alleles.tsv"), 'w') as f:
-                f.write(finalphylovinput)
-
-            with open(os.path.join(outputfolder, "results_statistics.tsv"), 'w') as f:
-                f.write(str(statswrite))
-
-            with open(os.path.join(outputfolder, "results_contigsInfo.tsv"), 'w') as f:
-                f.write(str(finalphylovinput2))
+            results_matrix.write_tsv(os.path.join(outputfolder, "results_alleles.tsv"),
+                                     genesHeader, allele_rows())
+            results_matrix.write_tsv(os.path.join(outputfolder, "results_statistics.tsv"),
+                                     statsHeader, statistics_rows())
+            results_matrix.write_tsv(os.path.join(outputfolder, "results_contigsInfo.tsv"),
+                                     genesHeader, contig_rows())
             if contained:
                 with open(os.path.join(outputfolder, "results_contained.txt"), 'w') as f:
-                    f.write(str(containedOutpWrite))
+                    for gene in lGenesFiles:
+                        containedAlleles = results_matrix.read_contained(basepath, gene)
+                        if len(containedAlleles) > 0:
+                            f.write(gene + "\n")
+                        for contained2 in containedAlleles:
+                            f.write(contained2[0] + "\t" + contained2[1] + "-->" + contained2[2] + "\n")
             with open(os.path.join(outputfolder, "logging_info.txt"), 'w') as f:
                 f.write('Started Script at: {0}'.format(start_date_str))
                 f.write("\nFinished Script at: " + time.strftime("%H:%M:%S-%d/%m/%Y"))
-                f.write("\nNumber of genomes: " + str(len(listOfGenomes)))
+                f.write("\nNumber of genomes: " + str(len(genomeNames)))
                 f.write("\nNumber of loci: " + str(len(lGenesFiles)))
                 f.write("\nUsed this number of CPU cores: " + str(cpuToUse))
                 f.write("\nUsed a bsr of: " + str(BSRTresh))
@@ -707,22 +898,24 @@ def main(genomeFiles, genes, cpuToUse, gOutFile, BSRTresh, BlastpPath, forceCont
             ParalogPrunning.main(os.path.join(outputfolder, "results_contigsInfo.tsv"), outputfolder)
 
         else:
-            for genome in listOfGenomesBasename:
+            rows = zip(allele_rows(), contig_rows(), statistics_rows())
+            for alleleRow, contigRow, statsRow in rows:
+                genome = alleleRow[0]
                 currentGenome = os.path.splitext(genome)[0]
                 perGenomeFolder = os.path.join(outputfolder, currentGenome)
                 os.makedirs(perGenomeFolder)
                 with open(os.path.join(perGenomeFolder, currentGenome + "_statistics.txt"), 'w') as f:
-                    f.write(statsHeader + "\n")
+                    f.write('\t'.join(statsHeader) + "\n")
                     f.write(genome)
-                    f.write(statsDict[genome])
+                    f.write('\t'.join(map(str, statsRow[1:])))
                 with open(os.path.join(perGenomeFolder, currentGenome + "_contigsInfo.txt"), 'w') as f:
-                    f.write(genesHeader + "\n")
+                    f.write('\t'.join(genesHeader) + "\n")
                     f.write(genome)
-                    f.write(contigDict[genome])
+                    f.write('\t'.join(contigRow[1:]))
                 with open(os.path.join(perGenomeFolder, currentGenome + "_alleles.txt"), 'w') as f:
-                    f.write(genesHeader + "\n")
+                    f.write('\t'.join(genesHeader) + "\n")
                     f.write(genome)
-                    f.write(allelesDict[genome])
+                    f.write('\t'.join(alleleRow[1:]))
 
     except Exception as e:
         exc_type, exc_obj, tb = sys.exc_info()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Purpose
+-------
+Compares the time needed to run and parse the BLAST searches of the
+allele call with the XML output (outfmt 5) and with the tabular
+output used by the allele call (see callAlleles_protein3.BLAST_OUTFMT).
+Both outputs are checked to produce the same hits.
+
+Usage example: compare both formats for the representatives of a locus
+BLASTed against the database with the CDSs of all genomes created in the
+temporary directory of an allele call.
+
+    python blast_output_benchmark.py -q locus_protein.fasta -db temp/all_genomes_db -r 5
+
+Code documentation
+------------------
+"""
+
+import sys
+import time
+import argparse
+from io import StringIO
+
+from Bio.Blast import NCBIXML
+from Bio.Blast.Applications import NcbiblastpCommandline
+
+try:
+    from allelecall import callAlleles_protein3
+except:
+    from CHEWBBACA.allelecall import callAlleles_protein3
+
+
+def xml_hits(out):
+    """ Gets the hits from BLAST XML output."""
+
+    hits = []
+    for blast_record in NCBIXML.parse(StringIO(out)):
+        for alignment in blast_record.alignments:
+            subject = (alignment.title.split(" "))[1]
+            for match in alignment.hsps:
+                hits.append((int(match.score), match.query_start,
+                             match.query_end, subject))
+
+    return hits
+
+
+def tabular_hits(out):
+    """ Gets the hits from the tabular output used in the allele call."""
+
+    return [(score, qstart, qend, sseqid)
+            for qseqid, score, qstart, qend, sstart, send, sseqid
+            in callAlleles_protein3.parse_tabular_hits(out)]
+
+
+def time_format(queries, database, blast_path, outfmt, parser, repeats):
+    """ Runs a BLAST search several times with a given output format.
+
+        Returns
+        -------
+        list
+            Total time spent running BLAST, total time spent
+            parsing its output and the hits of the last run.
+    """
+
+    blast_time = 0
+    parse_time = 0
+    for r in range(repeats):
+        start = time.time()
+        cline = NcbiblastpCommandline(cmd=blast_path, db=database,
+                                      evalue=0.001, outfmt=outfmt,
+                                      max_hsps=10, num_threads=1)
+        out, err = cline(stdin=queries)
+        blast_time += time.time() - start
+
+        start = time.time()
+        hits = parser(out)
+        parse_time += time.time() - start
+
+    return [blast_time, parse_time, hits]
+
+
+def main(query_file, database, blast_path, repeats):
+
+    with open(query_file, 'r') as infile:
+        queries = infile.read()
+
+    xml_blast, xml_parse, xml_results = time_format(queries, database,
+                                                    blast_path, 5, xml_hits,
+                                                    repeats)
+    tab_blast, tab_parse, tab_results = time_format(queries, database,
+                                                    blast_path,
+                                                    callAlleles_protein3.BLAST_OUTFMT,
+                                                    tabular_hits, repeats)
+
+    print('Format\tBLAST (s)\tParsing (s)\tHits')
+    print('XML\t{0:.3f}\t{1:.3f}\t{2}'.format(xml_blast/repeats,
+                                             xml_parse/repeats,
+                                             len(xml_results)))
+    print('tabular\t{0:.3f}\t{1:.3f}\t{2}'.format(tab_blast/repeats,
+                                                 tab_parse/repeats,
+                                                 len(tab_results)))
+
+    if sorted(xml_results) != sorted(tab_results):
+        sys.exit('Hits determined with both formats are different.')
+
+    print('Hits determined with both formats are identical.')
+
+
+def parse_arguments():
+
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument('-q', type=str, required=True, dest='query_file',
+                        help='FASTA file with the protein queries.')
+
+    parser.add_argument('-db', type=str, required=True, dest='database',
+                        help='Path to the protein BLAST database.')
+
+    parser.add_argument('--bp', type=str, required=False, default='blastp',
+                        dest='blast_path', help='Path to the blastp executable.')
+
+    parser.add_argument('-r', type=int, required=False, default=3,
+                        dest='repeats', help='Number of times each search is repeated.')
+
+    args = parser.parse_args()
+
+    return [args.query_file, args.database, args.blast_path, args.repeats]
+
+
+if __name__ == '__main__':
+
+    args = parse_arguments()
+    main(*args)
@@ -1,25 +1,44 @@
 #!/usr/bin/env python3
-from io import StringIO
 from Bio import SeqIO
 import sys
-from Bio.Seq import Seq
 from Bio.Blast.Applications import NcbiblastpCommandline
 from collections import Counter
 import os
-from Bio.Blast import NCBIXML
 try:
-    from utils import CommonFastaFunctions
+    from utils import schema_index
+    from utils import self_scores
+    from utils import cds_store
+    from utils import translation
+    from utils import results_matrix
+    from utils import call_journal
+    from utils import schema_writer
 except:
-    from CHEWBBACA.utils import CommonFastaFunctions
+    from CHEWBBACA.utils import schema_index
+    from CHEWBBACA.utils import self_scores
+    from CHEWBBACA.utils import cds_store
+    from CHEWBBACA.utils import translation
+    from CHEWBBACA.utils import results_matrix
+    from CHEWBBACA.utils import call_journal
+    from CHEWBBACA.utils import schema_writer
 import time
 import pickle
+import functools
 import shutil
 import warnings
 from Bio import BiopythonWarning
 warnings.simplefilter('ignore', BiopythonWarning)
 
+# basename of the BLAST database with the CDSs of all genomes
+GENOMES_DB = 'all_genomes'
+# tabular output used in the allele call, the subject title is
+# the last field because it is the only one that can have spaces
+BLAST_OUTFMT = '6 qseqid score qstart qend sstart send stitle'
+# maximum number of CDSs of each genome with hits of a representative,
+# the number of targets of the searches against single genome databases
+MAX_GENOME_TARGETS = 10
 
-def getBlastScoreRatios(genefile, basepath, doAll, verbose, blastPath):
+
+def getBlastScoreRatios(genefile, basepath, doAll, verbose, blastPath, analytic=False):
     if verbose:
         def verboseprint(*args):
             for arg in args:
@@ -28,80 +47,59 @@ def getBlastScoreRatios(genefile, basepath, doAll, verbose, blastPath):
     else:
         verboseprint = lambda *a: None  # do-nothing function
 
-    allelescores = []
-    alleleProt = ''
+    geneScorePickle = os.path.abspath(genefile) + '_bsr.txt'
+
+    # self-scores are written from the schema store before the allele call
+    var = {}
+    if not doAll:
+        with open(geneScorePickle, 'rb') as f:
+            var = pickle.load(f)
+        # needs to convert dictionaries that have integer keys
+        # to string keys
+        var = {str(k): v for k, v in var.items()}
+
     alleleAllProt = ''
     alleleList = []
     alleleI = 0
-    alleleIlist = []
     listAllelesNames = []
-    # calculate bsr for each allele
+    missingProts = {}
     for allele in SeqIO.parse(genefile, "fasta"):
+        alleleList.append(str(allele.seq.upper()))
+        listAllelesNames.append(allele.id)
+
+    # all the alleles of the locus are translated at once
+    translatedAlleles = translation.translate_sequences(alleleList, 11, ambiguous=True)
+    for alleleName, translated in zip(listAllelesNames, translatedAlleles):
 
         # usually first allele name is just > 1 and after that it has > gene_id_genome
-        aux = allele.id.split("_")
+        aux = alleleName.split("_")
         if len(aux) < 2:
             alleleI = str(aux[0])
         else:
             alleleI = str(aux[-1])
 
-        # try to translate the allele
-        alleleIlist.append(alleleI)
-        alleleList.append(str(allele.seq.upper()))
-        listAllelesNames.append(allele.id)
-
-        translatedSequence, x = translateSeq(str(allele.seq.upper()))
+        translatedSequence = translated[1]
 
         if translatedSequence == '':
             print("cannot translate allele on bsr calculation")
             pass
 
-        # calculate BSR for the allele
         else:
-            alleleProt = ">" + str(alleleI) + "\n" + str(translatedSequence + "\n")
             alleleAllProt += ">" + str(alleleI) + "\n" + str(translatedSequence + "\n")
-            proteinfastaPath = os.path.join(basepath, str(os.path.basename(genefile) + '_protein2.fasta'))
-
-            # new db for each allele to blast it against himself
-            Gene_Blast_DB_name = CommonFastaFunctions.Create_Blastdb_no_fasta(proteinfastaPath, 1, True, alleleProt)
-
-            # if bsr hasn't been calculated, do the BLAST
-            if doAll:
-
-                verboseprint("Starting Blast alleles at : " + time.strftime("%H:%M:%S-%d/%m/%Y"))
-
-                # --- get BLAST score ratio --- #
-                cline = NcbiblastpCommandline(cmd=blastPath, db=Gene_Blast_DB_name,
-                                              evalue=0.001, outfmt=5, num_threads=1)
-                out, err = cline(stdin=alleleProt)
-                psiblast_xml = StringIO(out)
-                blast_records = NCBIXML.parse(psiblast_xml)
-
-                allelescore = 0
-
-                verboseprint("Blasted alleles at : " + time.strftime("%H:%M:%S-%d/%m/%Y"))
-
-                for blast_record in blast_records:
-
-                    for alignment in blast_record.alignments:
-
-                        for match in alignment.hsps:
-                            allelescores.append(int(match.score))
-
-                geneScorePickle = os.path.abspath(genefile) + '_bsr.txt'
-                verboseprint("________")
-                var = dict(zip(alleleIlist, allelescores))
-                with open(geneScorePickle, 'wb') as f:
-                    pickle.dump(var, f)
-
-            # bsr had already been calculated, load it to memory
-            else:
-                geneScorePickle = os.path.abspath(genefile) + '_bsr.txt'
-                with open(geneScorePickle, 'rb') as f:
-                    var = pickle.load(f)
-                # needs to convert dictionaries that have integer keys
-                # to string keys
-                var = {str(k): v for k, v in var.items()}
+            if alleleI not in var:
+                missingProts[alleleI] = str(translatedSequence)
+
+    # calculate the self-score of the alleles that are not in the store
+    # from the scoring matrix or with a single BLAST search
+    if len(missingProts) > 0 and analytic:
+        var.update(self_scores.analytic_self_scores(missingProts))
+    elif len(missingProts) > 0:
+        verboseprint("Starting Blast alleles at : " + time.strftime("%H:%M:%S-%d/%m/%Y"))
+        var.update(self_scores.blast_self_scores(missingProts, blastPath, basepath,
+                                                 os.path.basename(genefile)))
+        verboseprint("Blasted alleles at : " + time.strftime("%H:%M:%S-%d/%m/%Y"))
+        with open(geneScorePickle, 'wb') as f:
+            pickle.dump(var, f)
 
     proteinfastaPath = os.path.join(basepath, str(os.path.basename(genefile) + '_protein.fasta'))
     with open(proteinfastaPath, "w") as f:
@@ -111,92 +109,128 @@ def getBlastScoreRatios(genefile, basepath, doAll, verbose, blastPath):
     return var, alleleList, listAllelesNames
 
 
-def reDogetBlastScoreRatios(sequence, basepath, alleleI, allelescores2, newGene_Blast_DB_name, alleleList2, picklepath,
-                            verbose, blastPath, listAllelesNames):
-    if verbose:
-        def verboseprint(*args):
-            for arg in args:
-                print(arg),
-            print
-    else:
-        verboseprint = lambda *a: None  # do-nothing function
-
-    alleleProt = ''
-
-    verboseprint("Starting Blast of new alleles to calculate BSR at : " + time.strftime("%H:%M:%S-%d/%m/%Y"))
-
-    cline = NcbiblastpCommandline(cmd=blastPath, db=newGene_Blast_DB_name, evalue=0.001, outfmt=5, num_threads=1)
-
-    out, err = cline(stdin=sequence)
-
-    allelescore = 0
-    psiblast_xml = StringIO(out)
-    blast_records = NCBIXML.parse(psiblast_xml)
+def genomes_db_path(temppath):
+    """ Path to the BLAST database with the translated CDSs of all genomes."""
 
-    verboseprint("Blasted alleles at : " + time.strftime("%H:%M:%S-%d/%m/%Y"))
+    return os.path.join(temppath, GENOMES_DB + "_db")
 
-    found = False
-    matchscore = 0
-    for blast_record in blast_records:
 
-        for alignment in blast_record.alignments:
+def locus_hits_path(temppath, geneFile):
+    """ Path to the file with the hits determined for a locus in the
+        genome-major mode."""
 
-            for match in alignment.hsps:
-                matchscore = int(match.score)
+    return os.path.join(temppath, os.path.basename(geneFile) + "_hits.txt")
 
-    allelescores2[alleleI] = matchscore
-    with open(picklepath, 'wb') as f:
-        pickle.dump(allelescores2, f)
 
-    return allelescores2, alleleList2, listAllelesNames
+def parse_tabular_hits(out):
+    """ Parses the tabular output of a BLAST search created with
+        BLAST_OUTFMT, one line at a time.
 
+        Args:
+            out (str): BLAST output.
 
-def reverseComplement(strDNA):
-    basecomplement = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A'}
-    strDNArevC = ''
-    for l in strDNA:
-        strDNArevC += basecomplement[l]
+        Yields:
+            Tuple with the query identifier, the raw score, the start
+            and end positions of the alignment in the query and in the
+            subject, and the identifier of the subject (first word of
+            the subject title).
+    """
 
-    return strDNArevC[::-1]
+    for line in out.splitlines():
+        if line == '':
+            continue
+        qseqid, score, qstart, qend, sstart, send, stitle = line.split('\t', 6)
+        yield (qseqid, int(score), int(qstart), int(qend),
+               int(sstart), int(send), stitle.split(' ', 1)[0])
+
+
+def genomes_db_count_path(genomesDB):
+    """ Path to the file with the number of CDSs in the database
+        with the translated CDSs of all genomes.
+    """
+
+    return genomesDB + "_count.txt"
+
+
+@functools.lru_cache(maxsize=None)
+def genomes_db_count(genomesDB):
+    """ Reads the number of CDSs in the database with the translated
+        CDSs of all genomes, written when the database is created.
+    """
+
+    with open(genomes_db_count_path(genomesDB), 'r') as infile:
+        return int(infile.read().strip())
+
+
+def blast_against_genomes(queries, genomesDB, blastPath, totalGenomes, queryOffset=0):
+    """ BLASTs a set of representative alleles against the database with
+        the translated CDSs of all genomes and splits the hits per genome.
+
+        Args:
+            queries (str): FASTA string with the representative proteins.
+            genomesDB (str): path to the BLAST database created with the
+            CDSs of all genomes. Subject identifiers are prefixed with the
+            index of the genome they belong to ('<index>|<cds id>').
+            blastPath (str): path to the blastp executable.
+            totalGenomes (int): number of genomes in the database.
+            The number of CDSs in the database is read from the file
+            written with the database (see genomes_db_count_path).
+            queryOffset (int): value added to the ordinal of each query to
+            get the index of the representative in the locus lists.
+
+        Returns:
+            genomeHits (dict): genome indexes as keys and lists of hits as
+            values. Each hit is a tuple with the ordinal of the query
+            (starting at 1), the CDS identifier, the raw score and the start
+            and end positions of the alignment in the query. Only the hits
+            against the best MAX_GENOME_TARGETS CDSs of each genome are kept
+            for each query, as in a search against a single genome.
+    """
+
+    # map query identifiers to their ordinal in the FASTA string
+    queryIds = [line[1:].split()[0] for line in queries.splitlines() if line.startswith('>')]
+    queryOrdinals = {queryId: i+1 for i, queryId in enumerate(queryIds)}
+
+    # an e-value threshold equivalent to the one used for single genome
+    # databases, targets are not limited in the search because a limit
+    # would apply to all genomes together, the targets of each genome
+    # are limited after parsing
+    cline = NcbiblastpCommandline(cmd=blastPath, db=genomesDB, evalue=0.001*totalGenomes,
+                                  outfmt=BLAST_OUTFMT, max_target_seqs=genomes_db_count(genomesDB),
+                                  max_hsps=10, num_threads=1)
+    out, err = cline(stdin=queries)
+
+    genomeHits = {}
+    # CDSs of each genome with hits of each query
+    targets = {}
+    for qseqid, score, qstart, qend, sstart, send, sseqid in parse_tabular_hits(out):
+        queryIndex = queryOrdinals[qseqid] + queryOffset
+        genomeIndex, cdsStrName = sseqid.split("|", 1)
+        genomeIndex = int(genomeIndex)
+        queryTargets = targets.setdefault((queryIndex, genomeIndex), set())
+        if cdsStrName not in queryTargets:
+            if len(queryTargets) == MAX_GENOME_TARGETS:
+                continue
+            queryTargets.add(cdsStrName)
+        genomeHits.setdefault(genomeIndex, []).append((queryIndex, cdsStrName, score,
+                                                       qstart, qend))
+
+    return genomeHits
 
 
 def translateSeq(DNASeq):
-    seq = DNASeq
-    reversedSeq = False
-    tableid = 11
-    try:
-        myseq = Seq(seq)
-        protseq = Seq.translate(myseq, table=tableid, cds=True)
-    except:
-        reversedSeq = True
-        try:
-            seq = reverseComplement(seq)
-            myseq = Seq(seq)
-            protseq = Seq.translate(myseq, table=tableid, cds=True)
-
-        except:
-            try:
-                seq = seq[::-1]
-                myseq = Seq(seq)
-                protseq = Seq.translate(myseq, table=tableid, cds=True)
-            except:
-                reversedSeq = False
-                try:
-                    seq = seq[::-1]
-                    seq = reverseComplement(seq)
-                    myseq = Seq(seq)
-                    protseq = Seq.translate(myseq, table=tableid, cds=True)
-                except Exception as e:
-                    print("translation error")
-                    print(e)
-                    protseq = ""
+    code, protseq, seq, orientation = translation.translate_cds(DNASeq, 11, ambiguous=True)
+    if code != translation.VALID:
+        print("translation error")
+        print("sequence is not translatable to a protein")
+
     return protseq, seq
 
 
 # ======================================================== #
 #            Allele calling and classification             #
 # ======================================================== #
-def main(input_file, temppath, blastPath, verbose, bsrTresh, sizeTresh, ns):
+def main(input_file, temppath, blastPath, verbose, bsrTresh, sizeTresh, ns, analyticScores=False):
 
     if verbose == 'True':
         verbose = True
@@ -235,8 +269,9 @@ def main(input_file, temppath, blastPath, verbose, bsrTresh, sizeTresh, ns):
     locusnumber = (newListgenes.index(str(geneFile)))
     totalocusnumber = len(newListgenes)
     basepath = os.path.join(temppath, os.path.splitext(geneFile)[0])
-    newDNAAlleles2Add2Fasta = ''
-    newDNAAlleles2Add2shortFasta = ''
+    # new alleles, committed to the schema after the allele call
+    newDNAAlleles2Add2Fasta = []
+    newDNAAlleles2Add2shortFasta = []
     proteinFastaString = ''
 
     print('\rProcessing ' + os.path.basename(geneFile) + ". Start " + time.strftime("%H:%M:%S-%d/%m/%Y") + " Locus " + str(
@@ -261,8 +296,8 @@ def main(input_file, temppath, blastPath, verbose, bsrTresh, sizeTresh, ns):
 
     resultsList = []
     i = 0
-    perfectMatchIdAllele = []
-    perfectMatchIdAllele2 = []
+    # calls of the locus in each genome, written to the results matrix
+    calls = results_matrix.empty_calls(len(genomesList))
     allelescores = {}
     listShortAllelesNames = []
 
@@ -274,11 +309,11 @@ def main(input_file, temppath, blastPath, verbose, bsrTresh, sizeTresh, ns):
 
     if os.path.isfile(geneScorePickle):
         allelescores, alleleList, listShortAllelesNames = getBlastScoreRatios(shortgeneFile, basepath, False, verbose,
-                                                                              blastPath)
+                                                                              blastPath, analyticScores)
 
     else:
         allelescores, alleleList, listShortAllelesNames = getBlastScoreRatios(shortgeneFile, basepath, True, verbose,
-                                                                              blastPath)
+                                                                              blastPath, analyticScores)
 
     with open(os.path.join(basepath, str(os.path.basename(shortgeneFile) + '_protein.fasta')), 'r') as myfile:
         proteinFastaString = myfile.read()
@@ -286,105 +321,159 @@ def main(input_file, temppath, blastPath, verbose, bsrTresh, sizeTresh, ns):
 
     verboseprint("Finished BSR at : " + time.strftime("%H:%M:%S-%d/%m/%Y"))
 
+    # hits of the representatives against the CDSs of all genomes
+    genomesDB = genomes_db_path(temppath)
+    genomeHits = None
+
+    # hits were already determined per genome in the genome-major mode
+    hitsFile = locus_hits_path(temppath, geneFile)
+    if os.path.isfile(hitsFile):
+        with open(hitsFile, 'rb') as f:
+            genomeHits = pickle.load(f)
+
+    # exact matches determined with the schema index
+    with open(schema_index.locus_exact_path(temppath, geneFile), 'rb') as f:
+        exactMatches, proteinMatches = pickle.load(f)
+    # hashes of the alleles, and their proteins, added during this run
+    newAllelesHashes = {}
+    newProteinsHashes = {}
+    # new representatives waiting for their self-score and hits
+    pendingReps = {}
+    newScores = False
+
+    # restore the calls and alleles of a worker that was interrupted,
+    # alleles keep their identifiers and are only added to the
+    # locus files if they were not written before the interruption
+    journalCalls, journalAlleles, journalContained = call_journal.read_journal(temppath, geneFile)
+    call_journal.restore_calls(calls, journalCalls)
+    resultsList.extend(journalContained)
+    schemaAlleles = set(fullAlleleNameList)
+    representatives = set(listShortAllelesNames)
+    for alleleName, isRepresentative, alleleStr, protSeq in journalAlleles:
+        alleleI = alleleName.split("_")[-1]
+        if alleleName not in schemaAlleles:
+            newDNAAlleles2Add2Fasta.append([alleleName, alleleStr])
+            fullAlleleList.append(alleleStr)
+            fullAlleleNameList.append('>' + alleleName)
+        newAllelesHashes[schema_index.sequence_hash(alleleStr)] = alleleName
+        newProteinsHashes[schema_index.sequence_hash(protSeq)] = alleleName
+        # representatives already in the short file were loaded with their self-score
+        if isRepresentative and alleleName not in representatives:
+            newDNAAlleles2Add2shortFasta.append([alleleName, alleleStr])
+            alleleList.append(alleleStr)
+            listShortAllelesNames.append('>' + alleleName)
+            pendingReps[alleleI] = protSeq
+    if len(journalCalls) > 0:
+        verboseprint("Resuming from the journal, {0} genomes already called".format(len(journalCalls)))
+
+    journal = call_journal.open_journal(temppath, geneFile)
+    journaledResults = len(resultsList)
+
+    def checkpoint(genomeIndex):
+        # writes the call of a genome and the records added while calling it
+        nonlocal journaledResults
+        for record in resultsList[journaledResults:]:
+            call_journal.add_contained(journal, record)
+        journaledResults = len(resultsList)
+        call_journal.add_call(journal, genomeIndex, calls)
+
     verboseprint("starting allele call blast at: " + time.strftime("%H:%M:%S-%d/%m/%Y"))
-    for genomeFile in genomesList:
+    for genomeIndex, genomeFile in enumerate(genomesList):
+        if genomeIndex in journalCalls:
+            continue
         verboseprint(genomeFile)
         bestmatch = [0, 0, False, '',
                      0]  # score, score ratio, perfectmatch, key name of the DNA sequence string, allele ID
-        currentGenomeDict = {}
-        currentCDSDict = {}
-
-        # load the CDS from the genome to a dictionary
-        filepath = os.path.join(temppath, str(os.path.basename(genomeFile)) + "_ORF_Protein.txt")
-
-        with open(filepath, 'rb') as f:
-            currentCDSDict = pickle.load(f)
-
-        try:
-            intersection = set(fullAlleleList).intersection(currentCDSDict.values())
-            intersection = list(intersection)
-            if len(intersection) > 1:
-                perfectMatchIdAllele.append('NIPHEM')
-                perfectMatchIdAllele2.append('NIPHEM')
-                verboseprint(os.path.basename(genomeFile) + " has " + str(
-                    len(intersection)) + " multiple exact match : " + os.path.basename(
-                    geneFile) + " MULTIPLE ALLELES as EXACT MATCH")
-                raise ValueError("MULTIPLE ALLELES as EXACT MATCH")
-
-            elif len(intersection) == 1:
-                alleleStr = intersection[0]
-                # it doenst return both keys with equal values
-                # ~ elem=currentCDSDict.keys()[currentCDSDict.values().index(alleleStr)]
-
-                elem = [key for key, value in currentCDSDict.items() if value == alleleStr]
-                if len(elem) > 1:
-                    perfectMatchIdAllele.append('NIPHEM')
-                    perfectMatchIdAllele2.append('NIPHEM')
-                    verboseprint(os.path.basename(genomeFile) + " has " + str(
-                        len(intersection)) + " multiple exact match : " + os.path.basename(
-                        geneFile) + " MULTIPLE ALLELES as EXACT MATCH")
-                    raise ValueError("MULTIPLE ALLELES as EXACT MATCH")
-
-                contigname = elem[0].split("&")
-                matchLocation = contigname[2]
-                # starting CDS base need to be +1
-                matchLocation = matchLocation.split("-")
-                matchLocation = [int(matchLocation[0]) + 1, int(matchLocation[1])]
-                contigname = (contigname[0]).replace(">", "")
-                alleleName = ''
-                alleleMatchid = 0
-
-                alleleName = fullAlleleNameList[fullAlleleList.index(alleleStr)]
-                alleleMatchid = (alleleName.split("_"))[-1]
-
-                try:
-                    containedInfo = (alleleName.split("_"))[1]
-                except:
-                    containedInfo = ''
-
-                perfectMatchIdAllele.append(alleleMatchid)
-
-                if matchLocation[0] > matchLocation[1]:
-                    perfectMatchIdAllele2.append(
-                        str(contigname) + "&" + str(matchLocation[0]) + "-" + str(matchLocation[1]) + "&" + "-")
-                else:
-
-                    perfectMatchIdAllele2.append(
-                        str(contigname) + "&" + str(matchLocation[0]) + "-" + str(matchLocation[1]) + "&" + "+")
 
-                # check if atributed allele is contained or contains
-                if containedInfo == "CD":
-                    resultsList.append([(os.path.basename(genomeFile)), str(alleleMatchid), containedInfo.rstrip()])
-                elif containedInfo == "CS":
-                    resultsList.append([(os.path.basename(genomeFile)), str(alleleMatchid), containedInfo.rstrip()])
-                else:
-                    pass
-
-                raise ValueError("EQUAL")
-        except Exception as e:
-            # ~ exc_type, exc_obj, exc_tb = sys.exc_info()
-            # ~ fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-            # ~ print(exc_tb.tb_lineno)
-            # ~ print e
+        # exact matches against the schema alleles were determined before
+        # the allele call, only need to check the alleles added in this run
+        genomeMatches = dict(exactMatches.get(genomeIndex, {}))
+        if len(newAllelesHashes) > 0:
+            with open(schema_index.genome_hashes_path(temppath, genomeFile), 'rb') as f:
+                genomeHashes = pickle.load(f)
+            for seqHash, newAlleleName in newAllelesHashes.items():
+                if seqHash in genomeHashes:
+                    genomeMatches[seqHash] = (genomeHashes[seqHash], newAlleleName)
+
+        # several alleles or several CDSs matching the same allele
+        if len(genomeMatches) > 1 or any(len(v[0]) > 1 for v in genomeMatches.values()):
+            results_matrix.set_call(calls, genomeIndex, results_matrix.NIPHEM)
+            verboseprint(os.path.basename(genomeFile) + " has " + str(
+                len(genomeMatches)) + " multiple exact match : " + os.path.basename(
+                geneFile) + " MULTIPLE ALLELES as EXACT MATCH")
+            checkpoint(genomeIndex)
             continue
 
-        else:
-            verboseprint("Blasting alleles on genome at : " + time.strftime("%H:%M:%S-%d/%m/%Y"))
-
-            blast_out_file = os.path.join(basepath, "blastdbs/" + os.path.basename(geneFile) + '_List.xml')
+        elif len(genomeMatches) == 1:
+            elem, alleleName = list(genomeMatches.values())[0]
 
-            Gene_Blast_DB_name = os.path.join(temppath, str(os.path.basename(genomeFile)) + "/" + str(
-                os.path.basename(genomeFile)) + "_db")
+            contigname = elem[0].split("&")
+            matchLocation = contigname[2]
+            # starting CDS base need to be +1
+            matchLocation = matchLocation.split("-")
+            matchLocation = [int(matchLocation[0]) + 1, int(matchLocation[1])]
+            contigname = (contigname[0]).replace(">", "")
 
-            cline = NcbiblastpCommandline(cmd=blastPath, db=Gene_Blast_DB_name, evalue=0.001,
-                                          outfmt=5, max_target_seqs=10, max_hsps=10, num_threads=1)
+            alleleMatchid = (alleleName.split("_"))[-1]
 
-            out, err = cline(stdin=proteinFastaString)
+            try:
+                containedInfo = (alleleName.split("_"))[1]
+            except:
+                containedInfo = ''
+
+            # CDSs in the reverse strand have start > end
+            contigIndex = results_matrix.contig_indexes(temppath, genomeFile)[contigname]
+            results_matrix.set_call(calls, genomeIndex, results_matrix.EXC, alleleMatchid,
+                                    contigIndex, matchLocation[0], matchLocation[1])
+
+            # check if atributed allele is contained or contains
+            if containedInfo == "CD":
+                resultsList.append([(os.path.basename(genomeFile)), str(alleleMatchid), containedInfo.rstrip()])
+            elif containedInfo == "CS":
+                resultsList.append([(os.path.basename(genomeFile)), str(alleleMatchid), containedInfo.rstrip()])
+            else:
+                pass
 
-            psiblast_xml = StringIO(out)
-            blast_records = NCBIXML.parse(psiblast_xml)
+            checkpoint(genomeIndex)
+            continue
 
-            verboseprint("Blasted alleles on genome at : " + time.strftime("%H:%M:%S-%d/%m/%Y"))
+        else:
+            # open the store with the CDSs of the genome
+            cdsStore = cds_store.open_store(temppath, genomeFile)
+
+            # CDSs that code for the same protein as an allele
+            genomeProteinMatches = dict(proteinMatches.get(genomeIndex, {}))
+            if len(newProteinsHashes) > 0:
+                with open(schema_index.genome_protein_hashes_path(temppath, genomeFile), 'rb') as f:
+                    genomeHashes = pickle.load(f)
+                for protHash, newAlleleName in newProteinsHashes.items():
+                    if protHash in genomeHashes:
+                        genomeProteinMatches[protHash] = (genomeHashes[protHash], newAlleleName)
+
+            # BLAST all representatives against all genomes only once
+            if genomeHits is None and len(genomeProteinMatches) == 0:
+                verboseprint("Blasting alleles on all genomes at : " + time.strftime("%H:%M:%S-%d/%m/%Y"))
+                genomeHits = blast_against_genomes(proteinFastaString, genomesDB, blastPath, len(genomesList))
+                verboseprint("Blasted alleles on all genomes at : " + time.strftime("%H:%M:%S-%d/%m/%Y"))
+
+            # compute the self-scores of the new representatives and add
+            # their hits in a single batch
+            if len(pendingReps) > 0 and len(genomeProteinMatches) == 0:
+                verboseprint("Re-calculating BSR at : " + time.strftime("%H:%M:%S-%d/%m/%Y"))
+                if analyticScores:
+                    allelescores.update(self_scores.analytic_self_scores(pendingReps))
+                else:
+                    allelescores.update(self_scores.blast_self_scores(pendingReps, blastPath, basepath,
+                                                                      os.path.basename(shortgeneFile)))
+                verboseprint("Done Re-calculating BSR at : " + time.strftime("%H:%M:%S-%d/%m/%Y"))
+
+                pendingQueries = ''.join('>{0}\n{1}\n'.format(k, v) for k, v in pendingReps.items())
+                newHits = blast_against_genomes(pendingQueries, genomesDB, blastPath, len(genomesList),
+                                                len(listShortAllelesNames) - len(pendingReps))
+                for k, v in newHits.items():
+                    genomeHits.setdefault(k, []).extend(v)
+                pendingReps = {}
+                newScores = True
 
             alleleSizes = []
             for allele in fullAlleleList:
@@ -402,44 +491,59 @@ def main(input_file, temppath, blastPath, verbose, bsrTresh, sizeTresh, ns):
 
             try:
 
-                # iterate through the blast results
-                for blast_record in blast_records:
+                # identical proteins do not need to be aligned, the BSR is 1
+                # and the alignment covers the whole CDS
+                if len(genomeProteinMatches) > 0:
+                    locationcontigs = [cdsid[1:] for cdsids, _ in genomeProteinMatches.values() for cdsid in cdsids]
+                    cdsStrName = locationcontigs[0]
+                    geneLen = len(cds_store.get_cds(cdsStore, cdsStrName))
+                    match = (0, cdsStrName, 0, 1, geneLen // 3 - 1)
+                    bestmatch = [1, 1.0, False, cdsStrName, 0, match, geneLen]
+                    verboseprint("Same protein as allele " + list(genomeProteinMatches.values())[0][1])
 
+                else:
                     locationcontigs = []
+                    previousQuery = None
 
-                    for alignment in blast_record.alignments:
+                    # iterate through the blast results for the current genome
+                    for match in genomeHits.get(genomeIndex, []):
 
-                        # select the best match
-                        for match in alignment.hsps:
+                        # the query will always be a representative allele
+                        # we get the index of the representative sequence
+                        alleleMatchid, cdsStrName, matchScore, queryStart, queryEnd = match
 
-                            # query id comes with query_id, not name of the allele
-                            # the query will always be a representative allele
-                            # we get the index of the representative sequence
-                            alleleMatchid = int((blast_record.query_id.split("_"))[-1])
+                        # hits are grouped by query, restart for each representative
+                        if alleleMatchid != previousQuery:
+                            locationcontigs = []
+                            previousQuery = alleleMatchid
 
-                            # query_id starts with 1 and we have to subtract 1 to get index 0
-                            # we get the identifier of the representative (including '*') with the int index
-                            alleleMatchid2 = (((listShortAllelesNames[alleleMatchid - 1]).split("_"))[-1])
+                        # query ordinal starts with 1 and we have to subtract 1 to get index 0
+                        # we get the identifier of the representative (including '*') with the int index
+                        alleleMatchid2 = (((listShortAllelesNames[alleleMatchid - 1]).split("_"))[-1])
 
-                            scoreRatio = float(match.score) / float(allelescores[alleleMatchid2])
+                        scoreRatio = float(matchScore) / float(allelescores[alleleMatchid2])
 
-                            cdsStrName = (alignment.title.split(" "))[1]
+                        AlleleDNAstr = alleleList[int(alleleMatchid) - 1]
+                        verboseprint("BSR : " + str(scoreRatio))
 
-                            AlleleDNAstr = alleleList[int(alleleMatchid) - 1]
-                            verboseprint("BSR : " + str(scoreRatio))
+                        if scoreRatio >= bsrTresh:
+                            locationcontigs.append(cdsStrName)
 
-                            if scoreRatio >= bsrTresh:
-                                locationcontigs.append(cdsStrName)
+                        # select the best match from BLAST results
+                        if scoreRatio == 1 and matchScore > bestmatch[0]:
+                            bestmatch = [matchScore, scoreRatio, False, cdsStrName, int(alleleMatchid), match,
+                                         len(AlleleDNAstr)]
 
-                            # select the best match from BLAST results
-                            if scoreRatio == 1 and match.score > bestmatch[0]:
-                                bestmatch = [match.score, scoreRatio, False, cdsStrName, int(alleleMatchid), match,
-                                             len(AlleleDNAstr)]
+                        elif (matchScore > bestmatch[0] and scoreRatio >= bsrTresh and scoreRatio > bestmatch[1] and bestmatch[2] is False):
+                            bestmatch = [matchScore, scoreRatio, False,
+                                         cdsStrName, int(alleleMatchid), match,
+                                         len(AlleleDNAstr)]
 
-                            elif (match.score > bestmatch[0] and scoreRatio >= bsrTresh and scoreRatio > bestmatch[1] and bestmatch[2] is False):
-                                bestmatch = [match.score, scoreRatio, False,
-                                             cdsStrName, int(alleleMatchid), match,
-                                             len(AlleleDNAstr)]
+                    # as with one BLAST record per representative, only the hits
+                    # of the last representative are used to find paralogs, even
+                    # if it has no hits in this genome
+                    if previousQuery != len(listShortAllelesNames):
+                        locationcontigs = []
 
                 verboseprint("Classifying the match at : " + time.strftime("%H:%M:%S-%d/%m/%Y"))
 
@@ -447,7 +551,7 @@ def main(input_file, temppath, blastPath, verbose, bsrTresh, sizeTresh, ns):
 
                 # check for ambiguious bases
                 if not bestmatch[0] == 0:
-                    alleleStr = currentCDSDict[">" + bestmatch[3]]
+                    alleleStr = cds_store.get_cds(cdsStore, bestmatch[3])
                     listFoundAmbiguities = []
                     listambiguousBases = ['K', 'M', 'R', 'Y', 'S', 'W', 'B', 'V', 'H', 'D', 'X', 'N', '-', '.']
                     listFoundAmbiguities = [e for e in listambiguousBases if e in alleleStr]
@@ -457,33 +561,24 @@ def main(input_file, temppath, blastPath, verbose, bsrTresh, sizeTresh, ns):
                     ###################
                     # LOCUS NOT FOUND #
                     ###################
+                    results_matrix.set_call(calls, genomeIndex, results_matrix.LNF)
                     if bestmatch[0] == 0:
-                        perfectMatchIdAllele.append('LNF')
-                        perfectMatchIdAllele2.append('LNF')
                         verboseprint("Locus not found, no matches \n")
                     else:
-
-                        perfectMatchIdAllele.append('LNF')
-                        perfectMatchIdAllele2.append('LNF')
                         verboseprint("Locus has strange base \n")
 
                 # if more than one BSR >0.6 in two different CDSs it's a Non Paralog Locus
                 elif len(list(set(locationcontigs))) > 1:
                     verboseprint("NIPH", "")
-                    perfectMatchIdAllele.append('NIPH')
-                    perfectMatchIdAllele2.append('NIPH')
+                    results_matrix.set_call(calls, genomeIndex, results_matrix.NIPH)
                     for elem in locationcontigs:
                         verboseprint(elem)
 
                 # if match with BSR >0.6 and not equal DNA sequences
                 else:
-                    # load the contig info of the genome to a dictionary
-                    for contig in SeqIO.parse(genomeFile, "fasta"):
-                        currentGenomeDict[contig.id] = len(str(contig.seq.upper()))
-
                     match = bestmatch[5]
                     geneLen = bestmatch[6]
-                    alleleStr = currentCDSDict[">" + bestmatch[3]]
+                    alleleStr = cds_store.get_cds(cdsStore, bestmatch[3])
                     contigname = bestmatch[3]
 
                     contigname = contigname.split("&")
@@ -492,24 +587,21 @@ def main(input_file, temppath, blastPath, verbose, bsrTresh, sizeTresh, ns):
                     matchLocation = [int(matchLocation[0]) + 1, matchLocation[1]]
                     contigname = contigname[0]
 
-                    bestMatchContigLen = currentGenomeDict[contigname]
+                    bestMatchContigLen = cds_store.contig_length(cdsStore, contigname)
 
                     protSeq, alleleStr = translateSeq(alleleStr)
                     # get extra space to the right and left between the allele and match and check if it's still inside the contig
 
-                    rightmatchAllele = geneLen - ((int(match.query_end) + 1) * 3)
-                    leftmatchAllele = ((int(match.query_start) - 1) * 3)
+                    rightmatchAllele = geneLen - ((int(match[4]) + 1) * 3)
+                    leftmatchAllele = ((int(match[3]) - 1) * 3)
 
-                    Reversed = False
-                    # ~ if Reversed swap left and right contig extra
-                    Reversed = False
+                    # if the match is in the reverse strand swap left and right contig extra
                     if int(matchLocation[1]) < int(matchLocation[0]):
                         rightmatchContig = bestMatchContigLen - int(matchLocation[0])
                         leftmatchContig = int(matchLocation[1])
                         aux = rightmatchAllele
                         rightmatchAllele = leftmatchAllele
                         leftmatchAllele = aux
-                        Reversed = True
 
                     else:
                         rightmatchContig = bestMatchContigLen - int(matchLocation[1])
@@ -522,24 +614,21 @@ def main(input_file, temppath, blastPath, verbose, bsrTresh, sizeTresh, ns):
                     # check if contig is smaller than the matched allele
                     if leftmatchContig < leftmatchAllele and rightmatchContig < rightmatchAllele:
 
-                        perfectMatchIdAllele.append('LOTSC')
-                        perfectMatchIdAllele2.append('LOTSC')
+                        results_matrix.set_call(calls, genomeIndex, results_matrix.LOTSC)
 
                         verboseprint(match, contigname, geneFile, leftmatchAllele, rightmatchAllele,
                                      "Locus is bigger than the contig \n")
 
                     elif leftmatchContig < leftmatchAllele:
 
-                        perfectMatchIdAllele.append('PLOT3')
-                        perfectMatchIdAllele2.append('PLOT3')
+                        results_matrix.set_call(calls, genomeIndex, results_matrix.PLOT3)
 
                         verboseprint(match, contigname, geneFile, leftmatchAllele, rightmatchAllele,
                                      "Locus is on the 3' tip of the contig \n")
 
                     elif rightmatchContig < rightmatchAllele:
 
-                        perfectMatchIdAllele.append('PLOT5')
-                        perfectMatchIdAllele2.append('PLOT5')
+                        results_matrix.set_call(calls, genomeIndex, results_matrix.PLOT5)
 
                         verboseprint(match, contigname, geneFile, leftmatchAllele, rightmatchAllele,
                                      "Locus is on the 5' tip of the contig \n")
@@ -548,15 +637,13 @@ def main(input_file, temppath, blastPath, verbose, bsrTresh, sizeTresh, ns):
 
                         verboseprint("Locus is larger than mode", moda, alleleStr)
 
-                        perfectMatchIdAllele.append('ALM')
-                        perfectMatchIdAllele2.append('ALM')
+                        results_matrix.set_call(calls, genomeIndex, results_matrix.ALM)
 
                     elif sizeTresh is not None and (float(len(alleleStr)) < moda - (moda * sizeTresh)):
 
                         verboseprint("Locus is smaller than mode", moda, alleleStr)
 
-                        perfectMatchIdAllele.append('ASM')
-                        perfectMatchIdAllele2.append('ASM')
+                        results_matrix.set_call(calls, genomeIndex, results_matrix.ASM)
 
                     else:
                         #######################
@@ -589,14 +676,10 @@ def main(input_file, temppath, blastPath, verbose, bsrTresh, sizeTresh, ns):
                         if not wasContained:
                             tagAux = 'INF'
 
-                            perfectMatchIdAllele.append(tagAux + "-" + str(alleleIaux))
-
-                            if not Reversed:
-                                perfectMatchIdAllele2.append(str(contigname) + "&" + str(matchLocation[0]) + "-" + str(
-                                    matchLocation[1]) + "&" + "+")
-                            else:
-                                perfectMatchIdAllele2.append(str(contigname) + "&" + str(matchLocation[0]) + "-" + str(
-                                    matchLocation[1]) + "&" + "-")
+                            # reversed CDSs have start > end
+                            contigIndex = results_matrix.contig_indexes(temppath, genomeFile)[contigname]
+                            results_matrix.set_call(calls, genomeIndex, results_matrix.INF, alleleIaux,
+                                                    contigIndex, int(matchLocation[0]), int(matchLocation[1]))
 
                             verboseprint(
                                 "New allele! Adding allele " + tagAux + str(alleleIaux) + " to the database\n")
@@ -607,67 +690,55 @@ def main(input_file, temppath, blastPath, verbose, bsrTresh, sizeTresh, ns):
                                                str(os.path.basename(genomeFile))).replace("_", "-") + "_" + time.strftime("%d/%m/%YT%H:%M:%S") + '_' + str(
                                 alleleIaux)
 
-                            newDNAAlleles2Add2Fasta += appendAllele + "\n" + alleleStr + '\n'
+                            newDNAAlleles2Add2Fasta.append([appendAllele[1:], alleleStr])
 
                             fullAlleleList.append(alleleStr)
                             fullAlleleNameList.append(appendAllele)
+                            newAllelesHashes[schema_index.sequence_hash(alleleStr)] = appendAllele[1:]
+                            newProteinsHashes[schema_index.sequence_hash(str(protSeq))] = appendAllele[1:]
 
-                            if float(bestmatch[1]) >= bsrTresh and float(bestmatch[1]) < bsrTresh + 0.1:
+                            isRepresentative = float(bestmatch[1]) >= bsrTresh and float(bestmatch[1]) < bsrTresh + 0.1
+                            call_journal.add_allele(journal, appendAllele[1:], alleleStr, str(protSeq),
+                                                    isRepresentative)
 
-                                newDNAAlleles2Add2shortFasta += appendAllele + "\n" + alleleStr + '\n'
+                            if isRepresentative:
 
-                                geneTransalatedPath2 = os.path.join(basepath, str(
-                                    os.path.basename(shortgeneFile) + '_protein2.fasta'))
-                                geneTransalatedPath = os.path.join(basepath, str(
-                                    os.path.basename(shortgeneFile) + '_protein.fasta'))
+                                newDNAAlleles2Add2shortFasta.append([appendAllele[1:], alleleStr])
 
                                 proteinFastaString += '>' + alleleIaux + '\n' + str(protSeq) + '\n'
 
-                                match = bestmatch[5]
-
-                                # --- remake blast DB and recalculate the BSR for the locus --- #
+                                # the locus queries are kept in memory, the self-score of the new
+                                # representative and its hits against the genomes are determined
+                                # when the next genome needs to be BLASTed
                                 alleleList.append(alleleStr)
                                 listShortAllelesNames.append(appendAllele)
-
-                                sequence_2_blast = '>' + alleleIaux + '\n' + str(protSeq)
-                                Gene_Blast_DB_name2 = CommonFastaFunctions.Create_Blastdb_no_fasta(geneTransalatedPath2, 1, True, sequence_2_blast)
-
-                                verboseprint("Re-calculating BSR at : " + time.strftime("%H:%M:%S-%d/%m/%Y"))
-                                allelescores, alleleList, listShortAllelesNames = reDogetBlastScoreRatios(sequence_2_blast,
-                                                                                                          basepath,
-                                                                                                          alleleIaux,
-                                                                                                          allelescores,
-                                                                                                          Gene_Blast_DB_name2,
-                                                                                                          alleleList,
-                                                                                                          geneScorePickle,
-                                                                                                          verbose,
-                                                                                                          blastPath,
-                                                                                                          listShortAllelesNames)
-                                verboseprint("Done Re-calculating BSR at : " + time.strftime("%H:%M:%S-%d/%m/%Y"))
+                                pendingReps[alleleIaux] = str(protSeq)
 
             except Exception as e:
                 print("some error occurred")
                 print(e)
                 print('Error on line {}'.format(sys.exc_info()[-1].tb_lineno))
-                perfectMatchIdAllele2.append("ERROR")
-                perfectMatchIdAllele.append("ERROR")
-
-    # add new alleles to the locus fasta file
-    if len(newDNAAlleles2Add2Fasta) > 5:
-        with open(geneFile, 'a') as fG:
-            fG.write(newDNAAlleles2Add2Fasta)
-    if len(newDNAAlleles2Add2shortFasta) > 5:
-        with open(shortgeneFile, 'a') as fG:
-            fG.write(newDNAAlleles2Add2shortFasta)
-
-    final = (resultsList, perfectMatchIdAllele)
+                results_matrix.set_call(calls, genomeIndex, results_matrix.ERROR)
+
+        checkpoint(genomeIndex)
+
+    # new alleles and self-scores are written to the write-ahead log of
+    # the locus, the main process commits them to the schema after the
+    # allele call. Self-scores of representatives that were never needed
+    # are computed from the schema store in the next run
+    schema_writer.stage_locus(temppath, geneFile,
+                              {geneFile: newDNAAlleles2Add2Fasta,
+                               shortgeneFile: newDNAAlleles2Add2shortFasta},
+                              [geneScorePickle, allelescores] if newScores else None)
+
     verboseprint("Finished allele calling at : " + time.strftime("%H:%M:%S-%d/%m/%Y"))
-    filepath = os.path.join(temppath, os.path.basename(geneFile) + "_result.txt")
-    filepath2 = os.path.join(temppath, os.path.basename(geneFile) + "_result2.txt")
-    with open(filepath, 'wb') as f:
-        pickle.dump(final, f)
-    with open(filepath2, 'wb') as f:
-        pickle.dump(perfectMatchIdAllele2, f)
+    if len(resultsList) > 0:
+        results_matrix.write_contained(temppath, geneFile, resultsList)
+    # the locus is only marked as done after all its calls are written,
+    # the journal is only needed until then
+    results_matrix.write_locus(temppath, geneFile, calls)
+    call_journal.close_journal(journal)
+    call_journal.remove_journal(temppath, geneFile)
     shutil.rmtree(basepath)
     return True
 
@@ -27,7 +27,7 @@ try:
     from utils import (TestGenomeQuality, profile_joiner,
                        uniprot_find, Extract_cgAlleles,
                        RemoveGenes, sqlite_functions as sq,
-                       auxiliary_functions as aux,
+                       auxiliary_functions as aux, incremental,
                        constants as cnst,
                        parameters_validation as pv)
 
@@ -44,7 +44,7 @@ except:
     from CHEWBBACA.utils import (TestGenomeQuality, profile_joiner,
                                  uniprot_find, Extract_cgAlleles,
                                  RemoveGenes, sqlite_functions as sq,
-                                 auxiliary_functions as aux,
+                                 auxiliary_functions as aux, incremental,
                                  constants as cnst,
                                  parameters_validation as pv)
 
@@ -144,6 +144,21 @@ def create_schema():
                         default='blastp', dest='blastp_path',
                         help='Path to the BLASTp executables.')
 
+    parser.add_argument('--pc', type=str, required=False, nargs='?',
+                        const=cnst.PREDICTION_CACHE, default=None,
+                        dest='prediction_cache',
+                        help='Store the genes predicted by Prodigal to be '
+                             'reused by later runs with the same genomes, '
+                             'training file and genetic code, in the given '
+                             'directory or in ' + cnst.PREDICTION_CACHE +
+                             '. The least recently used predictions are '
+                             'removed when the cache exceeds 10 GB.')
+
+    parser.add_argument('--no-pc', action='store_const', const=None,
+                        required=False, dest='prediction_cache',
+                        help='Do not read or store gene predictions in '
+                             'the prediction cache (default).')
+
     parser.add_argument('--CDS', required=False, action='store_true',
                         dest='cds_input',
                         help='Input is a FASTA file with one representative '
@@ -169,6 +184,7 @@ def create_schema():
     cpu_cores = args.cpu_cores
     blastp_path = args.blastp_path
     cds_input = args.cds_input
+    prediction_cache = args.prediction_cache
     verbose = args.verbose
 
     # check if ptf exists
@@ -186,7 +202,8 @@ def create_schema():
     PPanGen.main(input_files, cpu_cores, output_directory,
                  blast_score_ratio, blastp_path, minimum_length,
                  verbose, ptf_path, cds_input,
-                 translation_table, size_threshold)
+                 translation_table, size_threshold,
+                 prediction_cache)
 
     # copy training file to schema directory
     if ptf_path is not False:
@@ -335,6 +352,38 @@ def allele_call():
                              'are temporary files from a previous '
                              'process that was interrupted.')
 
+    parser.add_argument('--gm', action='store_true', required=False,
+                        dest='genome_major',
+                        help='BLAST each genome against a single database '
+                             'with the representatives of all loci instead '
+                             'of BLASTing each locus against all genomes. '
+                             'Faster when calling a small number of genomes '
+                             'with a large schema.')
+
+    parser.add_argument('--pc', type=str, required=False, nargs='?',
+                        const=cnst.PREDICTION_CACHE, default=None,
+                        dest='prediction_cache',
+                        help='Store the genes predicted by Prodigal to be '
+                             'reused by later runs with the same genomes, '
+                             'training file and genetic code, in the given '
+                             'directory or in ' + cnst.PREDICTION_CACHE +
+                             '. The least recently used predictions are '
+                             'removed when the cache exceeds 10 GB.')
+
+    parser.add_argument('--no-pc', action='store_const', const=None,
+                        required=False, dest='prediction_cache',
+                        help='Do not read or store gene predictions in '
+                             'the prediction cache (default).')
+
+    parser.add_argument('--incremental', type=str, required=False,
+                        default=None, dest='incremental',
+                        help='Path to a previous results folder, or to the '
+                             'profiles_database folder of the schema. Only '
+                             'genomes without a profile in the previous '
+                             'results are called. The rows of the new '
+                             'genomes are appended to the files of the '
+                             'previous results folder.')
+
     parser.add_argument('--db', required=False, action='store_false',
                         dest='store_profiles',
                         help='If the profiles in the output matrix '
@@ -368,6 +417,9 @@ def allele_call():
     store_profiles = args.store_profiles
     verbose = args.verbose
     minimum_length = args.minimum_length
+    genome_major = args.genome_major
+    prediction_cache = args.prediction_cache
+    incremental_results = args.incremental
 
     timeout = 30
 
@@ -514,6 +566,29 @@ def allele_call():
     schema_genes = aux.check_input_type(schema_directory, 'listGenes2Call.txt')
     genomes_files = aux.check_input_type(input_files, 'listGenomes2Call.txt')
 
+    # only call genomes that are not in the previous results
+    update_previous = False
+    if incremental_results is not None:
+        update_previous = incremental.database_file(incremental_results) is None
+        if update_previous and os.path.isfile(os.path.join(incremental_results,
+                                                           incremental.RESULTS_FILES[0])) is False:
+            sys.exit('\n{0} is not a results folder or a profiles '
+                     'database.'.format(incremental_results))
+        if update_previous and json_report:
+            sys.exit('\nResults can only be appended to the TSV files '
+                     'of a results folder, remove the --json option.')
+
+        with open(genomes_files, 'r') as infile:
+            genomes = [line.strip() for line in infile if line.strip()]
+        genomes = incremental.new_genomes(genomes, incremental_results)
+        print('{0} genomes are not in {1}.'.format(len(genomes), incremental_results))
+        if len(genomes) == 0:
+            sys.exit('Nothing to call.')
+
+        genomes_files = 'listGenomes2Call.txt'
+        with open(genomes_files, 'w') as outfile:
+            outfile.write('\n'.join(genomes) + '\n')
+
     # determine if schema was downloaded from the Chewie-NS
     ns_config = os.path.join(schema_directory, '.ns_config')
     ns = os.path.isfile(ns_config)
@@ -523,7 +598,15 @@ def allele_call():
                blastp_path, force_continue, json_report,
                verbose, force_reset, contained,
                ptf_path, cds_input, size_threshold,
-               translation_table, ns)
+               translation_table, ns, genome_major,
+               prediction_cache)
+
+    if update_previous:
+        new_results = incremental.latest_results(output_directory)
+        appended, altered = incremental.update_results(incremental_results, new_results,
+                                                       schema_directory)
+        print('\nAppended {0} profiles to {1} (updated identifiers '
+              'in {2} previous profiles).'.format(appended, incremental_results, altered))
 
     if store_profiles is True:
         # add profiles to SQLite database
@@ -3,20 +3,27 @@
 import os
 import time
 import pickle
+import heapq
 import shutil
 import argparse
+import contextlib
 import collections
 
 from Bio import SeqIO
-from Bio.Seq import Seq
+from Bio.Blast import NCBIXML
 from Bio.Blast.Applications import NcbiblastpCommandline
 
 try:
     from createschema import init_schema_4_bbaca
-    from utils import CommonFastaFunctions
+    from utils import CommonFastaFunctions, translation, kmer_index, task_runner
 except:
     from CHEWBBACA.createschema import init_schema_4_bbaca
-    from CHEWBBACA.utils import CommonFastaFunctions
+    from CHEWBBACA.utils import CommonFastaFunctions, translation, kmer_index, task_runner
+
+
+# maximum number of proteins aligned against each other in a single
+# BLAST, clusters of similar proteins are grouped up to this size
+BLAST_BATCH_SIZE = 1000
 
 
 def which(program):
@@ -38,51 +45,243 @@ def which(program):
     return "Not found"
 
 
-def reverseComplement(strDNA):
-    basecomplement = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A'}
-    strDNArevC = ''
-    for l in strDNA:
-        strDNArevC += basecomplement[l]
+def translateSeq(DNASeq, genename):
+    code, protseq, seq, orientation = translation.translate_cds(DNASeq, 11, ambiguous=True)
+    inverted = orientation in [translation.ANTISENSE, translation.REVSENSE]
 
-    return strDNArevC[::-1]
+    return protseq, seq, inverted
 
 
-def translateSeq(DNASeq, genename):
-    seq = DNASeq
-    tableid = 11
-    inverted = False
-
-    # look for ambiguous base
-    try:
-        reverseComplement(seq)
-    except:
-        protseq = ""
-
-    try:
-        myseq = Seq(seq)
-        protseq = Seq.translate(myseq, table=tableid, cds=True)
-    except:
+def select_genes(blast_records, geneDict, bsr):
+    """ Selects the genes that are kept in the schema from the results
+        of the BLAST of all proteins against all proteins. A gene is
+        removed if it has a match with a BSR above the threshold against
+        a larger gene.
+
+        Args:
+            blast_records (iter): BLAST records of all proteins.
+            geneDict (dict): DNA sequence of each gene.
+            bsr (float): BSR threshold.
+        Returns:
+            genesToKeep (set): identifiers of the genes that were kept.
+            toRemove (set): identifiers of the genes that were removed.
+            log (list): lines with the removed genes and the cause.
+    """
+
+    toRemove = set()
+    # number of times each gene was added to the genes to keep
+    # and not removed, the same gene can be added more than once
+    genesToKeep = collections.Counter()
+    log = ["removed\tcause\texplanation"]
+
+    def discard(gene):
+        # removes a gene once, failing if it is not kept
+        if genesToKeep[gene] < 1:
+            raise ValueError(gene)
+        genesToKeep[gene] -= 1
+        if genesToKeep[gene] == 0:
+            del genesToKeep[gene]
+
+    for blast_record in blast_records:
+
+        allelename = blast_record.query
+        allelename = allelename.split(" ")
+        allelename = allelename[0]
+        alleleLength = len(geneDict[allelename])
+
         try:
-            seq = reverseComplement(seq)
-            myseq = Seq(seq)
-            protseq = Seq.translate(myseq, table=tableid, cds=True)
-            inverted = True
-        except:
-            try:
-                seq = seq[::-1]
-                myseq = Seq(seq)
-                protseq = Seq.translate(myseq, table=tableid, cds=True)
-                inverted = True
-            except:
-                try:
-                    seq = seq[::-1]
-                    seq = reverseComplement(seq)
-                    myseq = Seq(seq)
-                    protseq = Seq.translate(myseq, table=tableid, cds=True)
-                    inverted = False
-                except Exception as e:
-                    protseq = ""
-    return protseq, seq, inverted
+            # if gene A is not on the toRemove set yet, add to genesToKeep
+            if str(blast_record.query) not in toRemove:
+                genesToKeep[blast_record.query] += 1
+
+                i = 0
+                # if first alignement is not against self, gene B is bigger than gene A and very simillar - remove gene A from genesToKeep and add gene B instead
+                if not str(blast_record.query) == str((blast_record.alignments[0]).hit_def):
+                    discard(str(blast_record.query))
+                    toRemove.add(str(blast_record.query))
+                    log.append(str(blast_record.query) + "\t" + str(
+                        (blast_record.alignments[0]).hit_def) + "\t" + "2 is first best match")
+
+                    # if gene B is not on the toRemove set, add to genesToKeep
+                    if str((blast_record.alignments[0]).hit_def) not in toRemove:
+                        genesToKeep[str((blast_record.alignments[0]).hit_def)] += 1
+
+                    raise Exception
+
+                selfblastscore = (((blast_record.alignments[0]).hsps)[0]).score
+
+                while i < len(blast_record.alignments):
+                    align = blast_record.alignments[i]
+
+                    match = (align.hsps)[0]
+                    scoreRatio = float(match.score) / float(selfblastscore)
+
+                    alleleLength2 = len(geneDict[str(align.hit_def)])
+
+                    # if good match and gene B not in toremove set
+                    if (scoreRatio > bsr and not str(align.hit_def) == str(blast_record.query) and str(
+                            align.hit_def) not in toRemove):
+
+                        # if gene B is bigger than gene A, keep bigger gene B
+                        if alleleLength2 > alleleLength:
+                            genesToKeep[str(align.hit_def)] += 1
+                            discard(str(blast_record.query))
+                            toRemove.add(str(blast_record.query))
+                            log.append(str(blast_record.query) + "\t" + str(
+                                align.hit_def) + "\t" + "2 is bigger and bsr >" + str(bsr))
+
+                            raise Exception
+                        # else add gene B to toremove set
+                        elif str(align.hit_def) in genesToKeep:
+                            discard(str(align.hit_def))
+                            toRemove.add(str(align.hit_def))
+                            log.append(str(align.hit_def) + "\t" + str(
+                                blast_record.query) + "\t" + "2 is bigger and bsr >" + str(bsr))
+
+                    i += 1
+
+            # else gene A is on toRemove set, add all similar genes (not in genesToKeep) to the toRemove set
+            else:
+
+                i = 0
+                selfblastscore = 0
+                for align in blast_record.alignments:
+                    if not (str(align.hit_def) == str(blast_record.query)):
+                        selfblastscore = ((align.hsps)[0]).score
+                        raise Exception
+
+                while i < len(blast_record.alignments):
+                    align = blast_record.alignments[i]
+                    match = (align.hsps)[0]
+                    scoreRatio = float(match.score) / float(selfblastscore)
+
+                    if align.hit_def not in genesToKeep and not str(align.hit_def) == str(
+                            blast_record.query) and scoreRatio > bsr:
+                        toRemove.add(align.hit_def)
+                        log.append(str(align.hit_def) + "\t" + str(
+                            blast_record.query) + "\t" + "2 was on the removed list and bsr >" + str(bsr))
+
+                    i += 1
+
+        except Exception as e:
+            pass
+
+    return set(genesToKeep), toRemove, log
+
+
+def blast_batches(clusters, batchSize):
+    """ Groups clusters of similar proteins in batches that are
+        BLASTed separately. Clusters are not split, a cluster
+        larger than the batch size is BLASTed alone.
+
+        Args:
+            clusters (list): lists with the indexes of the proteins
+                in each cluster.
+            batchSize (int): maximum number of proteins per batch.
+        Returns:
+            batches (list): lists with the indexes of the proteins in
+                each batch, in increasing order.
+    """
+
+    batches = []
+    batch = []
+    for cluster in clusters:
+        if len(batch) > 0 and len(batch) + len(cluster) > batchSize:
+            batches.append(sorted(batch))
+            batch = []
+        batch.extend(cluster)
+
+    if len(batch) > 0:
+        batches.append(sorted(batch))
+
+    return batches
+
+
+def blast_batch(batchFile, BlastpPath, dbsize):
+    """ BLASTs the proteins in a file against themselves.
+
+        Args:
+            batchFile (str): path to the FASTA file with the proteins.
+            BlastpPath (str): path to the blastp executable.
+            dbsize (int): total length of all proteins, so that
+                e-values are the same as if the proteins were
+                BLASTed against all proteins.
+        Returns:
+            blast_out_file (str): path to the BLAST output (XML).
+    """
+
+    Batch_Blast_DB_name = CommonFastaFunctions.Create_Blastdb(batchFile, 1, True)
+    blast_out_file = os.path.splitext(batchFile)[0] + '.xml'
+    cline = NcbiblastpCommandline(cmd=BlastpPath, query=batchFile, db=Batch_Blast_DB_name, evalue=0.001,
+                                  out=blast_out_file, outfmt=5, num_threads=1, dbsize=dbsize)
+    os.system(str(cline))
+
+    return blast_out_file
+
+
+def merged_records(blastFiles, queryOrder):
+    """ Reads the BLAST records of several BLAST outputs, in the
+        order of the queries in the proteins file.
+
+        Args:
+            blastFiles (list): paths to the BLAST outputs (XML), with
+                queries in the order of the proteins file.
+            queryOrder (dict): position of each query in the proteins
+                file.
+        Returns:
+            generator of the BLAST records.
+    """
+
+    with contextlib.ExitStack() as stack:
+        parsers = [NCBIXML.parse(stack.enter_context(open(blastFile))) for blastFile in blastFiles]
+        for blast_record in heapq.merge(*parsers, key=lambda record: queryOrder[record.query]):
+            yield blast_record
+
+
+def cluster_blast(proteinfile, clustersDir, BlastpPath, cpuToUse):
+    """ BLASTs the proteins in a file only against the proteins that
+        share enough minimizers to be in the same cluster, instead of
+        BLASTing all proteins against all proteins.
+
+        Args:
+            proteinfile (str): path to the FASTA file with the proteins.
+            clustersDir (str): directory for the BLAST inputs and outputs.
+            BlastpPath (str): path to the blastp executable.
+            cpuToUse (int): number of BLAST processes.
+        Returns:
+            blast_records (generator): BLAST records of the proteins
+                in clusters with more than one protein, in the order
+                of the proteins file.
+            singletons (list): identifiers of the proteins that are
+                not similar to any other protein.
+    """
+
+    proteins = [(record.description, str(record.seq)) for record in SeqIO.parse(proteinfile, "fasta")]
+    clusters = kmer_index.similar_clusters([protein for protname, protein in proteins])
+
+    singletons = [proteins[cluster[0]][0] for cluster in clusters if len(cluster) == 1]
+    batches = blast_batches([cluster for cluster in clusters if len(cluster) > 1], BLAST_BATCH_SIZE)
+
+    if not os.path.exists(clustersDir):
+        os.makedirs(clustersDir)
+
+    dbsize = sum(len(protein) for protname, protein in proteins)
+    tasks = []
+    for i, batch in enumerate(batches):
+        batchFile = os.path.join(clustersDir, 'batch{0}.fasta'.format(i))
+        with open(batchFile, "w") as f:
+            f.write(''.join('>{0}\n{1}\n'.format(*proteins[j]) for j in batch))
+        tasks.append((batchFile, BlastpPath, dbsize))
+
+    processes = int(cpuToUse) if cpuToUse else 1
+    if processes > 1:
+        blastFiles = task_runner.run_tasks(blast_batch, tasks, processes)
+    else:
+        blastFiles = [blast_batch(*task) for task in tasks]
+
+    queryOrder = {protname: i for i, (protname, protein) in enumerate(proteins)}
+
+    return merged_records(blastFiles, queryOrder), singletons
 
 
 def main(genes, sizethresh, cpuToUse, proteinFIlePath, outputFIlePath,
@@ -106,7 +305,7 @@ def main(genes, sizethresh, cpuToUse, proteinFIlePath, outputFIlePath,
     geneDict = {}
     protDict = {}
     orderedprotDict = collections.OrderedDict()
-    alreadyIn = []
+    alreadyIn = set()
     totalgenes = 0
     repeatedgenes = 0
     smallgenes = 0
@@ -130,7 +329,7 @@ def main(genes, sizethresh, cpuToUse, proteinFIlePath, outputFIlePath,
                         smallgenes += 1
 
                     else:
-                        alreadyIn.append(str(protseq))
+                        alreadyIn.add(str(protseq))
                         protname = ">" + str(gene.id) + "\n"
 
                         f.write(protname + str(protseq) + "\n")
@@ -163,27 +362,19 @@ def main(genes, sizethresh, cpuToUse, proteinFIlePath, outputFIlePath,
 
         auxDict = {}
         g = 0
-        j = 0
 
         verboseprint("Checking if protein sequences are contained in others...")
 
-        # for each gene from all the annotated genes - starting with an empty dictionary, only add a new gene if the "to be added gene" is not contained or equal to a gene already added to the dictionary
-        auxprot = []
+        # for each gene from all the annotated genes, ordered by length, only keep the gene if it is not contained or equal to a gene that was kept
+        orderedprotList = list(orderedprotDict.items())
+        containers = kmer_index.find_contained([str(prot) for protname, prot in orderedprotList])
 
-        for elem in orderedprotDict.items():
-
-            contained = False
-
-            prot = str(elem[1])
-            if any(prot in x for x in auxprot):
+        for (protname, prot), container in zip(orderedprotList, containers):
+            if container is not None:
                 g += 1
-                contained = True
-
             else:
-                auxDict[elem[1]] = elem[0]
-                auxprot.append(str(elem[1]))
+                auxDict[prot] = protname
 
-            j += 1
         verboseprint(str(g)+" loci are contained in other genes\n")
 
         # overwrite the original file, obtaining a new file with unique genes
@@ -207,115 +398,15 @@ def main(genes, sizethresh, cpuToUse, proteinFIlePath, outputFIlePath,
     verboseprint("Starting Blast")
 
     geneFile = os.path.abspath(proteinfile)
-    Gene_Blast_DB_name = CommonFastaFunctions.Create_Blastdb(geneFile, 1, True)
-
-    geneF = os.path.splitext(geneFile)[0]
-    blast_out_file = geneF + '.xml'
+    clustersDir = os.path.join(os.path.dirname(geneFile), 'blast_clusters')
     # ------------------------------ RUNNING BLAST ------------------------------ #
-    if cpuToUse:
-        cline = NcbiblastpCommandline(cmd=BlastpPath, query=geneFile, db=Gene_Blast_DB_name, evalue=0.001,
-                                      out=blast_out_file, outfmt=5, num_threads=int(cpuToUse))
-    else:
-        cline = NcbiblastpCommandline(cmd=BlastpPath, query=geneFile, db=Gene_Blast_DB_name, evalue=0.001,
-                                      out=blast_out_file, outfmt=5, num_threads=1)
-    blast_records = CommonFastaFunctions.runBlastParser(cline, blast_out_file)
-    verboseprint("Finished blast")
-
-    toRemove = []
-    genesToKeep = []
-    log = ["removed\tcause\texplanation"]
-    for blast_record in blast_records:
-
-        allelename = blast_record.query
-        allelename = allelename.split(" ")
-        allelename = allelename[0]
-        alleleLength = len(geneDict[allelename])
-
-        try:
-            # if gene A is not on the toRemove list yet, add to genesToKeep list
-            if str(blast_record.query) not in toRemove:
-                genesToKeep.append(blast_record.query)
-
-                i = 0
-                # if first alignement is not against self, gene B is bigger than gene A and very simillar - remove gene A from genesToKeep and add gene B instead
-                if not str(blast_record.query) == str((blast_record.alignments[0]).hit_def):
-                    genesToKeep.remove(str(blast_record.query))
-                    toRemove.append(str(blast_record.query))
-                    log.append(str(blast_record.query) + "\t" + str(
-                        (blast_record.alignments[0]).hit_def) + "\t" + "2 is first best match")
-
-                    # if gene B is not on the toRemove list, add to genesToKeep list
-                    if str((blast_record.alignments[0]).hit_def) not in toRemove:
-                        genesToKeep.append(str((blast_record.alignments[0]).hit_def))
-
-                    raise Exception
-
-                selfblastscore = (((blast_record.alignments[0]).hsps)[0]).score
-
-                while i < len(blast_record.alignments):
-                    align = blast_record.alignments[i]
-
-                    match = (align.hsps)[0]
-                    scoreRatio = float(match.score) / float(selfblastscore)
-
-                    alleleLength2 = len(geneDict[str(align.hit_def)])
-
-                    # if good match and gene B not in toremove list
-                    if (scoreRatio > bsr and not str(align.hit_def) == str(blast_record.query) and str(
-                            align.hit_def) not in toRemove):
+    blast_records, singletons = cluster_blast(geneFile, clustersDir, BlastpPath, cpuToUse)
+    verboseprint(str(len(singletons)) + " proteins are not similar to other proteins")
 
-                        # if gene B is bigger than gene A, keep bigger gene B
-                        if alleleLength2 > alleleLength:
-                            genesToKeep.append(str(align.hit_def))
-                            genesToKeep.remove(str(blast_record.query))
-                            toRemove.append(str(blast_record.query))
-                            log.append(str(blast_record.query) + "\t" + str(
-                                align.hit_def) + "\t" + "2 is bigger and bsr >" + str(bsr))
-
-                            raise Exception
-                        # else add gene B to toremove list
-                        elif str(align.hit_def) in genesToKeep:
-                            genesToKeep.remove(str(align.hit_def))
-                            toRemove.append(str(align.hit_def))
-                            log.append(str(align.hit_def) + "\t" + str(
-                                blast_record.query) + "\t" + "2 is bigger and bsr >" + str(bsr))
-
-                    i += 1
-
-            # else gene A is on toRemove list, add all similar genes (not in genesToKeep) list to the toRemove list
-            else:
-
-                i = 0
-                selfblastscore = 0
-                for align in blast_record.alignments:
-                    if not (str(align.hit_def) == str(blast_record.query)):
-                        selfblastscore = ((align.hsps)[0]).score
-                        # print "gene "+str(align.hit_def)+" is larger than gene "+str(blast_record.query)
-                        raise Exception
-
-                while i < len(blast_record.alignments):
-                    align = blast_record.alignments[i]
-                    match = (align.hsps)[0]
-                    scoreRatio = float(match.score) / float(selfblastscore)
-
-                    if align.hit_def not in genesToKeep and not str(align.hit_def) == str(
-                            blast_record.query) and scoreRatio > bsr:
-                        toRemove.append(align.hit_def)
-                        log.append(str(align.hit_def) + "\t" + str(
-                            blast_record.query) + "\t" + "2 was on the removed list and bsr >" + str(bsr))
-                    else:
-                        pass
-
-                    i += 1
-
-        except Exception as e:
-            # print e
-            pass
-
-    genesToKeep = list(set(genesToKeep))
-    toRemove = list(set(toRemove))
-    s = set(toRemove)
-    notcommonToKeep = [x for x in genesToKeep if x not in s]
+    genesToKeep, toRemove, log = select_genes(blast_records, geneDict, bsr)
+    verboseprint("Finished blast")
+    # proteins without similar proteins are only aligned against themselves
+    genesToKeep.update(singletons)
 
     pathfiles = os.path.dirname(geneFile)
     pathfiles = pathfiles + "/"
@@ -373,6 +464,8 @@ def main(genes, sizethresh, cpuToUse, proteinFIlePath, outputFIlePath,
         with open(outputFIlePath, "w") as f:
             f.write(concatenatedFile)
     elif not proteinFIlePath and outputFIlePath:
+        # new loci have a single allele, that is the representative, and
+        # the self-scores are computed for all loci by the allele call
         init_schema_4_bbaca.get_Short(listfiles)
         verboseprint("\nRemoved "+str(removedparalogs)+" with a high similarity (BSR>"+str(bsr)+")")
         print("\nCreated schema with "+str(rest)+" loci.")
@@ -385,9 +478,7 @@ def main(genes, sizethresh, cpuToUse, proteinFIlePath, outputFIlePath,
         print("\nCreated schema with "+str(rest)+" loci.")
         os.remove(proteinfile)
 
-    shutil.rmtree(os.path.join(pathfiles, 'blastdbs'))
-
-    os.remove(blast_out_file)
+    shutil.rmtree(clustersDir)
 
 
 if __name__ == "__main__":
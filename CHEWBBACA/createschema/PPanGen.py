@@ -10,14 +10,14 @@ import datetime as dt
 import multiprocessing
 
 from Bio import SeqIO
-from Bio.Seq import Seq
+from Bio.Blast.Applications import NcbiblastpCommandline
 
 try:
     from createschema import CreateSchema
-    from utils import runProdigal
+    from utils import runProdigal, translation, task_runner, kmer_index, CommonFastaFunctions, prediction_cache
 except:
     from CHEWBBACA.createschema import CreateSchema
-    from CHEWBBACA.utils import runProdigal
+    from CHEWBBACA.utils import runProdigal, translation, task_runner, kmer_index, CommonFastaFunctions, prediction_cache
 
 
 def which(program):
@@ -40,271 +40,269 @@ def which(program):
     return "Not found"
 
 
-def checkGeneStrings(genome1, genome2, newName, basepath, cpu, blastp,
-                     createSchemaPath, verbose, bsr):
+# proteins shorter than this are not added to the pan-genome
+MIN_PROTEIN_LENGTH = 67
+
+
+def genome_cds(genomeFile, basepath):
+    """ Reads the CDSs predicted by Prodigal for a genome.
+
+        Args:
+            genomeFile (str): path to the genome FASTA file.
+            basepath (str): directory with the Prodigal results.
+        Yields:
+            Tuple with the contig identifier, the start and end
+            positions and the DNA sequence of each CDS.
+    """
+
+    currentGenomeDict = {}
+    for contig in SeqIO.parse(genomeFile, "fasta"):
+        currentGenomeDict[contig.id] = str(contig.seq.upper())
+
+    filepath = os.path.join(basepath, '{0}_ORF.txt'.format(os.path.basename(genomeFile)))
+    with open(filepath, 'rb') as f:
+        currentCDSDict = pickle.load(f)
+
+    for contigTag, value in currentCDSDict.items():
+        for protein in value:
+            yield (contigTag, protein[0], protein[1],
+                   currentGenomeDict[contigTag][protein[0]:protein[1]])
+
+
+def new_pangenome():
+    """ Creates an empty pan-genome, a dictionary with:
+
+        - 'dna', 'proteins' and 'names': DNA sequence, protein and
+          name of each protein that was added (identified by the
+          protein number).
+        - 'kept': proteins that are in the pan-genome.
+        - 'hashes': all proteins that were seen, to discard equal
+          proteins in the next genomes.
+        - 'containment' and 'seeds': minimizer indexes used to find
+          proteins that contain or are contained in the new proteins.
+        - 'clusters' and 'sizes': minimizers used to find the proteins
+          that are similar to the new proteins, and their number.
+        - 'protid': number of the last CDS.
+    """
+
+    return {'dna': {}, 'proteins': {}, 'names': {}, 'kept': set(),
+            'hashes': set(), 'containment': {}, 'seeds': {},
+            'clusters': {}, 'sizes': {}, 'protid': 0}
+
+
+def remove_protein(pangenome, protid):
+    """ Removes a protein from the pan-genome. The protein is only
+        removed from the index of similar proteins, the containment
+        indexes are only searched for proteins that are kept.
+    """
+
+    pangenome['kept'].discard(protid)
+    for code in kmer_index.minimizers_set(pangenome['proteins'][protid]):
+        pangenome['clusters'][code].discard(protid)
+
+
+def blast_new_proteins(pangenome, newProteins, pathForTemp, BlastpPath, cpu):
+    """ BLASTs the new proteins of a genome against the other new
+        proteins and the proteins of the pan-genome that share
+        enough minimizers with them.
+
+        Args:
+            pangenome (dict): pan-genome created with new_pangenome.
+            newProteins (list): numbers of the new proteins, that
+                are already in the pan-genome.
+            pathForTemp (str): directory for the BLAST files.
+            BlastpPath (str): path to the blastp executable.
+            cpu (int): number of BLAST threads.
+        Returns:
+            hits (dict): number of each new protein that has similar
+                proteins as keys and lists with the number and raw score
+                of the proteins it aligned with, including itself, as
+                values. New proteins without similar proteins are not
+                BLASTed.
+    """
+
+    queries = []
+    subjects = set()
+    for protid in newProteins:
+        codes = kmer_index.minimizers_set(pangenome['proteins'][protid])
+        similar = kmer_index.similar_proteins(pangenome['clusters'], codes, pangenome['sizes'])
+        similar = [j for j in similar if j != protid]
+        if len(similar) > 0:
+            queries.append(protid)
+            subjects.add(protid)
+            subjects.update(similar)
+
+    if len(queries) == 0:
+        return {}
+
+    queryFile = os.path.join(pathForTemp, 'new_proteins.fasta')
+    with open(queryFile, 'w') as f:
+        f.write(''.join('>p{0}\n{1}\n'.format(protid, pangenome['proteins'][protid]) for protid in queries))
+    subjectFile = os.path.join(pathForTemp, 'candidates.fasta')
+    with open(subjectFile, 'w') as f:
+        f.write(''.join('>p{0}\n{1}\n'.format(protid, pangenome['proteins'][protid])
+                        for protid in sorted(subjects)))
+
+    # e-values as if the proteins were BLASTed against the whole pan-genome
+    dbsize = sum(len(pangenome['proteins'][protid]) for protid in pangenome['kept'])
+    subjectDB = CommonFastaFunctions.Create_Blastdb(subjectFile, 1, True)
+    cline = NcbiblastpCommandline(cmd=BlastpPath, query=queryFile, db=subjectDB, evalue=0.001,
+                                  outfmt='6 qseqid score stitle', max_hsps=1, num_threads=cpu,
+                                  dbsize=dbsize, max_target_seqs=len(subjects))
+    out, err = cline()
+
+    hits = {}
+    for line in out.splitlines():
+        if line == '':
+            continue
+        qseqid, score, stitle = line.split('\t', 2)
+        hits.setdefault(int(qseqid[1:]), []).append((int(stitle.split(' ', 1)[0][1:]), int(score)))
+
+    shutil.rmtree(os.path.join(pathForTemp, 'blastdbs'))
+
+    return hits
+
+
+def add_genome(pangenome, genomeFile, basepath, BlastpPath, bsr, cpu, verbose):
+    """ Adds the CDSs of a genome to a pan-genome. Proteins that are
+        equal to a protein that was seen before are discarded first.
+        The remaining proteins are discarded if they are contained in
+        a protein of the pan-genome and remove the proteins of the
+        pan-genome that they contain. The new proteins are only BLASTed
+        against the proteins that share minimizers with them and, for
+        each pair of proteins with a BSR above the threshold, the
+        protein with the shorter CDS is removed.
+
+        Args:
+            pangenome (dict): pan-genome created with new_pangenome.
+            genomeFile (str): path to the genome FASTA file.
+            basepath (str): directory with the Prodigal results.
+            BlastpPath (str): path to the blastp executable.
+            bsr (float): BSR threshold.
+            cpu (int): number of BLAST threads.
+            verbose (bool): print the number of proteins discarded
+                in each step.
+        Returns:
+            tsvProtidGenome (str): lines with the genome, contig,
+                positions and number of each CDS.
+    """
 
     if verbose:
         def verboseprint(*args):
             for arg in args:
                 print(arg, end="")
-            print
+            print()
     else:
         verboseprint = lambda *a: None  # do-nothing function
 
-    pathForTemp = os.path.join(basepath, newName)
+    genomename = (os.path.basename(genomeFile)).split(".")[0]
+
+    newProteins = []
+    tsvProtidGenome = ""
+    proteinsEqual = 0
+    smallProteins = 0
+    for contigTag, start, stop, seq in genome_cds(genomeFile, basepath):
+        pangenome['protid'] += 1
+        protid = pangenome['protid']
+        tsvProtidGenome += "\n" + '\t'.join([genomename, contigTag, str(start), str(stop), str(protid)])
+
+        try:
+            protseq, orderedSeq = translateSeq(seq)
+        except ValueError:
+            continue
+
+        protseq = str(protseq)
+        if len(protseq) < MIN_PROTEIN_LENGTH:
+            smallProteins += 1
+        elif protseq in pangenome['hashes']:
+            proteinsEqual += 1
+        else:
+            pangenome['hashes'].add(protseq)
+            pangenome['proteins'][protid] = protseq
+            pangenome['dna'][protid] = str(orderedSeq)
+            pangenome['names'][protid] = str(genomename) + "|protein" + str(protid)
+            newProteins.append(protid)
+
+    # check if any protein is substring of a larger, mantaining the larger one
+    contained = 0
+    keptProteins = []
+    for protid in sorted(newProteins, key=lambda protid: -len(pangenome['proteins'][protid])):
+        protseq = pangenome['proteins'][protid]
+        seed = kmer_index.first_minimizer(protseq)
+        if kmer_index.contained_in(pangenome['containment'], pangenome['proteins'], protseq,
+                                   seed, pangenome['kept']) is not None:
+            contained += 1
+            continue
+
+        for containedProtid in kmer_index.containing(pangenome['seeds'], pangenome['proteins'], protseq,
+                                                     candidates=pangenome['kept']):
+            remove_protein(pangenome, containedProtid)
+            contained += 1
+
+        pangenome['kept'].add(protid)
+        kmer_index.add_minimizers(pangenome['containment'], protid, protseq)
+        kmer_index.add_seed(pangenome['seeds'], protid, protseq)
+        codes = kmer_index.minimizers_set(protseq)
+        pangenome['sizes'][protid] = len(codes)
+        for code in codes:
+            pangenome['clusters'].setdefault(code, set()).add(protid)
+        keptProteins.append(protid)
+
+    # proteins kept in this genome, larger ones first
+    newProteins = [protid for protid in keptProteins if protid in pangenome['kept']]
+
+    pathForTemp = os.path.join(basepath, 'pangenome_blast')
     if not os.path.exists(pathForTemp):
         os.makedirs(pathForTemp)
+    hits = blast_new_proteins(pangenome, newProteins, pathForTemp, BlastpPath, cpu)
+
+    similar = 0
+    for protid in newProteins:
+        if protid not in hits or protid not in pangenome['kept']:
+            continue
+
+        selfScore = max([score for hit, score in hits[protid] if hit == protid] or [0])
+        if selfScore == 0:
+            continue
+
+        alleleLength = len(pangenome['dna'][protid])
+        for hit, score in hits[protid]:
+            if hit == protid or hit not in pangenome['kept'] or float(score) / selfScore <= bsr:
+                continue
+
+            # keep the protein with the larger CDS
+            if len(pangenome['dna'][hit]) > alleleLength:
+                remove_protein(pangenome, protid)
+                similar += 1
+                break
+            else:
+                remove_protein(pangenome, hit)
+                similar += 1
 
-    listOfGenomes = [genome1, genome2]
+    verboseprint("Added " + str(genomename) + ": equal proteins " + str(proteinsEqual) +
+                 ", small proteins " + str(smallProteins) + ", contained proteins " + str(contained) +
+                 ", similar proteins " + str(similar) + ", pan-genome loci " + str(len(pangenome['kept'])))
 
-    dictprots = {}
-    dictprotsLen = {}
-    dictprotsName = {}
-    newlistOfCDS = {}
-    proteinsEqual = 0
-    smallProteins = 0
-    protid = 0
-    genomeProts = ""
-    genomeProtsTrans = ""
-
-    try:
-
-        for genomeFile in listOfGenomes:
-
-            genomename = (os.path.basename(genomeFile)).split(".")
-            genomename = genomename[0]
-
-            listOfCDS = {}
-
-            currentCDSDict = {}
-            currentGenomeDict = {}
-            filepath = os.path.join(basepath, '{0}_ORF.txt'.format(os.path.basename(genomeFile)))
-            newfilepath = os.path.join(basepath, str(newName))
-
-            for contig in SeqIO.parse(genomeFile, "fasta"):
-                sequence = str(contig.seq.upper())
-                currentGenomeDict[contig.id] = sequence
-
-            # after the first iteration, genomes are already defined by their cds and no longer have a cds dictionary pickle file
-            try:
-                with open(filepath, 'rb') as f:
-                    currentCDSDict = pickle.load(f)
-            except:
-                for k, v in currentGenomeDict.items():
-                    currentCDSDict[k] = [[v]]
-
-            j = 0
-            counter = 0
-            tsvProtidGenome = ""
-            for contigTag, value in currentCDSDict.items():
-
-                for protein in value:
-                    protid += 1
-
-                    # at first iteration we use the genome file and after a cds only multifasta file
-                    try:
-                        seq = currentGenomeDict[contigTag][protein[0]:protein[1]].upper()
-                        aux = [genomename, contigTag, str(protein[0]), str(protein[1]), str(protid)]
-                        tsvProtidGenome += "\n"+'\t'.join(aux)
-
-                    except Exception as e:
-
-                        seq = str(protein[0])
-
-                    try:
-                        protseq, orderedSeq = translateSeq(seq)
-                        lengthofProt = len(str(protseq))
-                    except:
-                        verboseprint(str(genome1) + " " + str(genome2))
-                        pass
-
-                    # check if any protein with size on dict
-                    try:
-
-                        if len(str(protseq)) < 67:
-                            smallProteins += 1
-                            pass
-
-                        elif dictprotsLen[lengthofProt]:
-                            proteinFound = False
-                            listproteinsid = dictprotsLen[lengthofProt]
-                            for elem in listproteinsid:
-
-                                if protseq == dictprots[elem]:
-                                    proteinFound = True
-                                    proteinsEqual += 1
-                                    break
-
-                            if not proteinFound:
-                                dictprotsLen[lengthofProt].append(protid)
-                                dictprots[protid] = protseq
-                                newlistOfCDS[protid] = orderedSeq
-                                try:
-                                    protein[1]
-                                    idstr = ">" + str(genomename) + "|protein" + str(protid)
-                                    idstr2 = ">" + str(genomename) + "|protein" + str(protid)
-                                except:
-                                    idstr = ">" + str(contigTag)
-                                    idstr2 = ">" + str((contigTag.split(" "))[0])
-                                genomeProts += idstr + "\n"
-                                genomeProtsTrans += idstr2 + "\n"
-                                genomeProts += str(orderedSeq) + "\n"
-                                genomeProtsTrans += str(protseq) + "\n"
-                                dictprotsName[protid] = idstr2
-                    except Exception as e:
-                        try:
-                            dictprotsLen[lengthofProt] = [protid]
-                            dictprots[protid] = protseq
-                            newlistOfCDS[protid] = orderedSeq
-                            try:
-                                protein[1]
-                                idstr = ">" + str(genomename) + "|protein" + str(protid)
-                                idstr2 = ">" + str(genomename) + "|protein" + str(protid)
-
-                            except:
-                                idstr = ">" + str(contigTag)
-                                idstr2 = ">" + str((contigTag.split(" "))[0])
-
-                            genomeProts += idstr + "\n"
-                            genomeProtsTrans += idstr2 + "\n"
-                            genomeProts += str(orderedSeq) + "\n"
-                            genomeProtsTrans += str(protseq) + "\n"
-                            dictprotsName[protid] = idstr2
-                        except:
-                            pass
-
-                    else:
-                        pass
-
-            listOfCDS = ''
-            currentGenomeDict = ''
-            currentCDSDict = ''
-            with open("proteinID_Genome.tsv", 'a') as f:
-                f.write(tsvProtidGenome)
-
-        verboseprint("Checked equal proteins for: " + str(genome1) + " " + str(genome2))
-        verboseprint("Starting with a total of loci: " + str(protid))
-        verboseprint("equal proteins : " + str(proteinsEqual))
-        verboseprint("small proteins : " + str(smallProteins))
-
-        fastaFile = os.path.join(pathForTemp, newName + ".fasta")
-        with open(fastaFile, 'a') as f:
-            f.write(genomeProts)
-
-        newlistOfCDS = {}
-        genomeProtsTrans = ''
-        genomeProts = ''
-
-        # check if any protein is substring of a larger, mantaining the larger one
-        # ordering the sequences by length, larger ones first
-        auxlist = dictprotsLen.keys()
-        auxlist = sorted(auxlist, key=int)
-        auxlist = auxlist[::-1]
-
-        finalProtDict = {}
-        genomeProtsTrans = ''
-        auxprotlist = []
-        contained = 0
-        finalnumber = 0
-        verboseprint("Looking for contained proteins in : " + str(genome1) + " " + str(genome2))
-        counter = 0
-
-        for elem in auxlist:
-            counter += 1
-
-            for protid in dictprotsLen[elem]:
-                str2 = str(dictprots[protid])
-
-                try:
-                    auxprotlist[0]
-                    for elem2 in auxprotlist:
-                        isContained = False
-                        if len(elem2) < len(str2):
-                            break
-                        else:
-                            if str2 in elem2:
-                                isContained = True
-                                contained += 1
-                                break
-                    if not isContained:
-                        str1 = dictprotsName[protid]
-                        genomeProtsTrans += str1 + "\n" + str2 + "\n"
-                        finalnumber += 1
-                        auxprotlist.append(str2)
-                except Exception as e:
-                    str1 = dictprotsName[protid]
-                    genomeProtsTrans += str1 + "\n" + str2 + "\n"
-                    finalnumber += 1
-                    auxprotlist.append(str2)
-
-        auxprotlist = []
-        dictprots = {}
-        dictprotsLen = {}
-        dictprotsName = {}
-
-        verboseprint("number of contained proteins : " + str(contained))
-        verboseprint("total of loci to blast : " + str(finalnumber))
-
-        proteinFile = os.path.join(pathForTemp, newName + "_proteins.fasta")
-
-        with open(proteinFile, 'a') as f:
-            f.write(genomeProtsTrans)
-        genomeProtsTrans = ''
-
-        # run createschema for the final protogenome
-        verboseprint("running blast will use this number of cpu: " + str(cpu))
-        CreateSchema.main(fastaFile, 200, cpu, proteinFile, fastaFile, blastp, bsr, verbose)
-        verboseprint("finished blast")
-
-        os.remove(proteinFile)
-
-    except Exception as e:
-        verboseprint(e)
-        return e
-
-    return True
-
-
-def reverseComplement(strDNA):
-    basecomplement = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A'}
-    strDNArevC = ''
-    for l in strDNA:
-        strDNArevC += basecomplement[l]
-
-    return strDNArevC[::-1]
+    return tsvProtidGenome
 
 
-def translateSeq(DNASeq):
-    seq = DNASeq
-    tableid = 11
-
-    # look for ambiguous bases
-    try:
-        reverseComplement(seq)
-    except:
-        raise
-    try:
-        myseq = Seq(seq)
-        protseq = Seq.translate(myseq, table=tableid, cds=True)
-    except:
-        try:
-            seq = reverseComplement(seq)
-            myseq = Seq(seq)
-            protseq = Seq.translate(myseq, table=tableid, cds=True)
+def write_pangenome(pangenome, fastaFile):
+    """ Writes the CDSs of the proteins in a pan-genome to a FASTA
+        file, in the order they were added.
+    """
 
-        except:
-            try:
-                seq = seq[::-1]
-                myseq = Seq(seq)
-                protseq = Seq.translate(myseq, table=tableid, cds=True)
-            except:
-                try:
-                    seq = seq[::-1]
-                    seq = reverseComplement(seq)
-                    myseq = Seq(seq)
-                    protseq = Seq.translate(myseq, table=tableid, cds=True)
-                except Exception as e:
-                    raise
+    with open(fastaFile, 'w') as f:
+        for protid in sorted(pangenome['kept']):
+            f.write(">" + pangenome['names'][protid] + "\n" + pangenome['dna'][protid] + "\n")
+
+
+reverseComplement = translation.reverse_complement
+
+
+def translateSeq(DNASeq):
+    code, protseq, seq, orientation = translation.translate_cds(DNASeq, 11)
+    if code != translation.VALID:
+        raise ValueError("sequence is not translatable to a protein")
 
     return protseq, seq
 
@@ -316,7 +314,8 @@ def call_proc(cmd):
 
 
 def main(genomeFiles, cpuToUse, outputFile, bsr, BlastpPath, min_length,
-         verbose, chosenTrainingFile, inputCDS, translation_table, st):
+         verbose, chosenTrainingFile, inputCDS, translation_table, st,
+         predictionCache=None):
 
     if verbose:
         def verboseprint(*args):
@@ -391,14 +390,18 @@ def main(genomeFiles, cpuToUse, outputFile, bsr, BlastpPath, min_length,
         print("Starting Prodigal at: " + time.strftime("%H:%M:%S-%d/%m/%Y"))
 
         # Prodigal run on the genomes, one genome per core using n-2 cores (n number of cores)
-        pool = multiprocessing.Pool(cpuToUse)
-        for genome in listOfGenomes:
-            pool.apply_async(runProdigal.main, (str(genome), basepath, str(chosenTaxon), translation_table))
-
-        pool.close()
-        pool.join()
+        prodigalTasks = [(str(genome), basepath, str(chosenTaxon), translation_table, predictionCache)
+                         for genome in listOfGenomes]
+        try:
+            task_runner.run_tasks(runProdigal.main, prodigalTasks, cpuToUse,
+                                  progress=task_runner.report_progress)
+        except task_runner.TaskError as e:
+            shutil.rmtree(basepath)
+            raise ValueError("Could not run Prodigal for {0}:\n{1}".format(e.task, e.remote_traceback))
 
         print("Finishing Prodigal at: " + time.strftime("%H:%M:%S-%d/%m/%Y"))
+        if predictionCache is not None:
+            prediction_cache.prune(predictionCache)
 
         print("\nChecking if Prodigal created all the necessary files...")
         listOfORFCreated = []
@@ -414,72 +417,28 @@ def main(genomeFiles, cpuToUse, outputFile, bsr, BlastpPath, min_length,
         else:
             print("All files were created.\n")
 
-    createSchemaPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'CreateSchema.py')
-
     # ---CDS to protein---#
 
-    # translate the genome CDSs, load them into dictionaries and fasta files to be used further ahead
-    pairID = 0
+    # add the CDSs of each genome to a non-redundant pan-genome, only the
+    # proteins that were not seen before are compared to the pan-genome
+    pangenome = new_pangenome()
     with open("proteinID_Genome.tsv", 'w') as f:
         f.write("Genome\tcontig\tStart\tStop\tprotID")
-    while len(listOfGenomes) > 0:
-
-        pair = []
-        dictPairs = {}
-
-        for genomeFile in listOfGenomes:
-            if len(pair) < 2:
-                pair.append(genomeFile)
-            else:
-                dictPairs[pairID] = pair
-                pairID += 1
-                pair = []
-                pair.append(genomeFile)
-
-        # if total unpair, keep the remainig
-        listOfGenomes = []
-
-        if len(pair) == 2:
-            dictPairs[pairID] = pair
-            pairID += 1
-
-        elif len(pair) > 0:
-            listOfGenomes.append(pair[0])
-
-        numberOfPairs = len(dictPairs.items())
-        extraCpu = 0
-        if numberOfPairs >= cpuToUse:
-            pool = multiprocessing.Pool(cpuToUse)
-        else:
-            pool = multiprocessing.Pool(numberOfPairs)
-            extraCpu = cpuToUse - numberOfPairs
-
-        # print dictPairs
-        for item in dictPairs.items():
-            k = item[0]
-            v = item[1]
-
-            newgGenome = "protogenome" + str(k)
-            pathFornewgGenome = os.path.join(basepath, newgGenome, newgGenome + ".fasta")
-            listOfGenomes.append(pathFornewgGenome)
-            extraCpuPerProcess = extraCpu / numberOfPairs
-            print("Running analysis for pair: " + str(v[0]) + " " + str(v[1]))
-            pool.apply_async(checkGeneStrings,
-                             args=[v[0], v[1], newgGenome, basepath, int(extraCpuPerProcess + 1), BlastpPath,
-                                   createSchemaPath, verbose, bsr])
-
-        pool.close()
-        pool.join()
-
-        if len(listOfGenomes) == 1:
+    for i, genomeFile in enumerate(listOfGenomes):
+        tsvProtidGenome = add_genome(pangenome, genomeFile, basepath, BlastpPath, bsr, cpuToUse, verbose)
+        with open("proteinID_Genome.tsv", 'a') as f:
+            f.write(tsvProtidGenome)
+        task_runner.report_progress(i + 1, len(listOfGenomes))
 
-            verboseprint("___________________\nFinal step : creating the schema")
-            lastFile = listOfGenomes.pop()
+    verboseprint("___________________\nFinal step : creating the schema")
+    pangenomeFile = os.path.join(basepath, "pangenome.fasta")
+    write_pangenome(pangenome, pangenomeFile)
+    pangenome = None
 
-            CreateSchema.main(lastFile, min_length, cpuToUse, False,
-                              outputFile, BlastpPath, bsr, verbose)
+    CreateSchema.main(pangenomeFile, min_length, cpuToUse, False,
+                      outputFile, BlastpPath, bsr, verbose)
 
-            verboseprint("Schema Created sucessfully")
+    verboseprint("Schema Created sucessfully")
 
     shutil.rmtree(basepath)
 
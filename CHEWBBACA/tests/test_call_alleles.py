@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the search of the locus representatives against all genomes.
+"""
+
+from CHEWBBACA.allelecall import callAlleles_protein3
+
+
+def test_blast_against_genomes(tmp_path, monkeypatch):
+    """Tests that the targets are limited per genome and not in the search"""
+    genomesDB = str(tmp_path / callAlleles_protein3.GENOMES_DB)
+    with open(callAlleles_protein3.genomes_db_count_path(genomesDB), 'w') as outfile:
+        outfile.write('40')
+
+    # paralogs in the first genome have better hits than the CDS of the second genome
+    hits = [('rep1', 200 - i, '0|c&protein{0}&1-300'.format(i)) for i in range(12)]
+    hits.insert(1, ('rep1', 150, '0|c&protein0&1-300'))
+    hits.append(('rep1', 120, '1|c&protein1&1-300'))
+    hits.append(('rep2', 190, '0|c&protein11&1-300'))
+    searches = []
+
+    class FakeBlastp:
+        def __init__(self, **kwargs):
+            searches.append(kwargs)
+
+        def __call__(self, stdin):
+            return ''.join('{0}\t{1}\t1\t99\t1\t99\t{2}\n'.format(*hit) for hit in hits), ''
+
+    monkeypatch.setattr(callAlleles_protein3, 'NcbiblastpCommandline', FakeBlastp)
+
+    genomeHits = callAlleles_protein3.blast_against_genomes('>rep1\nMK\n>rep2\nMR\n', genomesDB,
+                                                            'blastp', 2, queryOffset=1)
+    assert searches[0]['max_target_seqs'] == 40
+    # both hits against the first CDS are kept
+    assert [hit[1] for hit in genomeHits[0] if hit[0] == 2] == \
+        ['c&protein{0}&1-300'.format(i) for i in [0] + list(range(10))]
+    assert [hit[1] for hit in genomeHits[0] if hit[0] == 3] == ['c&protein11&1-300']
+    assert genomeHits[1] == [(2, 'c&protein1&1-300', 120, 1, 99)]
+
+
+def test_translate_seq_ambiguous():
+    """Tests that alleles with ambiguous bases are translated"""
+    assert callAlleles_protein3.translateSeq('ATGAANAAGTAA') == ('MXK', 'ATGAANAAGTAA')
+    assert callAlleles_protein3.translateSeq('TTACTTNTTCAT') == ('MXK', 'ATGAANAAGTAA')
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the journal used to resume interrupted locus workers.
+"""
+
+from CHEWBBACA.utils import call_journal, results_matrix
+
+
+def test_replay_journal(tmp_path):
+    """Tests that only the records of genomes with a call are replayed"""
+    temppath = str(tmp_path)
+    locus = '/schema/locus.fasta'
+    calls = results_matrix.empty_calls(3)
+
+    journal = call_journal.open_journal(temppath, locus)
+    results_matrix.set_call(calls, 0, results_matrix.EXC, '2', 0, 1, 90)
+    call_journal.add_call(journal, 0, calls)
+    results_matrix.set_call(calls, 1, results_matrix.INF, '*3', 1, 90, 1)
+    call_journal.add_allele(journal, 'locus_*3', 'ATGAAATAA', 'MK', True)
+    call_journal.add_contained(journal, ['g2.fasta', '*3', 'CD2'])
+    call_journal.add_call(journal, 1, calls)
+    # the worker is interrupted after inferring an allele in the third genome
+    call_journal.add_allele(journal, 'locus_*4', 'ATGCCCTAA', 'MP', False)
+    call_journal.close_journal(journal)
+    with open(call_journal.journal_path(temppath, locus), 'a') as outfile:
+        outfile.write('A\tlocus_*4\t0\tATGCC')
+
+    called, alleles, contained = call_journal.read_journal(temppath, locus)
+    assert sorted(called) == [0, 1]
+    assert alleles == [['locus_*3', True, 'ATGAAATAA', 'MK']]
+    assert contained == [['g2.fasta', '*3', 'CD2']]
+
+    restored = results_matrix.empty_calls(3)
+    call_journal.restore_calls(restored, called)
+    for name, dtype in results_matrix.COLUMNS:
+        assert restored[name][:2].tolist() == calls[name][:2].tolist()
+
+    # new records are added after the last complete call
+    journal = call_journal.open_journal(temppath, locus)
+    results_matrix.set_call(calls, 2, results_matrix.LNF)
+    call_journal.add_call(journal, 2, calls)
+    call_journal.close_journal(journal)
+    assert sorted(call_journal.read_journal(temppath, locus)[0]) == [0, 1, 2]
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the selection of the genes of a new schema.
+"""
+
+import random
+from types import SimpleNamespace
+
+from CHEWBBACA.createschema import CreateSchema
+
+
+def blast_record(query, hits):
+    """Creates a BLAST record with the first HSP score of each hit"""
+    return SimpleNamespace(query=query,
+                           alignments=[SimpleNamespace(hit_def=hit, hsps=[SimpleNamespace(score=score)])
+                                       for hit, score in hits])
+
+
+def fixture_pangenome(total_genes, seed):
+    """Creates genes in families of similar genes and the BLAST
+    records of their proteins against all proteins"""
+    rng = random.Random(seed)
+    geneDict = {}
+    families = {}
+    for i in range(total_genes):
+        name = 'gene{0}'.format(i)
+        geneDict[name] = 'A' * (3 * rng.randint(60, 120))
+        families.setdefault(rng.randint(0, total_genes // 4), []).append(name)
+
+    records = []
+    for family in families.values():
+        for query in family:
+            alignments = []
+            for hit in family:
+                length = min(len(geneDict[query]), len(geneDict[hit])) // 3
+                score = 5 * length if hit == query else rng.randint(length, 6 * length)
+                alignments.append(SimpleNamespace(hit_def=hit, hsps=[SimpleNamespace(score=score)]))
+            alignments.sort(key=lambda align: -align.hsps[0].score)
+            records.append(SimpleNamespace(query=query, alignments=alignments))
+    rng.shuffle(records)
+
+    return records, geneDict
+
+
+def test_select_genes_pangenome():
+    """Tests that the same genes are selected as with the list-based
+    selection loop of the baseline, whose output is frozen below"""
+    records, geneDict = fixture_pangenome(30, 0)
+
+    genesToKeep, toRemove, log = CreateSchema.select_genes(records, geneDict, 0.6)
+
+    assert genesToKeep == {'gene{0}'.format(i) for i in
+                           [0, 3, 6, 7, 8, 9, 10, 11, 14, 15, 16, 17, 19, 20, 22, 24, 26, 27, 29]}
+    assert toRemove == {'gene{0}'.format(i) for i in
+                        [1, 2, 4, 5, 7, 12, 13, 15, 18, 19, 21, 23, 25, 26, 28]}
+    assert log == ['removed\tcause\texplanation',
+                   'gene2\tgene19\t2 is first best match',
+                   'gene13\tgene9\t2 is bigger and bsr >0.6',
+                   'gene19\tgene10\t2 is bigger and bsr >0.6',
+                   'gene23\tgene29\t2 is bigger and bsr >0.6',
+                   'gene25\tgene14\t2 is first best match',
+                   'gene18\tgene23\t2 is first best match',
+                   'gene28\tgene7\t2 is first best match',
+                   'gene1\tgene0\t2 is first best match',
+                   'gene4\tgene10\t2 is bigger and bsr >0.6',
+                   'gene5\tgene24\t2 is bigger and bsr >0.6',
+                   'gene12\tgene26\t2 is first best match',
+                   'gene26\tgene15\t2 is first best match',
+                   'gene21\tgene1\t2 is first best match',
+                   'gene7\tgene11\t2 is bigger and bsr >0.6',
+                   'gene15\tgene9\t2 is bigger and bsr >0.6']
+
+
+def test_select_genes():
+    """Tests the genes that are kept and removed and the causes"""
+    geneDict = {'g1': 'A' * 300, 'g2': 'A' * 360, 'g3': 'A' * 300, 'g4': 'A' * 210,
+                'g5': 'A' * 240, 'g7': 'A' * 400}
+    records = [
+        # g2 is bigger and similar
+        blast_record('g1', [('g1', 100), ('g2', 80)]),
+        # first match is not against itself
+        blast_record('g3', [('g4', 90), ('g3', 100)]),
+        # g1 was removed and g4 is smaller and similar
+        blast_record('g2', [('g2', 120), ('g1', 80), ('g4', 80)]),
+        # records of removed genes do not change the selection
+        blast_record('g4', [('g4', 70), ('g5', 60)]),
+        # BSR with g2 is below the threshold
+        blast_record('g5', [('g5', 80), ('g2', 40)]),
+        # g2 was kept twice and is only removed once
+        blast_record('g7', [('g7', 130), ('g2', 100)])]
+
+    genesToKeep, toRemove, log = CreateSchema.select_genes(records, geneDict, 0.6)
+
+    assert genesToKeep == {'g2', 'g5', 'g7'}
+    assert toRemove == {'g1', 'g2', 'g3', 'g4'}
+    assert log == ['removed\tcause\texplanation',
+                   'g1\tg2\t2 is bigger and bsr >0.6',
+                   'g3\tg4\t2 is first best match',
+                   'g4\tg2\t2 is bigger and bsr >0.6',
+                   'g2\tg7\t2 is bigger and bsr >0.6']
+
+
+def test_blast_batches():
+    """Tests that clusters are grouped without being split"""
+    clusters = [[0, 5], [1, 2, 3], [4], [6, 7, 8, 9, 10]]
+    assert CreateSchema.blast_batches(clusters, 4) == [[0, 5], [1, 2, 3, 4], [6, 7, 8, 9, 10]]
+
+
+def test_translate_seq_ambiguous():
+    """Tests that CDSs with ambiguous bases are kept in new schemas"""
+    assert CreateSchema.translateSeq('ATGAANAAGTAA', 'gene') == ('MXK', 'ATGAANAAGTAA', False)
+    assert CreateSchema.translateSeq('ATGAANTAGTAA', 'gene') == ('', 'ATGAANTAGTAA', False)
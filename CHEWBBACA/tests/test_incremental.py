@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the incremental allele call.
+"""
+
+import os
+import time
+
+from CHEWBBACA.utils import incremental
+
+
+def write_results(directory, rows):
+    """Writes an alleles matrix with two loci"""
+    directory.mkdir()
+    (directory / 'results_alleles.tsv').write_text(
+        'FILE\tlocus1.fasta\tlocus2.fasta' + ''.join('\n' + '\t'.join(row) for row in rows))
+    return str(directory)
+
+
+def test_new_genomes(tmp_path):
+    """Tests that genomes in the previous results are not called again"""
+    previous = write_results(tmp_path / 'results_1', [['g1.fasta', '1', 'LNF']])
+    genomes = ['/data/g1.fasta', '/data/g2.fasta']
+    assert incremental.new_genomes(genomes, previous) == ['/data/g2.fasta']
+
+
+def test_update_results(tmp_path):
+    """Tests that new rows are appended after reassigning previous identifiers"""
+    schema = str(tmp_path)
+    previous = write_results(tmp_path / 'results_1', [['g1.fasta', 'INF-*3', '*4'],
+                                                      ['g2.fasta', '1', '*3']])
+    # reassignments recorded before the results are ignored
+    os.utime(os.path.join(previous, 'results_alleles.tsv'), (time.time() - 10, time.time() - 10))
+    incremental.record_reassignments(schema, {'locus1.fasta': {'*3': 'locus1_7'}})
+    new = write_results(tmp_path / 'results_2', [['g3.fasta', '7', 'INF-*5']])
+
+    assert incremental.update_results(previous, new, schema) == [1, 1]
+    with open(os.path.join(previous, 'results_alleles.tsv')) as infile:
+        assert infile.read() == ('FILE\tlocus1.fasta\tlocus2.fasta\n'
+                                 'g1.fasta\tINF-7\t*4\n'
+                                 'g2.fasta\t1\t*3\n'
+                                 'g3.fasta\t7\tINF-*5')
+
+    # already applied
+    assert incremental.update_results(previous, new, schema) == [1, 0]
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the selection of the representatives of the schema loci.
+"""
+
+import os
+import pickle
+
+from CHEWBBACA.utils import init_schema_4_bbaca
+
+
+def test_best_bsr():
+    """Tests that only hits with higher BSR and score than the hits of
+    previous representatives are kept"""
+    selfscores = [100, 200, 50]
+    assert init_schema_4_bbaca.best_bsr([], selfscores) == 0
+    # BSR below the minimum is ignored
+    assert init_schema_4_bbaca.best_bsr([(0, 55)], selfscores) == 0
+    assert init_schema_4_bbaca.best_bsr([(0, 65), (1, 150)], selfscores) == 0.75
+    # higher BSR with a lower score does not replace the first hit
+    assert init_schema_4_bbaca.best_bsr([(0, 65), (2, 45)], selfscores) == 0.65
+    assert init_schema_4_bbaca.best_bsr([(1, 130), (0, 90)], selfscores) == 0.65
+
+
+def test_select_representatives(tmp_path, monkeypatch):
+    """Tests the selection of the representatives of a locus with
+    canned BLAST output for each representative"""
+    proteins = ['M' + 'A' * 99, 'M' + 'C' * 99, 'M' + 'D' * 49, 'M' + 'E' * 99]
+    # representative -> hits (allele, score, e-value)
+    blast_hits = {'0': [(0, 100, 1e-50), (1, 65, 1e-20), (2, 90, 1e-30), (3, 62, 1e-20)],
+                  # the hit against allele 3 is not significant in a database
+                  # with only that allele, the hit against the shorter
+                  # allele 2 is significant
+                  '1': [(1, 100, 1e-50), (2, 50, 0.0015), (3, 80, 0.0015)]}
+    searches = []
+
+    class FakeBlastp:
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+
+        def __call__(self, stdin):
+            query = stdin[1:].split('\n', 1)[0]
+            searches.append((query, self.kwargs['dbsize'], self.kwargs['evalue']))
+            out = ''.join('{0}\t{1}\t{2}\t{3}\n'.format(query, score, evalue, allele)
+                          for allele, score, evalue in blast_hits[query])
+            return out, ''
+
+    monkeypatch.setattr(init_schema_4_bbaca, 'NcbiblastpCommandline', FakeBlastp)
+    monkeypatch.setattr(init_schema_4_bbaca.CommonFastaFunctions, 'Create_Blastdb',
+                        lambda *args: 'alleles_db')
+
+    reps = init_schema_4_bbaca.select_representatives(proteins, [100, 100, 100, 100],
+                                                      'blastp', str(tmp_path))
+    # allele 2 has BSR 0.9 with the first representative and allele 3
+    # only has the hit of the first representative
+    assert reps == [0, 1, 3]
+    # the database size is the length of the longest allele that is compared
+    assert searches == [('0', 100, 0.002), ('1', 100, 0.002)]
+
+
+def test_get_short_single_allele(tmp_path):
+    """Tests a locus with one valid allele, that does not need BLAST"""
+    locus = os.path.join(str(tmp_path), 'locus.fasta')
+    # second allele is not a CDS and the first is in antisense
+    with open(locus, 'w') as outfile:
+        outfile.write('>locus_1\nTTACTTCTTCAT\n>locus_2\nATGAAA\n')
+
+    init_schema_4_bbaca.get_Short(locus, [], analytic=True)
+
+    short = os.path.join(str(tmp_path), 'short', 'locus_short.fasta')
+    with open(short, 'r') as infile:
+        assert infile.read() == '>locus_1\nTTACTTCTTCAT\n'
+    with open(short + '_bsr.txt', 'rb') as infile:
+        assert list(pickle.load(infile).keys()) == [1]
+    with open(locus, 'r') as infile:
+        assert infile.read() == '>locus_1\nATGAAGAAGTAA\n'
+
+
+def test_get_short_ambiguous_allele(tmp_path):
+    """Tests that alleles with ambiguous bases are kept in the locus"""
+    locus = os.path.join(str(tmp_path), 'locus.fasta')
+    with open(locus, 'w') as outfile:
+        outfile.write('>locus_2\nATGAANAAGTAA\n')
+
+    init_schema_4_bbaca.get_Short(locus, [], analytic=True)
+
+    short = os.path.join(str(tmp_path), 'short', 'locus_short.fasta')
+    with open(short, 'r') as infile:
+        assert infile.read() == '>locus_2\nATGAANAAGTAA\n'
+    with open(locus, 'r') as infile:
+        assert infile.read() == '>locus_2\nATGAANAAGTAA\n'
+    assert init_schema_4_bbaca.translateSeq('ATGAANAAGTAA') == ('MXK', 'ATGAANAAGTAA', True)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the minimizer index used to find contained proteins.
+"""
+
+import random
+
+from CHEWBBACA.utils import kmer_index
+
+
+def contained_pairwise(sequences):
+    """Finds contained proteins by comparing each protein to all longer proteins"""
+    order = sorted(range(len(sequences)), key=lambda i: -len(sequences[i]))
+    kept = []
+    contained = [False] * len(sequences)
+    for i in order:
+        if any(sequences[i] in sequences[j] for j in kept):
+            contained[i] = True
+        else:
+            kept.append(i)
+    return contained
+
+
+def test_minimizers():
+    """Tests that the first window of a sequence has the minimizer used as seed"""
+    sequence = 'MKLVNQRSTAGHEDWYFPC'
+    code, position = kmer_index.first_minimizer(sequence)
+    assert (code, position) in kmer_index.minimizers(sequence)
+    assert kmer_index.minimizers('MKLV') == []
+    assert kmer_index.first_minimizer('MKLV') is None
+
+
+def test_find_contained():
+    """Tests that the same proteins are found as with pairwise comparisons"""
+    rng = random.Random(3)
+    residues = 'ACDEFGHIKLMNPQRSTVWY'
+    sequences = []
+    for i in range(400):
+        draw = rng.random()
+        if draw < 0.3 and sequences:
+            other = rng.choice(sequences)
+            start = rng.randint(0, len(other) // 2)
+            sequences.append(other[start:rng.randint(start + 1, len(other))])
+        elif draw < 0.35:
+            sequences.append(rng.choice('AQ') * rng.randint(3, 40))
+        else:
+            sequences.append(''.join(rng.choice(residues) for j in range(rng.randint(3, 200))))
+
+    containers = kmer_index.find_contained(sequences)
+    assert [c is not None for c in containers] == contained_pairwise(sequences)
+    for i, container in enumerate(containers):
+        if container is not None:
+            assert sequences[i] in sequences[container] and containers[container] is None
+
+
+def test_duplicates():
+    """Tests that only the first of equal proteins is kept"""
+    assert kmer_index.find_contained(['MKLVNQRSTAGHEDW', 'MKLVNQRSTAGHEDW', 'LVNQRSTAGH']) == [None, 0, 0]
+
+
+def test_similar_clusters():
+    """Tests that variants of the same protein are clustered together"""
+    rng = random.Random(5)
+    residues = 'ACDEFGHIKLMNPQRSTVWY'
+    families = [''.join(rng.choice(residues) for j in range(rng.randint(70, 300))) for i in range(30)]
+    sequences = []
+    labels = []
+    for family, protein in enumerate(families):
+        for variant in range(3):
+            sequences.append(''.join(residue if rng.random() < 0.95 else rng.choice(residues)
+                                     for residue in protein))
+            labels.append(family)
+    sequences.append('MKLV')
+
+    clusters = kmer_index.similar_clusters(sequences)
+    assert sorted(sorted(labels[i] for i in cluster) for cluster in clusters[:-1]) == \
+        [[family] * 3 for family in range(30)]
+    assert clusters[-1] == [len(sequences) - 1]
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the cost estimates used to order the loci in the allele call.
+"""
+
+from CHEWBBACA.allelecall import BBACA
+
+
+def write_locus(directory, name, alleles, representatives):
+    """Writes a locus file and its file with representatives"""
+    (directory / 'short').mkdir(exist_ok=True)
+    locus = directory / '{0}.fasta'.format(name)
+    locus.write_text(''.join('>{0}_{1}\n{2}\n'.format(name, i+1, seq)
+                             for i, seq in enumerate(alleles)))
+    short = directory / 'short' / '{0}_short.fasta'.format(name)
+    short.write_text(''.join('>{0}_{1}\n{2}\n'.format(name, i+1, seq)
+                             for i, seq in enumerate(representatives)))
+    return str(locus)
+
+
+def test_locus_cost(tmp_path):
+    """Tests that loci with more representatives and longer alleles cost more"""
+    small = write_locus(tmp_path, 'small', ['ATG'*10]*4, ['ATG'*10])
+    diverse = write_locus(tmp_path, 'diverse', ['ATG'*10]*4, ['ATG'*10]*3)
+    long = write_locus(tmp_path, 'long', ['ATG'*100]*4, ['ATG'*100])
+
+    assert BBACA.locus_cost(small) == (1 + BBACA.ALLELE_COST*4) * 30
+    assert BBACA.locus_cost(diverse) > BBACA.locus_cost(small)
+    assert BBACA.locus_cost(long) > BBACA.locus_cost(diverse)
+
+
+def test_utilization_report():
+    """Tests the number of loci and busy time reported per worker"""
+    report = BBACA.utilization_report([[1, 'a', 0, 5], [2, 'b', 0, 9], [1, 'c', 5, 9]], 0, 10)
+    lines = report.split('\n')
+    assert lines[2].split() == ['1', '2', '9.0', '90.0%']
+    assert lines[3].split() == ['2', '1', '9.0', '90.0%']
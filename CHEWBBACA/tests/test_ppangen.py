@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the streaming construction of the pan-genome.
+"""
+
+import os
+import pickle
+import random
+
+from CHEWBBACA.createschema import PPanGen
+
+# codons without stop codons
+CODONS = ['GCT', 'TGT', 'GAT', 'GAA', 'TTT', 'GGT', 'CAT', 'ATT', 'AAA', 'CTG',
+          'AAT', 'CCG', 'CAG', 'CGT', 'TCT', 'ACC', 'GTT', 'TGG', 'TAT']
+
+
+def random_cds(rng, length):
+    """Creates a CDS with a random protein"""
+    return 'ATG' + ''.join(rng.choice(CODONS) for i in range(length)) + 'TAA'
+
+
+def write_genome(directory, name, cdss):
+    """Writes a genome with one contig and the positions of its CDSs"""
+    contig = 'CCC'.join(cdss)
+    genome_file = os.path.join(directory, name)
+    with open(genome_file, 'w') as outfile:
+        outfile.write('>contig1\n' + contig + '\n')
+
+    positions = []
+    start = 0
+    for cds in cdss:
+        positions.append([start, start + len(cds)])
+        start += len(cds) + 3
+    with open(os.path.join(directory, name + '_ORF.txt'), 'wb') as outfile:
+        pickle.dump({'contig1': positions}, outfile)
+
+    return genome_file
+
+
+def test_add_genomes(tmp_path):
+    """Tests that equal and contained proteins are not added"""
+    rng = random.Random(7)
+    basepath = str(tmp_path)
+    cds_a, cds_b, cds_d = (random_cds(rng, 150) for i in range(3))
+    # contains the protein of cds_b
+    cds_c = 'ATG' + ''.join(rng.choice(CODONS) for i in range(30)) + cds_b
+    short = random_cds(rng, 20)
+
+    genome1 = write_genome(basepath, 'genome1.fasta', [cds_a, cds_b, short])
+    genome2 = write_genome(basepath, 'genome2.fasta', [cds_a, cds_c, cds_d])
+
+    pangenome = PPanGen.new_pangenome()
+    tsv = PPanGen.add_genome(pangenome, genome1, basepath, 'blastp', 0.6, 1, False)
+    assert tsv.count('\n') == 3
+    assert pangenome['kept'] == {1, 2}
+
+    PPanGen.add_genome(pangenome, genome2, basepath, 'blastp', 0.6, 1, False)
+    assert pangenome['kept'] == {1, 5, 6}
+
+    pangenome_file = os.path.join(basepath, 'pangenome.fasta')
+    PPanGen.write_pangenome(pangenome, pangenome_file)
+    with open(pangenome_file) as infile:
+        assert infile.read() == ('>genome1|protein1\n' + cds_a + '\n' +
+                                 '>genome2|protein5\n' + cds_c + '\n' +
+                                 '>genome2|protein6\n' + cds_d + '\n')
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the cache with the gene predictions of the genomes.
+"""
+
+import os
+
+from CHEWBBACA.utils import prediction_cache
+
+import pytest
+
+
+@pytest.fixture
+def genome(tmp_path):
+    genome_file = tmp_path / 'genome.fasta'
+    genome_file.write_text('>contig1\nATGAAAGTTTAA\n')
+    return str(genome_file)
+
+
+def test_cache_key(genome, tmp_path):
+    """Tests that keys depend on contents and genetic code but not on file names"""
+    renamed = tmp_path / 'renamed.fasta'
+    renamed.write_text(open(genome).read())
+
+    key = prediction_cache.cache_key(genome, 'False', 11)
+    assert prediction_cache.cache_key(str(renamed), False, 11) == key
+    assert prediction_cache.cache_key(genome, 'False', 4) != key
+
+
+def test_store_and_fetch(genome, tmp_path):
+    """Tests that stored files are copied back and that incomplete entries are misses"""
+    cache_directory = str(tmp_path / 'cache')
+    key = prediction_cache.cache_key(genome, 'False', 11)
+    destination = str(tmp_path / 'ORF.txt')
+
+    assert prediction_cache.fetch(cache_directory, key, {'ORF.txt': destination}) is False
+
+    assert prediction_cache.store(cache_directory, key, {'ORF.txt': genome}) is True
+    assert prediction_cache.fetch(cache_directory, key, {'ORF.txt': destination,
+                                                         'CDS.seq': destination}) is False
+    assert prediction_cache.fetch(cache_directory, key, {'ORF.txt': destination}) is True
+    assert open(destination).read() == open(genome).read()
+    assert os.listdir(prediction_cache.entry_path(cache_directory, key)) == ['ORF.txt']
+
+
+def test_prune(genome, tmp_path):
+    """Tests that the least recently used entries are removed first"""
+    cache_directory = str(tmp_path / 'cache')
+    keys = ['aa' + str(i) for i in range(3)]
+    for i, key in enumerate(keys):
+        prediction_cache.store(cache_directory, key, {'ORF.txt': genome})
+        os.utime(prediction_cache.entry_path(cache_directory, key), (i, i))
+    # the first entry is used after the others
+    prediction_cache.fetch(cache_directory, keys[0], {'ORF.txt': str(tmp_path / 'ORF.txt')})
+
+    entry_size = os.path.getsize(genome)
+    assert prediction_cache.prune(cache_directory, 2 * entry_size) == 1
+    assert sorted(os.listdir(os.path.join(cache_directory, 'aa'))) == [keys[0], keys[2]]
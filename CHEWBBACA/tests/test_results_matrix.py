@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the matrix with the results of the allele call.
+"""
+
+import json
+
+from CHEWBBACA.utils import results_matrix, cds_store
+
+
+def test_write_locus(tmp_path):
+    """Tests that calls written by a locus worker are read with their labels"""
+    basepath = str(tmp_path)
+    loci = ['/schema/locusA.fasta', '/schema/locusB.fasta']
+    genomes = ['/genomes/g1.fasta', '/genomes/g2.fasta', '/genomes/g3.fasta']
+    results_matrix.create_matrix(basepath, loci, genomes)
+
+    calls = results_matrix.empty_calls(len(genomes))
+    results_matrix.set_call(calls, 0, results_matrix.EXC, '5', 1, 101, 400)
+    results_matrix.set_call(calls, 1, results_matrix.INF, '*6', 0, 900, 601)
+    results_matrix.set_call(calls, 2, results_matrix.PLOT3)
+    results_matrix.write_locus(basepath, loci[1], calls)
+
+    matrix = results_matrix.open_matrix(basepath)
+    assert matrix['done'].tolist() == [0, 1]
+    assert matrix['status'][0].tolist() == [results_matrix.PENDING] * 3
+
+    row = [results_matrix.allele_label(s, a) for s, a in zip(matrix['status'][1], matrix['allele'][1])]
+    assert row == ['5', 'INF-*6', 'PLOT3']
+
+    names = ['contig1', 'contig2']
+    labels = [results_matrix.contig_label(matrix['status'][1][i], matrix['contig'][1][i],
+                                          matrix['start'][1][i], matrix['end'][1][i], names)
+              for i in range(3)]
+    assert labels == ['contig2&101-400&+', 'contig1&900-601&-', 'PLOT3']
+
+
+def test_contig_indexes(tmp_path):
+    """Tests that contigs are indexed in the order of the CDS store"""
+    basepath = str(tmp_path)
+    cds_store.write_store(basepath, 'genome.fasta', ['ATGTAA'], {'c3': 10, 'c1': 20})
+    assert results_matrix.contig_names(basepath, 'genome.fasta') == ['c3', 'c1']
+    assert results_matrix.contig_indexes(basepath, 'genome.fasta') == {'c3': 0, 'c1': 1}
+
+
+def test_contained(tmp_path):
+    """Tests the file with the alleles that contain or are contained in others"""
+    basepath = str(tmp_path)
+    assert results_matrix.read_contained(basepath, 'locus.fasta') == []
+    results_matrix.write_contained(basepath, 'locus.fasta', [['g1.fasta', '7', 'CD3']])
+    assert results_matrix.read_contained(basepath, 'locus.fasta') == [['g1.fasta', '7', 'CD3']]
+
+
+def test_streaming_writers(tmp_path):
+    """Tests the rows and statistics written for each genome"""
+    basepath = str(tmp_path)
+    loci = ['/schema/locusA.fasta', '/schema/locusB.fasta', '/schema/locusC.fasta']
+    genomes = ['/genomes/g1.fasta', '/genomes/g2.fasta']
+    results_matrix.create_matrix(basepath, loci, genomes)
+    statuses = [(results_matrix.EXC, results_matrix.LNF),
+                (results_matrix.INF, results_matrix.PLOT5),
+                (results_matrix.NIPHEM, results_matrix.EXC)]
+    for locus, locus_statuses in zip(loci, statuses):
+        calls = results_matrix.empty_calls(len(genomes))
+        for genome, status in enumerate(locus_statuses):
+            results_matrix.set_call(calls, genome, status, '1', 0, 1, 9)
+        results_matrix.write_locus(basepath, locus, calls)
+
+    matrix = results_matrix.open_matrix(basepath)
+    assert results_matrix.genome_alleles(matrix, 0) == ['1', 'INF-1', 'NIPHEM']
+    assert results_matrix.genome_contigs(matrix, 1, ['c1']) == ['LNF', 'PLOT5', 'c1&1-9&+']
+    assert results_matrix.genome_statistics(matrix, 0) == [1, 1, 0, 0, 1, 0, 0]
+    assert results_matrix.genome_statistics(matrix, 1) == [1, 0, 1, 1, 0, 0, 0]
+
+    rows = ([name] + results_matrix.genome_alleles(matrix, i) for i, name in enumerate(['g1', 'g2']))
+    output_file = str(tmp_path / 'alleles.json')
+    results_matrix.write_json(output_file, ['locusA', 'locusB', 'locusC'], rows)
+    with open(output_file) as infile:
+        assert json.load(infile) == {'header': ['locusA', 'locusB', 'locusC'],
+                                     'g1': ['1', 'INF-1', 'NIPHEM'],
+                                     'g2': ['LNF', 'PLOT5', '1']}
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the gene prediction with Prodigal.
+"""
+
+import os
+import pickle
+import stat
+
+from CHEWBBACA.utils import runProdigal
+
+import pytest
+
+
+# predicts one CDS and exits with the given code
+PRODIGAL_SCRIPT = """#!/bin/sh
+echo '# Sequence Data: seqnum=1;seqlen=12;seqhdr="contig1 description"'
+echo '>1_1_12_+'
+if [ {0} -ne 0 ]; then
+    echo 'Error: corrupt training file' >&2
+fi
+exit {0}
+"""
+
+
+def fake_prodigal(tmp_path, monkeypatch, exit_code):
+    bin_directory = tmp_path / 'bin'
+    bin_directory.mkdir()
+    prodigal = bin_directory / 'prodigal'
+    prodigal.write_text(PRODIGAL_SCRIPT.format(exit_code))
+    prodigal.chmod(prodigal.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH', str(bin_directory) + os.pathsep + os.environ['PATH'])
+
+
+@pytest.fixture
+def genome(tmp_path):
+    genome_file = tmp_path / 'genome.fasta'
+    genome_file.write_text('>contig1\nATGAAAGTTTAA\n')
+    return str(genome_file)
+
+
+def test_prodigal_success(genome, tmp_path, monkeypatch):
+    """Tests that the predicted coordinates are saved and cached"""
+    fake_prodigal(tmp_path, monkeypatch, 0)
+    cache_directory = str(tmp_path / 'cache')
+
+    assert runProdigal.main(genome, str(tmp_path), 'False', 11, cache_directory) is True
+    with open(genome + '_ORF.txt', 'rb') as infile:
+        assert pickle.load(infile) == {'contig1': [[0, 12]]}
+    assert os.path.isdir(cache_directory)
+
+
+def test_prodigal_failure(genome, tmp_path, monkeypatch):
+    """Tests that the results of a failed run are not saved or cached"""
+    fake_prodigal(tmp_path, monkeypatch, 1)
+    cache_directory = str(tmp_path / 'cache')
+
+    with pytest.raises(ValueError, match='corrupt training file'):
+        runProdigal.main(genome, str(tmp_path), 'False', 11, cache_directory)
+    assert not os.path.exists(genome + '_ORF.txt')
+    assert not os.path.exists(cache_directory)
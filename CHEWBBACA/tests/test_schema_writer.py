@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the write-ahead log of the schema changes.
+"""
+
+import os
+import pickle
+
+from CHEWBBACA.utils import schema_writer
+
+
+def test_commit_locus(tmp_path):
+    """Tests that staged alleles are only added to the schema once"""
+    temppath = str(tmp_path / 'temp')
+    locus = tmp_path / 'locus.fasta'
+    locus.write_text('>locus_1\nATGAAATAA\n')
+    short = str(tmp_path / 'locus_short.fasta')
+    scores = short + '_bsr.txt'
+
+    log = schema_writer.stage_locus(temppath, str(locus),
+                                    {str(locus): [['locus_*2', 'ATGCCCTAA']], short: []},
+                                    [scores, {'1': 20.0, '*2': 21.0}])
+    # nothing is changed until the log is committed
+    assert locus.read_text() == '>locus_1\nATGAAATAA\n'
+    assert not os.path.isfile(scores)
+
+    with open(log) as infile:
+        staged = infile.read()
+    assert schema_writer.commit_all(temppath) == [1, 1]
+    assert locus.read_text() == '>locus_1\nATGAAATAA\n>locus_*2\nATGCCCTAA\n'
+    assert not os.path.isfile(short)
+    with open(scores, 'rb') as infile:
+        assert pickle.load(infile) == {'1': 20.0, '*2': 21.0}
+
+    # committing a log again does not duplicate alleles
+    with open(log, 'w') as outfile:
+        outfile.write(staged)
+    assert schema_writer.commit_all(temppath) == [1, 0]
+    assert locus.read_text() == '>locus_1\nATGAAATAA\n>locus_*2\nATGCCCTAA\n'
+    assert schema_writer.commit_all(temppath) == [0, 0]
+
+
+def test_nothing_to_stage(tmp_path):
+    """Tests that loci without changes have no log"""
+    assert schema_writer.stage_locus(str(tmp_path), 'locus.fasta', {'locus.fasta': []}) is None
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the self-scores computed from the BLOSUM62 matrix.
+"""
+
+from CHEWBBACA.utils import self_scores
+
+import pytest
+
+@pytest.mark.parametrize(
+        "test_input, expected",
+        [({'1': 'MKV'}, {'1': 14}), # Sum of the diagonal
+         ({'1': 'W', '2': 'CC'}, {'1': 11, '2': 18}), # Several proteins in one batch
+         ({'1': 'mkv'}, {'1': 14}), # Lowercase residues
+         ({'1': 'XXMKX'}, {'1': 10}), # Local alignment excludes negative ends
+         ({'1': 'WXW'}, {'1': 21}), # Negative residue inside a positive segment
+         ({'1': ''}, {}), # Empty sequences are not scored
+         ({}, {}), # No proteins
+         ])
+def test_analytic_self_scores(test_input, expected):
+    """Tests the scores computed from the diagonal of the BLOSUM62 matrix"""
+    assert self_scores.analytic_self_scores(test_input) == expected
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the execution of tasks in pools of worker processes.
+"""
+
+from CHEWBBACA.utils import task_runner
+
+import pytest
+
+
+def square(x):
+    return x * x
+
+
+def fail_on_three(x):
+    if x == 3:
+        raise ValueError('three')
+    return x
+
+
+def test_run_tasks_order():
+    """Tests that results are returned in the order of the tasks"""
+    completed = []
+    results = task_runner.run_tasks(square, [(i,) for i in range(20)], 2, chunksize=3,
+                                    progress=lambda done, total: completed.append((done, total)))
+    assert results == [i * i for i in range(20)]
+    assert completed[-1] == (20, 20)
+
+
+def test_task_error():
+    """Tests that exceptions in workers are raised with the failed task"""
+    with pytest.raises(task_runner.TaskError) as error:
+        task_runner.run_tasks(fail_on_three, [(i,) for i in range(10)], 2)
+    assert error.value.task == 3
+    assert 'ValueError: three' in error.value.remote_traceback
+
+
+def test_bounded_in_flight():
+    """Tests that tasks are only created when there is space for them"""
+    created = []
+
+    def tasks():
+        for i in range(30):
+            created.append(i)
+            yield (i,)
+
+    consumed = 0
+    for index, result in task_runner.imap_tasks(square, tasks(), 2, max_in_flight=4):
+        consumed += 1
+        # tasks created and not yet finished, plus the next
+        # task that may be waiting for a free slot
+        assert len(created) - consumed <= 4 + 1
+    assert consumed == 30
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the translation of coding sequences with lookup tables.
+"""
+
+from Bio.Seq import Seq
+
+from CHEWBBACA.utils import translation
+
+import pytest
+
+
+@pytest.mark.parametrize(
+        "test_input, expected",
+        [('ATGAAATTTTAA', [translation.VALID, 'MKF', 'ATGAAATTTTAA', 'sense']), # Forward CDS
+         ('TTAAAATTTCAT', [translation.VALID, 'MKF', 'ATGAAATTTTAA', 'antisense']), # Reverse complement
+         ('AATTTTAAAGTA', [translation.VALID, 'MKF', 'ATGAAATTTTAA', 'revsense']), # Reverse
+         ('TACTTTAAAATT', [translation.VALID, 'MKF', 'ATGAAATTTTAA', 'revantisense']), # Complement
+         ('atgaaattttaa', [translation.VALID, 'MKF', 'ATGAAATTTTAA', 'sense']), # Lowercase bases
+         ('GTGAAATAG', [translation.VALID, 'MK', 'GTGAAATAG', 'sense']), # Alternative start codons are translated to M
+         ('ATGTAATTTTAA', [translation.NOT_CDS, '', 'ATGTAATTTTAA', None]), # In-frame stop codon
+         ('ATGNAATTTTAA', [translation.INVALID_CHARACTERS, '', 'ATGNAATTTTAA', None]), # Ambiguous bases
+         ('ATGAAATTTTA', [translation.INVALID_LENGTH, '', 'ATGAAATTTTA', None]), # Length is not a multiple of 3
+         ('', [translation.NOT_CDS, '', '', None]), # Empty sequence
+         ])
+def test_translate_cds(test_input, expected):
+    """Tests the translation of single sequences in the four orientations"""
+    assert translation.translate_cds(test_input) == expected
+
+
+def test_translate_sequences_biopython():
+    """Tests that batches are translated like Biopython with cds=True"""
+    sequences = ['ATGAAATTTTAA', 'TTGCCCGGGTGA', 'ATGAAATTTTAA'[::-1],
+                 'ATGTAATTTTAA', 'TTAGGGCCCAAACAT', 'ATGCGTTGGAGATAG']
+    for table_id in [1, 4, 11]:
+        for sequence, result in zip(sequences, translation.translate_sequences(sequences, table_id)):
+            if result[0] == translation.VALID:
+                assert result[1] == str(Seq(result[2]).translate(table=table_id, cds=True))
+            else:
+                for orientation in translation.ORIENTATIONS:
+                    with pytest.raises(Exception):
+                        Seq(translation.orient(sequence, orientation)).translate(table=table_id, cds=True)
+
+
+def test_translate_cds_orientations():
+    """Tests that only the given orientations are checked"""
+    result = translation.translate_cds('TTAAAATTTCAT', 11, [translation.SENSE])
+    assert result[0] == translation.NOT_CDS
+
+
+def test_orientation_errors():
+    """Tests the reasons given for each orientation that is not valid"""
+    assert translation.orientation_errors('ATGTAATTTTAA') == [
+        'sense(Extra in frame stop codon found.)',
+        "antisense(First codon 'TTA' is not a start codon)",
+        "revsense(First codon 'AAT' is not a start codon)",
+        "revantisense(First codon 'TAC' is not a start codon)"]
+
+
+def test_translate_ambiguous():
+    """Tests that CDSs with ambiguous bases are only kept when requested"""
+    # 'CTN' always codes for leucine, 'NNN' can code for any amino acid
+    assert translation.translate_cds('ATGCTNNNNTAA', 11, ambiguous=True) == [
+        translation.VALID, 'MLX', 'ATGCTNNNNTAA', 'sense']
+    assert translation.translate_cds('TTANNNCAT', 11, [translation.ANTISENSE], ambiguous=True) == [
+        translation.VALID, 'MX', 'ATGNNNTAA', 'antisense']
+    assert translation.translate_cds('ATGNNNTAA', 11, [translation.ANTISENSE], ambiguous=True)[0] == \
+        translation.INVALID_CHARACTERS
+    assert translation.translate_cds('ATG-AATAA', 11, ambiguous=True)[0] == translation.INVALID_CHARACTERS
@@ -3,48 +3,20 @@ import os
 import argparse
 import multiprocessing
 from Bio import SeqIO
-from Bio.Seq import Seq
 
+try:
+	from utils import translation
+except ImportError:
+	from CHEWBBACA.utils import translation
 
-def reverseComplement(strDNA):
 
-	basecomplement = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A'}
-	strDNArevC = ''
-	for l in strDNA:
-
-		strDNArevC += basecomplement[l]
+def translateSeq(DNASeq,transTable):
+	code, protseq, seq, orientation = translation.translate_cds(DNASeq, transTable)
+	if code != translation.VALID:
+		raise ValueError("sequence is not translatable to a protein")
 
-	return strDNArevC[::-1]
+	reversedSeq = orientation in [translation.ANTISENSE, translation.REVSENSE]
 
-def translateSeq(DNASeq,transTable):
-	seq=DNASeq
-	tableid=transTable
-	reversedSeq=False
-	try:
-		myseq= Seq(seq)
-		protseq=Seq.translate(myseq, table=tableid,cds=True)
-	except:
-		reversedSeq=True
-		try:
-			seq=reverseComplement(seq)
-			myseq= Seq(seq)
-			protseq=Seq.translate(myseq, table=tableid,cds=True)
-
-		except:
-			try:
-				seq=seq[::-1]
-				myseq= Seq(seq)
-				protseq=Seq.translate(myseq, table=tableid,cds=True)
-			except:
-				reversedSeq=False
-				try:
-					seq=seq[::-1]
-					seq=reverseComplement(seq)
-					myseq= Seq(seq)
-					protseq=Seq.translate(myseq, table=tableid,cds=True)
-				except Exception as e:
-					print (e)
-					raise ValueError(e)
 	return protseq,seq,reversedSeq
 
 def curate(geneFile):
@@ -33,6 +33,7 @@ import itertools
 import datetime as dt
 import multiprocessing
 import concurrent.futures
+import numpy as np
 from getpass import getpass
 from collections import Counter
 from multiprocessing import TimeoutError
@@ -41,12 +42,13 @@ from SPARQLWrapper import SPARQLWrapper, JSON
 from urllib.parse import urlparse, urlencode, urlsplit, parse_qs
 
 from Bio import SeqIO
-from Bio.Seq import Seq
 
 try:
     from utils import constants as cnst
+    from utils import translation
 except:
     from CHEWBBACA.utils import constants as cnst
+    from CHEWBBACA.utils import translation
 
 UNIPROT_SERVER = SPARQLWrapper("http://sparql.uniprot.org/sparql")
 
@@ -991,29 +993,35 @@ def get_seqs_dicts(gene_file, gene_id, table_id, min_len, size_threshold, max_pr
     prot_seqs = {}
     seqids_map = {}
     invalid_alleles = []
-    seq_generator = SeqIO.parse(gene_file, 'fasta')
     if max_proteins is None:
-        translated_seqs = [(rec.id, translate_dna(str(rec.seq), table_id, min_len)) for rec in seq_generator]
+        seqids, sequences, proteins, strands, codes = translate_fasta(gene_file, table_id, min_len)
+        translated_seqs = [(seqids[i], translation_result(sequences[i], proteins[i], strands[i],
+                                                          codes[i], table_id, min_len))
+                           for i in range(len(seqids))]
     else:
+        seq_generator = SeqIO.parse(gene_file, 'fasta')
         translated_seqs = []
         exausted = False
         invalid = 0
-        seen = []
+        seen = set()
         while (len(translated_seqs)-invalid) < max_proteins and exausted is False:
-            current_rec = next(seq_generator, None)
-            if current_rec is not None:
-                recid = current_rec.id
-                sequence = str(current_rec.seq)
-                prot = (recid, translate_dna(sequence, table_id, min_len))
+            # translate the next records in a single batch
+            records = list(itertools.islice(seq_generator, max_proteins))
+            exausted = len(records) < max_proteins
+            sequences, proteins, strands, codes = batch_translate([str(rec.seq) for rec in records],
+                                                                  table_id, min_len)
+            for i, rec in enumerate(records):
+                if (len(translated_seqs)-invalid) == max_proteins:
+                    break
+                prot = (rec.id, translation_result(sequences[i], proteins[i], strands[i],
+                                                   codes[i], table_id, min_len))
                 if isinstance(prot[1], str) is True:
                     invalid += 1
                     translated_seqs.append(prot)
                 else:
-                    if prot[1] not in seen:
+                    if (proteins[i], sequences[i], strands[i]) not in seen:
                         translated_seqs.append(prot)
-                        seen.append(prot[1])
-            else:
-                exausted = True
+                        seen.add((proteins[i], sequences[i], strands[i]))
 
     total_seqs = len(translated_seqs)
     for rec in translated_seqs:
@@ -1188,75 +1196,6 @@ def reverse_str(string):
     return revstr
 
 
-def translate_sequence(dna_str, table_id):
-    """ Translate a DNA sequence using the BioPython package.
-
-        Args:
-            dna_str (str): DNA sequence as string type.
-            table_id (int): translation table identifier.
-
-        Returns:
-            protseq (str): protein sequence created by translating
-            the input DNA sequence.
-    """
-
-    myseq_obj = Seq(dna_str)
-    protseq = Seq.translate(myseq_obj, table=table_id, cds=True)
-
-    return protseq
-
-
-def translate_dna_aux(dna_sequence, method, table_id):
-    """ Tries to translate an input DNA sequence in specified orientation
-        and stores exceptions when the input sequence cannot be translated.
-
-        Args:
-            dna_sequence (str): string representing a DNA sequence.
-            method (str): a string specifying the way the sequence will
-            be oriented to attempt translation.
-            table_id (int): translation table identifier.
-
-        Returns:
-            List with following elements if translation is successful:
-                protseq (str): string representing the translated DNA sequence.
-                myseq (str): string representing the DNA sequence in the
-                orientation used to translate it.
-            Otherwise, returns string derived from captured exception.
-    """
-
-    myseq = dna_sequence
-    # try to translate original sequence
-    if method == 'original':
-        try:
-            protseq = translate_sequence(myseq, table_id)
-        except Exception as argh:
-            return argh
-    # try to translate the reverse complement
-    elif method == 'revcomp':
-        try:
-            myseq = reverse_complement(myseq)
-            protseq = translate_sequence(myseq, table_id)
-        except Exception as argh:
-            return argh
-    # try to translate the reverse
-    elif method == 'rev':
-        try:
-            myseq = reverse_str(myseq)
-            protseq = translate_sequence(myseq, table_id)
-        except Exception as argh:
-            return argh
-    # try to translate the reverse reverse complement
-    elif method == 'revrevcomp':
-        try:
-            myseq = reverse_str(myseq)
-            myseq = reverse_complement(myseq)
-            protseq = translate_sequence(myseq, table_id)
-        except Exception as argh:
-            return argh
-
-    return [protseq, myseq]
-
-
 def check_str_alphabet(string, alphabet):
     """ Determine if a string only has characters from specified
         alphabet.
@@ -1304,8 +1243,9 @@ def translate_dna(dna_sequence, table_id, min_len):
     """ Checks if sequence is valid and attempts to translate it,
         calling several functions to ensure that the sequence only has
         'ACTG', is multiple of 3 and that it can be translated in any of 4
-        different orientations. Stores exceptions so that it is possible to
-        understand the sequence could not be translated.
+        different orientations. Determines the reasons why each orientation
+        is not valid so that it is possible to understand why the sequence
+        could not be translated.
 
         Args:
             dna_sequence (str):
@@ -1323,86 +1263,150 @@ def translate_dna(dna_sequence, table_id, min_len):
                 determined that the sequence could not be translated.
     """
 
-    original_seq = dna_sequence.upper()
-    exception_collector = []
-    strands = ['sense', 'antisense', 'revsense', 'revantisense']
-    translating_methods = ['original', 'revcomp', 'rev', 'revrevcomp']
+    sequences, proteins, strands, codes = batch_translate([dna_sequence],
+                                                          table_id, min_len)
+
+    return translation_result(sequences[0], proteins[0], strands[0],
+                              codes[0], table_id, min_len)
 
-    # check if the string is DNA, without ambiguous bases
-    valid_dna = check_str_alphabet(original_seq, 'ACTG')
-    if valid_dna is not True:
-        return valid_dna
 
-    # check if sequence is multiple of three
-    valid_length = check_str_multiple(original_seq, 3)
-    if valid_length is not True:
-        return valid_length
+def translation_error(sequence, code, table_id, min_len):
+    """ Determines why a sequence could not be translated.
 
-    # check if sequence is not shorter than the accepted minimum length
-    if len(original_seq) < min_len:
+        Args:
+            sequence (str): DNA sequence, in uppercase.
+            code (int): validity code determined by :py:func:`batch_translate`.
+            table_id (int): translation table identifier.
+            min_len (int): minimum sequence length.
+
+        Returns:
+            String with the reason why the sequence is not valid, with the
+            reasons for each orientation if the sequence has valid
+            characters and length but is not a CDS in any orientation.
+    """
+
+    if code == translation.INVALID_CHARACTERS:
+        return 'ambiguous or invalid characters'
+    elif code == translation.INVALID_LENGTH:
+        return 'sequence length is not a multiple of 3'
+    elif code == translation.SHORT:
         return 'sequence shorter than {0} nucleotides'.format(min_len)
+    else:
+        return ','.join(translation.orientation_errors(sequence, table_id))
 
-    # try to translate in 4 different orientations
-    # or reach the conclusion that the sequence cannot be translated
-    i = 0
-    translated = False
-    while translated is False:
-        sequence, exception_collector = retranslate(original_seq,
-                                                    translating_methods[i],
-                                                    table_id, strands[i],
-                                                    exception_collector)
-
-        i += 1
-        if i == len(strands) or isinstance(sequence, list) is True:
-            translated = True
-
-    coding_strand = strands[i-1]
-
-    # if the sequence could be translated, return list with protein and DNA
-    # sequence in correct orientation
-    if isinstance(sequence, list):
-        return [sequence, coding_strand]
-    # if it could not be translated, return the string with all exception
-    # that were collected
+
+def translation_result(sequence, protein, strand, code, table_id, min_len):
+    """ Converts the result of :py:func:`batch_translate` for one
+        sequence into the value returned by :py:func:`translate_dna`.
+    """
+
+    if code == translation.VALID:
+        return [[protein, sequence], strand]
+    else:
+        return translation_error(sequence, code, table_id, min_len)
+
+
+def translate_chunk(chunk):
+    """ Translates a chunk of DNA sequences.
+
+        Args:
+            chunk (list): list with the DNA sequences, the translation
+            table identifier, the minimum sequence length and if
+            sequences with ambiguous bases are translated.
+
+        Returns:
+            List with one list per sequence with the validity code,
+            protein sequence, DNA sequence and orientation (see
+            `translation.translate_sequences`).
+    """
+
+    sequences, table_id, min_len, ambiguous = chunk
+
+    results = translation.translate_sequences(sequences, table_id,
+                                              ambiguous=ambiguous)
+    for sequence, result in zip(sequences, results):
+        # length is checked before translation, as in translate_dna
+        if result[0] in [translation.VALID, translation.NOT_CDS] \
+                and len(sequence) < min_len:
+            result[:] = [translation.SHORT, '', sequence.upper(), None]
+
+    return results
+
+
+def batch_translate(sequences, table_id, min_len=0, pool=None,
+                    chunk_size=cnst.TRANSLATION_CHUNK, ambiguous=False):
+    """ Translates a list of DNA sequences, checking the four orientations
+        of each sequence.
+
+        Args:
+            sequences (list): DNA sequences.
+            table_id (int): translation table identifier.
+            min_len (int): sequences shorter than this value are not
+            translated.
+            pool (multiprocessing.Pool): pool used to translate chunks of
+            sequences in parallel. Chunks are translated in the current
+            process if no pool is given (e.g.: inside pool workers).
+            chunk_size (int): number of sequences per chunk.
+            ambiguous (bool): translate sequences with ambiguous bases
+            (see `translation.translate_ambiguous`).
+
+        Returns:
+            List with following elements:
+                sequences (list): DNA sequences in the orientation that was
+                translated, or in uppercase as given if they are not valid.
+                proteins (list): protein sequences, empty strings for the
+                sequences that are not valid.
+                strands (list): orientation that was translated ('sense',
+                'antisense', 'revsense' or 'revantisense'), None for the
+                sequences that are not valid.
+                codes (numpy.ndarray): validity code of each sequence (see
+                the codes in the translation module).
+    """
+
+    chunks = [[sequences[i:i+chunk_size], table_id, min_len, ambiguous]
+              for i in range(0, len(sequences), chunk_size)]
+
+    if pool is None:
+        translated = [translate_chunk(chunk) for chunk in chunks]
     else:
-        exception_str = ','.join(exception_collector)
-        return exception_str
+        translated = pool.map(translate_chunk, chunks)
+
+    results = [result for chunk in translated for result in chunk]
 
+    codes = np.array([result[0] for result in results], dtype=np.int8)
+    proteins = [result[1] for result in results]
+    translated_seqs = [result[2] for result in results]
+    strands = [result[3] for result in results]
 
-def retranslate(sequence, method, table_id, strands, exception_collector):
-    """ Sends sequence for translation and collects exceptions when
-        the sequence cannot be translated.
+    return [translated_seqs, proteins, strands, codes]
+
+
+def translate_fasta(fasta_file, table_id, min_len=0, pool=None, ambiguous=False):
+    """ Translates all the DNA sequences in a FASTA file
+        (e.g.: the CDSs of a genome or the alleles of a locus).
 
         Args:
-            sequence (str): string representing a DNA sequence.
-            method (str): a string specifying the sequence orientation
-            that should be used to attempt translation.
+            fasta_file (str): path to the FASTA file.
             table_id (int): translation table identifier.
-            strands (list): list with 4 different orientations that can
-            be checked.
-            exception_collector (list): list used to store all exceptions
-            arising from translation attempts.
+            min_len (int): sequences shorter than this value are not
+            translated.
+            pool (multiprocessing.Pool): pool used to translate chunks
+            of sequences in parallel.
+            ambiguous (bool): translate sequences with ambiguous bases.
 
         Returns:
-            A list with following elements, if the sequence can be translated:
-                translated_seq (list): a list with the protein sequence and
-                with the DNA sequence in the orientation used for translation.
-                exception_collector (list): a list with the exceptions that are
-                captured when the sequence could not be translated.
-            Otherwise:
-                translated_seq (str): a string with the exception/reason why
-                the sequence could not be translated.
-                exception_collector (list): list with all exception that have
-                been captured during translation attempts of the current
-                sequence.
+            List with the sequence identifiers followed by the elements
+            returned by :py:func:`batch_translate`.
     """
 
-    translated_seq = translate_dna_aux(sequence, method, table_id)
-    if not isinstance(translated_seq, list):
-        exception_collector.append('{0}({1})'.format(strands,
-                                                     translated_seq.args[0]))
+    seqids = []
+    sequences = []
+    for rec in SeqIO.parse(fasta_file, 'fasta'):
+        seqids.append(rec.id)
+        sequences.append(str(rec.seq))
 
-    return [translated_seq, exception_collector]
+    return [seqids] + batch_translate(sequences, table_id, min_len, pool,
+                                      ambiguous=ambiguous)
 
 
 def is_url(url):
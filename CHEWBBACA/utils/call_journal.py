@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Purpose
+-------
+This module keeps an append-only journal of the work done by a locus
+worker during the allele call, so that a worker that is interrupted
+(killed, node preempted...) continues from the last genome it called
+when the run is resumed, instead of calling the locus from the start.
+
+The journal of a locus is a text file with one record per line:
+
+    - 'A', allele identifier, 1 if it is a new representative, DNA and
+      protein sequences: allele inferred by the worker.
+    - 'R', genome, allele identifier, tag: allele that is contained in
+      or contains another allele of the locus.
+    - 'C', genome index and the fields of the call in the results matrix.
+
+The records of a genome are written together, after the call of the
+genome, and a record is only valid if the line is complete. Replaying
+the journal restores the calls and the alleles inferred before the
+interruption, with the same identifiers. Alleles that were already
+written to the schema are recognized by their identifiers and are not
+written again.
+
+Code documentation
+------------------
+"""
+
+import os
+
+try:
+    from utils import results_matrix
+except:
+    from CHEWBBACA.utils import results_matrix
+
+
+def journal_path(temppath, locus):
+    """ Gets the path to the journal of a locus."""
+
+    return os.path.join(temppath, os.path.basename(locus) + '_journal.tsv')
+
+
+def open_journal(temppath, locus):
+    """ Opens the journal of a locus to add records.
+
+        Returns
+        -------
+        list
+            File object and list with the records of the
+            genome that is being called.
+    """
+
+    return [open(journal_path(temppath, locus), 'a'), []]
+
+
+def add_allele(journal, allele_name, dna, protein, representative):
+    """ Adds an inferred allele to the records of the genome
+        that is being called.
+    """
+
+    journal[1].append('\t'.join(['A', allele_name, str(int(representative)), dna, protein]))
+
+
+def add_contained(journal, record):
+    """ Adds an allele that is contained in or contains another
+        allele (genome, allele identifier and tag).
+    """
+
+    journal[1].append('\t'.join(['R'] + [str(field) for field in record]))
+
+
+def add_call(journal, genome_index, calls):
+    """ Writes the call of a genome, with the other records of the
+        genome, and flushes the journal.
+
+        Parameters
+        ----------
+        journal : list
+            Journal returned by :py:func:`open_journal`.
+        genome_index : int
+            Index of the genome.
+        calls : dict
+            Arrays with the calls of the locus (see
+            :py:func:`results_matrix.empty_calls`).
+    """
+
+    values = [str(calls[name][genome_index]) for name, dtype in results_matrix.COLUMNS]
+    journal[1].append('\t'.join(['C', str(genome_index)] + values))
+    journal[0].write(''.join(record + '\n' for record in journal[1]))
+    journal[0].flush()
+    journal[1] = []
+
+
+def close_journal(journal):
+    """ Closes the journal of a locus."""
+
+    journal[0].close()
+
+
+def read_journal(temppath, locus):
+    """ Reads the journal of a locus.
+
+        Records of a genome whose call was not written are
+        discarded, and removed from the file, so that the
+        genome is called again.
+
+        Parameters
+        ----------
+        temppath : str
+            Path to the temporary directory of the allele call.
+        locus : str
+            Path to the locus file.
+
+        Returns
+        -------
+        list
+            Dictionary with genome indexes as keys and lists with the
+            fields of the call as values, list with the inferred alleles
+            (identifier, representative, DNA and protein sequences) and
+            list with the contained alleles records.
+    """
+
+    called = {}
+    alleles = []
+    contained = []
+
+    path = journal_path(temppath, locus)
+    if not os.path.isfile(path):
+        return [called, alleles, contained]
+
+    pending_alleles = []
+    pending_contained = []
+    # size of the journal up to the last call
+    valid = 0
+    position = 0
+    with open(path, 'rb') as infile:
+        for line in infile:
+            position += len(line)
+            # last line may be incomplete
+            if not line.endswith(b'\n'):
+                break
+            record = line.decode('ascii').rstrip('\n').split('\t')
+            if record[0] == 'A' and len(record) == 5:
+                pending_alleles.append([record[1], record[2] == '1', record[3], record[4]])
+            elif record[0] == 'R' and len(record) == 4:
+                pending_contained.append(record[1:])
+            elif record[0] == 'C' and len(record) == 2 + len(results_matrix.COLUMNS):
+                called[int(record[1])] = [int(value) for value in record[2:]]
+                alleles.extend(pending_alleles)
+                contained.extend(pending_contained)
+                pending_alleles = []
+                pending_contained = []
+                valid = position
+            else:
+                break
+
+    # discard incomplete records, new records are added after the last call
+    if valid < os.path.getsize(path):
+        with open(path, 'r+b') as outfile:
+            outfile.truncate(valid)
+
+    return [called, alleles, contained]
+
+
+def restore_calls(calls, called):
+    """ Sets the calls read from a journal in the arrays
+        with the calls of a locus.
+    """
+
+    for genome_index, values in called.items():
+        for (name, dtype), value in zip(results_matrix.COLUMNS, values):
+            calls[name][genome_index] = value
+
+
+def remove_journal(temppath, locus):
+    """ Removes the journal of a locus that is done."""
+
+    path = journal_path(temppath, locus)
+    if os.path.isfile(path):
+        os.remove(path)
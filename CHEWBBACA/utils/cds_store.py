@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Purpose
+-------
+This module creates and reads the stores with the coding sequences (CDSs)
+of a genome used during the allele call. Each store has three files:
+
+    - '<genome>_CDS.seq': the DNA sequences of all CDSs, concatenated
+      in the order they were numbered ('&protein<N>&' in the CDS
+      identifiers).
+    - '<genome>_CDS.offsets': array with the start position of each CDS
+      in the sequences file and the total length of the sequences file.
+      The first CDS starts at position 0.
+    - '<genome>_contigs.txt': dictionary with the length of each contig.
+
+Stores are written once, before the allele call, and opened read-only by
+the processes that classify each locus. The sequences and offsets are
+memory-mapped, so only the CDSs that are needed are read and the operating
+system shares the pages between processes.
+
+Code documentation
+------------------
+"""
+
+import os
+import pickle
+
+import numpy as np
+
+
+def store_paths(basepath, genome_file):
+    """ Paths to the files of the CDS store of a genome.
+
+        Returns
+        -------
+        list
+            Paths to the sequences, offsets and contigs files.
+    """
+
+    prefix = os.path.join(basepath, os.path.basename(genome_file))
+
+    return [prefix + '_CDS.seq', prefix + '_CDS.offsets',
+            prefix + '_contigs.txt']
+
+
+def open_writer(basepath, genome_file):
+    """ Starts writing the CDS store of a genome. CDSs are added
+        one at a time, in the order given by their numbers.
+
+        Returns
+        -------
+        list
+            Open handle to the sequences file and the list
+            with the offsets of the CDSs added so far.
+    """
+
+    seq_file = store_paths(basepath, genome_file)[0]
+
+    return [open(seq_file, 'wb'), [0]]
+
+
+def add_cds(writer, sequence):
+    """ Adds the DNA sequence of the next CDS to a store. """
+
+    handle, offsets = writer
+    data = sequence.encode('ascii')
+    handle.write(data)
+    offsets.append(offsets[-1] + len(data))
+
+
+def close_writer(writer, basepath, genome_file, contig_lengths):
+    """ Finishes writing the CDS store of a genome.
+
+        Parameters
+        ----------
+        writer : list
+            Writer returned by :py:func:`open_writer`.
+        basepath : str
+            Path to the directory where the store is created.
+        genome_file : str
+            Path to the genome file.
+        contig_lengths : dict
+            Contig identifiers as keys and contig lengths as values.
+    """
+
+    seq_file, offsets_file, contigs_file = store_paths(basepath, genome_file)
+
+    handle, offsets = writer
+    handle.close()
+    np.array(offsets, dtype=np.int64).tofile(offsets_file)
+
+    with open(contigs_file, 'wb') as f:
+        pickle.dump(contig_lengths, f)
+
+
+def write_store(basepath, genome_file, sequences, contig_lengths):
+    """ Writes the CDS store of a genome.
+
+        Parameters
+        ----------
+        basepath : str
+            Path to the directory where the store is created.
+        genome_file : str
+            Path to the genome file.
+        sequences : iterable
+            DNA sequences of the CDSs, ordered by CDS number (the
+            first sequence is the CDS with number 1).
+        contig_lengths : dict
+            Contig identifiers as keys and contig lengths as values.
+    """
+
+    writer = open_writer(basepath, genome_file)
+    for sequence in sequences:
+        add_cds(writer, sequence)
+    close_writer(writer, basepath, genome_file, contig_lengths)
+
+
+def open_store(basepath, genome_file):
+    """ Opens the CDS store of a genome in read-only mode.
+
+        Returns
+        -------
+        list
+            Memory-mapped sequences and offsets and the
+            dictionary with the contig lengths.
+    """
+
+    seq_file, offsets_file, contigs_file = store_paths(basepath, genome_file)
+
+    offsets = np.memmap(offsets_file, dtype=np.int64, mode='r')
+    # empty files cannot be memory-mapped
+    if offsets[-1] > 0:
+        sequences = np.memmap(seq_file, dtype=np.uint8, mode='r')
+    else:
+        sequences = np.zeros(0, dtype=np.uint8)
+
+    with open(contigs_file, 'rb') as f:
+        contig_lengths = pickle.load(f)
+
+    return [sequences, offsets, contig_lengths]
+
+
+def cds_number(cdsid):
+    """ Gets the number of a CDS from its identifier
+        ('<contig>&protein<N>&<start>-<end>').
+    """
+
+    return int(cdsid.split('&')[-2].replace('protein', ''))
+
+
+def get_cds(store, cdsid):
+    """ Gets the DNA sequence of a CDS.
+
+        Parameters
+        ----------
+        store : list
+            Store returned by :py:func:`open_store`.
+        cdsid : str
+            CDS identifier, with or without the leading '>'.
+
+        Returns
+        -------
+        str
+            The DNA sequence of the CDS.
+    """
+
+    sequences, offsets, contig_lengths = store
+    number = cds_number(cdsid)
+
+    return sequences[offsets[number-1]:offsets[number]].tobytes().decode('ascii')
+
+
+def contig_length(store, contig):
+    """ Gets the length of a contig from a CDS store."""
+
+    return store[2][contig]
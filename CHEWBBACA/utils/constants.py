@@ -13,6 +13,9 @@ DESCRIPTION
 
 """
 
+import os
+
+
 CHEWIE_VERSIONS = ['2.5.0', '2.5.1', '2.5.2', '2.5.3', '2.5.4', '2.5.5']
 
 # BSR
@@ -47,6 +50,12 @@ GENETIC_CODES = {1: 'Standard',
 
 FASTA_SUFFIXES = ['.fasta', '.fna', '.ffn', '.fa']
 
+# number of sequences translated by each task of a batch translation
+TRANSLATION_CHUNK = 1000
+
+# directory with the gene predictions reused between runs
+PREDICTION_CACHE = os.path.join(os.path.expanduser('~'), '.chewBBACA', 'prediction_cache')
+
 # NS related constants
 HEADERS_GET_ = {'Authorization': None,
 			   	'accept': 'application/octet-stream'}
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Purpose
+-------
+This module supports incremental allele calling: genomes that already
+have a profile in a previous AlleleCall results folder, or in the
+profiles database of the schema, are not called again, and the rows of
+the new genomes are appended to the previous results.
+
+Allele identifiers that the SyncSchema process reassigns (e.g. novel
+alleles '*5' that receive an identifier from the Chewie-NS) are recorded
+in a log in the schema directory. Reassignments recorded after the
+previous results were last updated are applied to their rows before the
+new rows are appended, so that earlier inferred alleles keep matching
+the schema identifiers.
+
+Code documentation
+------------------
+"""
+
+import os
+import csv
+import json
+import time
+import sqlite3
+import datetime as dt
+
+
+# log with the allele identifiers reassigned by each sync
+REASSIGNMENTS_LOG = '.allele_reassignments'
+# files of a results folder that have one row per genome
+RESULTS_FILES = ['results_alleles.tsv', 'results_statistics.tsv', 'results_contigsInfo.tsv']
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def record_reassignments(schema_directory, reassigned):
+    """ Adds the allele identifiers reassigned by a sync
+        process to the log in the schema directory.
+
+        Parameters
+        ----------
+        schema_directory : str
+            Path to the schema directory.
+        reassigned : dict
+            Loci files names as keys and dictionaries with the
+            previous allele identifiers as keys and the new
+            identifiers as values.
+    """
+
+    # new identifiers may include the locus identifier
+    loci = {locus: {old: str(new).split('_')[-1] for old, new in alleles.items()}
+            for locus, alleles in reassigned.items()}
+    entry = {'date': dt.datetime.now().strftime(DATE_FORMAT),
+             'timestamp': time.time(), 'loci': loci}
+
+    with open(os.path.join(schema_directory, REASSIGNMENTS_LOG), 'a') as outfile:
+        outfile.write(json.dumps(entry) + '\n')
+
+
+def read_reassignments(schema_directory, since=None):
+    """ Reads the allele identifiers reassigned after a date.
+
+        Parameters
+        ----------
+        schema_directory : str
+            Path to the schema directory.
+        since : float
+            Timestamp (e.g. modification time of a results
+            file), reassignments recorded before it are ignored.
+            All reassignments are returned if None.
+
+        Returns
+        -------
+        list
+            One dictionary per sync process, in the order they
+            were recorded, with loci files names as keys and
+            the reassigned identifiers as values.
+    """
+
+    log_file = os.path.join(schema_directory, REASSIGNMENTS_LOG)
+    if not os.path.isfile(log_file):
+        return []
+
+    reassignments = []
+    with open(log_file, 'r') as infile:
+        for line in infile:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if since is None or entry['timestamp'] >= since:
+                reassignments.append(entry['loci'])
+
+    return reassignments
+
+
+def reassign_allele(label, reassignments):
+    """ Applies reassignments to an allele call label, keeping
+        the 'INF-' prefix of inferred alleles.
+
+        Parameters
+        ----------
+        label : str
+            Label in the alleles matrix ('*5', 'INF-*5', 'LNF', ...).
+        reassignments : list
+            Dictionaries with previous identifiers as keys and
+            new identifiers as values, applied in order.
+
+        Returns
+        -------
+        str
+            The label with the current identifier.
+    """
+
+    prefix = 'INF-' if label.startswith('INF-') else ''
+    allele_id = label[len(prefix):]
+    for alleles in reassignments:
+        allele_id = alleles.get(allele_id, allele_id)
+
+    return prefix + allele_id
+
+
+def results_genomes(results_directory):
+    """ Gets the names of the genomes in a results folder
+        (first column of the alleles matrix).
+    """
+
+    with open(os.path.join(results_directory, RESULTS_FILES[0]), 'r') as infile:
+        reader = csv.reader(infile, delimiter='\t')
+        next(reader)
+        return set(row[0] for row in reader if len(row) > 0)
+
+
+def database_file(path):
+    """ Gets the path to the profiles database from the path to
+        the database or to the directory that contains it.
+        Returns None if the path is not a profiles database.
+    """
+
+    if os.path.isfile(path) and path.endswith('.db'):
+        return path
+    elif os.path.isfile(os.path.join(path, 'profiles.db')):
+        return os.path.join(path, 'profiles.db')
+
+    return None
+
+
+def database_genomes(db_file):
+    """ Gets the names of the samples in a profiles database."""
+
+    conn = sqlite3.connect(db_file)
+    names = set(row[0] for row in conn.execute('SELECT name FROM samples;'))
+    conn.close()
+
+    return names
+
+
+def new_genomes(genomes, previous):
+    """ Determines the genomes that are not in previous results.
+
+        Parameters
+        ----------
+        genomes : list
+            Paths to the genome files.
+        previous : str
+            Path to a results folder, to the directory with the
+            profiles database of a schema or to the database file.
+
+        Returns
+        -------
+        list
+            Paths to the genomes that have no profile in the
+            previous results.
+    """
+
+    db_file = database_file(previous)
+    if db_file is not None:
+        present = database_genomes(db_file)
+        # samples are stored without the '.fasta' suffix
+        return [genome for genome in genomes
+                if os.path.basename(genome).rstrip('.fasta') not in present]
+
+    present = results_genomes(previous)
+
+    return [genome for genome in genomes if os.path.basename(genome) not in present]
+
+
+def update_results(previous_directory, new_directory, schema_directory):
+    """ Appends the rows of a results folder to the files of a
+        previous results folder, after applying the identifiers
+        reassigned since the previous results were last updated.
+
+        Parameters
+        ----------
+        previous_directory : str
+            Path to the results folder that is updated.
+        new_directory : str
+            Path to the results folder with the new genomes.
+        schema_directory : str
+            Path to the schema directory.
+
+        Returns
+        -------
+        list
+            Number of rows appended and number of previous rows
+            with reassigned identifiers.
+
+        Raises
+        ------
+        ValueError
+            If the results have different loci.
+    """
+
+    previous_alleles = os.path.join(previous_directory, RESULTS_FILES[0])
+    new_alleles = os.path.join(new_directory, RESULTS_FILES[0])
+    with open(previous_alleles, 'r') as previous, open(new_alleles, 'r') as new:
+        if previous.readline().rstrip('\n') != new.readline().rstrip('\n'):
+            raise ValueError('Results in {0} were determined for a different set '
+                             'of loci.'.format(previous_directory))
+
+    # reassignments recorded after the matrix was last written
+    reassignments = read_reassignments(schema_directory, os.path.getmtime(previous_alleles))
+    altered = 0
+    if len(reassignments) > 0:
+        altered = reassign_results(previous_alleles, reassignments)
+
+    appended = 0
+    for file in RESULTS_FILES:
+        previous_file = os.path.join(previous_directory, file)
+        new_file = os.path.join(new_directory, file)
+        if not os.path.isfile(previous_file) or not os.path.isfile(new_file):
+            continue
+        with open(new_file, 'r') as infile, open(previous_file, 'a') as outfile:
+            # skip the header, rows start with a newline
+            infile.readline()
+            rows = 0
+            for line in infile:
+                outfile.write('\n' + line.rstrip('\n'))
+                rows += 1
+        if file == RESULTS_FILES[0]:
+            appended = rows
+
+    return [appended, altered]
+
+
+def reassign_results(matrix_file, reassignments):
+    """ Rewrites an alleles matrix with reassigned identifiers,
+        one row at a time.
+
+        Parameters
+        ----------
+        matrix_file : str
+            Path to the TSV file with the alleles matrix.
+        reassignments : list
+            Dictionaries returned by :py:func:`read_reassignments`.
+
+        Returns
+        -------
+        int
+            Number of rows with reassigned identifiers.
+    """
+
+    temp_file = matrix_file + '.tmp'
+    altered = 0
+    with open(matrix_file, 'r') as infile, open(temp_file, 'w') as outfile:
+        header = infile.readline().rstrip('\n')
+        outfile.write(header)
+        # reassignments of each column
+        columns = [[entry[locus] for entry in reassignments if locus in entry]
+                   for locus in header.split('\t')[1:]]
+        for line in infile:
+            row = line.rstrip('\n').split('\t')
+            alleles = [reassign_allele(label, columns[i]) if len(columns[i]) > 0 else label
+                       for i, label in enumerate(row[1:])]
+            if alleles != row[1:]:
+                altered += 1
+            outfile.write('\n' + '\t'.join([row[0]] + alleles))
+
+    os.replace(temp_file, matrix_file)
+
+    return altered
+
+
+def latest_results(output_directory):
+    """ Gets the most recent results folder ('results_<date>')
+        in the output directory of the AlleleCall process.
+    """
+
+    results_folders = [file for file in os.listdir(output_directory)
+                       if file.startswith('results_')
+                       and os.path.isdir(os.path.join(output_directory, file))]
+    # dates in the format %Y%m%dT%H%M%S sort chronologically
+    results_folders = sorted(results_folders, key=lambda x: x.split('_')[-1])
+
+    return os.path.join(output_directory, results_folders[-1])
@@ -1,26 +1,16 @@
 #!/usr/bin/env python3
 
-import sys
 from Bio import SeqIO
-from Bio.Seq import Seq
-from Bio.Blast import NCBIXML
 from Bio.Blast.Applications import NcbiblastpCommandline
 import os
 import pickle
-import multiprocessing
 import shutil
 import warnings
 
 try:
-	from utils import CommonFastaFunctions
+	from utils import CommonFastaFunctions, self_scores, translation, task_runner
 except ImportError:
-	from CHEWBBACA.utils import CommonFastaFunctions
-
-#~ from cStringIO import StringIO
-try:
-	from StringIO import StringIO
-except ImportError:
-	from io import StringIO
+	from CHEWBBACA.utils import CommonFastaFunctions, self_scores, translation, task_runner
 
 
 def custom_formatwarning(msg, *args, **kwargs):
@@ -31,257 +21,261 @@ def custom_formatwarning(msg, *args, **kwargs):
 warnings.formatwarning = custom_formatwarning
 
 
-def get_Short (gene,auxBar):
-	blastPath='blastp'
-	genesList=[str(gene)]
-
+# BSR interval of the alleles that are added as representatives
+MIN_REP_BSR=0.6
+MAX_REP_BSR=0.7
+
+
+# e-value of the hits of the representatives against each allele
+MAX_EVALUE=0.001
+
+
+def best_bsr(hits,selfscores):
+	"""Gets the BSR used to decide if an allele is a representative from
+	the hits of the representatives against the allele, in the order of
+	the representatives, as (representative, raw score) tuples. The BSR
+	of a hit is only kept if both the BSR and the score are higher than
+	those of the hits before it.
+
+	The BSR of a hit is the score divided by the self-score of the
+	representative of the hit. Alleles were compared before by taking the
+	number at the end of the BLAST query identifier as the position of
+	the representative, that is only the representative when BLAST names
+	the queries by their order ('Query_<N>'), and not when it reports the
+	allele identifiers."""
+	bestbsr=0
+	bestscore=0
+	for rep,score in hits:
+		bsr=float(score)/float(selfscores[rep])
+		if bsr>bestbsr and score>bestscore and bsr>=MIN_REP_BSR:
+			bestbsr=bsr
+			bestscore=score
+
+	return bestbsr
+
+def representative_hits(out,proteins,position,dbsize):
+	"""Gets the hits of a representative against the alleles that were not
+	checked yet from the tabular BLAST output ('qseqid score evalue stitle').
+	The alleles were compared before against a database with a single
+	allele, and the e-value of a search depends on the size of the
+	database, so the e-value of each hit in a database of dbsize residues
+	is converted to the e-value in a database with only the allele.
+
+	Args:
+		out (str): BLAST output.
+		proteins (list): protein of each allele.
+		position (int): index of the first allele that was not checked.
+		dbsize (int): database size used in the search.
+	Returns:
+		hits (list): alleles and raw scores of the hits, in the order of
+		the BLAST output.
+	"""
+	hits=[]
+	for line in out.splitlines():
+		if line=='':
+			continue
+		qseqid,score,evalue,stitle=line.split('\t',3)
+		allele=int(stitle.split(' ',1)[0])
+		if allele>=position and float(evalue)*len(proteins[allele])/dbsize<=MAX_EVALUE:
+			hits.append((allele,int(score)))
+
+	return hits
+
+def select_representatives(proteins,selfscores,blastPath,tempgene):
+	"""Selects the representatives of a locus. The first allele is a
+	representative and each of the following alleles is a representative
+	if the best BSR of the representatives before it against it is
+	between MIN_REP_BSR and MAX_REP_BSR, as when alleles are compared one
+	at a time. All alleles are added to a single BLAST database and each
+	iteration BLASTs the last representative against the database, until
+	the next allele that is a representative.
+
+	The database size is set to the length of the longest allele that
+	was not checked, and the e-values are converted to the single allele
+	searches by :py:func:`representative_hits` (up to the length
+	correction of BLAST, that depends on the number of sequences).
+
+	Args:
+		proteins (list): protein of each allele, in the order of the alleles.
+		selfscores (list): self-score of each protein.
+		blastPath (str): path to the blastp executable.
+		tempgene (str): directory for the BLAST database.
+	Returns:
+		reps (list): indexes of the representatives.
+	"""
+	reps=[0]
+	if len(proteins)==1:
+		return reps
+
+	allelesFile=os.path.join(tempgene,'alleles_protein.fasta')
+	with open(allelesFile,'w') as f:
+		f.write(''.join('>{0}\n{1}\n'.format(i,protein) for i,protein in enumerate(proteins)))
+	Gene_Blast_DB_name=CommonFastaFunctions.Create_Blastdb(allelesFile,1,True)
+
+	# hits of the representatives against each allele, in the order of the representatives
+	hits={}
+	position=1
+	while position<len(proteins):
+		rep=reps[-1]
+		lengths=[len(protein) for protein in proteins[position:]]
+		dbsize=max(lengths)
+		# e-value that keeps the hits against the shortest allele
+		evalue=MAX_EVALUE*dbsize/min(lengths)
+		cline=NcbiblastpCommandline(cmd=blastPath,db=Gene_Blast_DB_name,evalue=evalue,dbsize=dbsize,
+									outfmt='6 qseqid score evalue stitle',max_target_seqs=len(proteins),num_threads=1)
+		out,err=cline(stdin='>{0}\n{1}\n'.format(rep,proteins[rep]))
+		for allele,score in representative_hits(out,proteins,position,dbsize):
+			hits.setdefault(allele,[]).append((rep,score))
+
+		# alleles are checked until the next representative, the
+		# alleles after it also have to be compared to it
+		while position<len(proteins):
+			allele=position
+			position+=1
+			bestbsr=best_bsr(hits.pop(allele,[]),selfscores)
+			if bestbsr>=MIN_REP_BSR and bestbsr<MAX_REP_BSR:
+				reps.append(allele)
+				break
+
+	return reps
+
+def get_Short (gene,auxBar,analytic=False,blastPath='blastp'):
+	"""Validates the alleles of a locus and selects its representatives.
+	Alleles that are not valid CDSs are removed from the locus file and
+	alleles in other orientations are written in the coding orientation.
+	The representatives are written to the short file of the locus and
+	their self-scores to the BSR file.
+
+	Args:
+		gene (str): path to the locus file.
+		auxBar (list): loci that print the progress.
+		analytic (bool): compute the self-scores from the scoring matrix.
+		blastPath (str): path to the blastp executable.
+	Returns:
+		True
+	"""
 	pathtoDir=os.path.join(os.path.dirname(gene),"short")
-
-	try:
-		if not os.path.exists(pathtoDir):
-			os.makedirs(pathtoDir)
-	except Exception as e:
-		pass
-		#~ print (e)
-
-
-	for gene in genesList:
-		#~ print ("processing " +gene)
-
-		pathtoDir=os.path.join(os.path.dirname(gene),"short")
-
-		shortgene= os.path.join(os.path.dirname(gene),"short",os.path.basename(gene))
-		shortgene= shortgene.replace(".fasta","_short.fasta")
-
-		tempgene= os.path.join(os.path.dirname(shortgene),"temp",os.path.basename(gene).replace(".fasta",""))
-		tempgeneProt= os.path.join(tempgene,os.path.basename(gene))
-		tempgeneProt2= os.path.join(tempgene,os.path.basename(gene))
-		tempgeneProt2= tempgeneProt2.replace(".fasta","2.fasta")
-
-		tempgeneProtFasta=''
-		tempgeneProt2Fasta=''
-		shortfasta=''
-
-		if not os.path.exists(tempgene):
-			os.makedirs(tempgene)
-
-		#~ gene_fp2 = HTSeq.FastaReader(gene)
-
-		counter=0
-		alleleI=0
-		var={}
-
-		geneScorePickle=shortgene+'_bsr.txt'
-		selfscores=[]
-		fasta_corrected=''
-		total_alleles=0
-		error_alleles=0
-		corrected_alleles=0
-		for allele in SeqIO.parse(gene, "fasta"):
-			total_alleles+=1
-			try:
-				translatedSequence,sortedSeq, originalSeq=translateSeq(str(allele.seq.upper()))
-
-				if not originalSeq:
-					fasta_corrected+='>'+str(allele.name)+'\n'+str(sortedSeq) + '\n'
-					corrected_alleles+=1
-				else:
-					fasta_corrected+='>'+str(allele.name)+'\n'+str(str(allele.seq.upper())) + '\n'
-				#~ alleleI=int(((allele.name).split("_"))[-1])
-				alleleI=int(((allele.name).split("_"))[-1])
-				if counter<1:
-
-					#add first allele as short and calculate self bsr
-
-					counter+=1
-
-					shortfasta='>'+str(allele.name)+'\n'+str(allele.seq.upper()) + '\n'
-
-
-
-					tempgeneProtFasta='>'+str(allele.name)+'\n'+str(translatedSequence) + '\n'
-
-					Gene_Blast_DB_name = CommonFastaFunctions.Create_Blastdb_no_fasta(tempgeneProt, 1, True,tempgeneProtFasta)
-
-
-					# --- get BLAST score ratio --- #
-
-					cline = NcbiblastpCommandline(cmd=blastPath, db=Gene_Blast_DB_name, evalue=0.001, outfmt=5,num_threads=1)
-					out, err = cline(stdin=tempgeneProtFasta)
-					psiblast_xml = StringIO(out)
-					blast_records = NCBIXML.parse(psiblast_xml)
-
-
-					allelescore=[]
-
-
-					for blast_record in blast_records:
-
-						for alignment in blast_record.alignments:
-
-							for match in alignment.hsps:
-
-								allelescore.append(int(match.score))
-
-					selfbsr=float(allelescore[0])/float(allelescore[0])
-
-					var[alleleI]= allelescore[0]
-
-					selfscores.append(allelescore[0])
-
-				else:
-
-					#calculate selfbsr for each allele
-
-					translatedSequence,sortedSeq, originalSeq=translateSeq(str(allele.seq.upper()))
-
-
-					tempgeneProt2Fasta='>'+str(allele.name)+'\n'+str(translatedSequence) + '\n'
-
-
-					Gene_Blast_DB_name = CommonFastaFunctions.Create_Blastdb_no_fasta(tempgeneProt2, 1, True,tempgeneProt2Fasta)
-
-
-					# --- get BLAST score ratio --- #
-					cline = NcbiblastpCommandline(cmd=blastPath, db=Gene_Blast_DB_name, evalue=0.001, outfmt=5,num_threads=1)
-					out, err = cline(stdin=tempgeneProt2Fasta)
-					psiblast_xml = StringIO(out)
-					blast_records = NCBIXML.parse(psiblast_xml)
-
-
-					allelescore=[]
-
-
-					for blast_record in blast_records:
-
-						for alignment in blast_record.alignments:
-
-							for match in alignment.hsps:
-
-								allelescore.append(int(match.score))
-
-					selfscore=allelescore[0]
-					selfbsr=float(selfscore)/float(selfscore)
-
-
-					#calculate bsr for the allele vs all previous alleles
-
-
-					# --- get BLAST score ratio --- #
-					cline = NcbiblastpCommandline(cmd=blastPath, db=Gene_Blast_DB_name, evalue=0.001, outfmt=5,num_threads=1)
-					out, err = cline(stdin=tempgeneProtFasta)
-					psiblast_xml = StringIO(out)
-					blast_records = NCBIXML.parse(psiblast_xml)
-
-
-
-					allelescore=[]
-					allelescoreId=[]
-
-					bestbsr=0
-					bestscore=0
-					for blast_record in blast_records:
-
-						for alignment in blast_record.alignments:
-
-							for match in alignment.hsps:
-
-								alleleMatchid=int((blast_record.query_id.split("_"))[-1])
-
-								bsr=float(match.score)/float(selfscores[int(alleleMatchid-1)])
-								if bsr>bestbsr and match.score>bestscore and bsr>=0.6:
-									bestbsr=bsr
-									bestscore=match.score
-
-					if bestbsr>=0.6 and bestbsr<0.7:
-
-						shortfasta+='>'+str(allele.name)+'\n'+str(allele.seq.upper()) + '\n'
-
-						var[alleleI]= selfscore
-						selfscores.append(selfscore)
-
-						tempgeneProtFasta+='>'+str(allele.name)+'\n'+str(translatedSequence) + '\n'
-
-
-
-
-			except Exception as e:
-				#~ print ('Error on line {}'.format(sys.exc_info()[-1].tb_lineno))
-				#print (str(allele.name)+" "+str(e))
-				#print ("allele not translatable")
+	if not os.path.exists(pathtoDir):
+		os.makedirs(pathtoDir, exist_ok=True)
+
+	shortgene= os.path.join(os.path.dirname(gene),"short",os.path.basename(gene))
+	shortgene= shortgene.replace(".fasta","_short.fasta")
+
+	tempgene= os.path.join(os.path.dirname(shortgene),"temp",os.path.basename(gene).replace(".fasta",""))
+	if not os.path.exists(tempgene):
+		os.makedirs(tempgene)
+
+	geneScorePickle=shortgene+'_bsr.txt'
+	fasta_corrected=''
+	total_alleles=0
+	error_alleles=0
+	corrected_alleles=0
+	# name, number, DNA sequence and protein of the valid alleles
+	validAlleles=[]
+	alleles=list(SeqIO.parse(gene, "fasta"))
+	# all the alleles of the locus are translated at once
+	translatedAlleles=translation.translate_sequences([str(allele.seq.upper()) for allele in alleles], 11, ambiguous=True)
+	for allele, translated in zip(alleles, translatedAlleles):
+		total_alleles+=1
+		try:
+			translatedSequence,sortedSeq, originalSeq=cds_translation(translated)
+
+			if not originalSeq:
+				fasta_corrected+='>'+str(allele.name)+'\n'+str(sortedSeq) + '\n'
+				corrected_alleles+=1
+			else:
+				fasta_corrected+='>'+str(allele.name)+'\n'+str(str(allele.seq.upper())) + '\n'
+			alleleI=int(((allele.name).split("_"))[-1])
+			validAlleles.append((str(allele.name),alleleI,str(allele.seq.upper()),str(translatedSequence)))
+		except Exception as e:
+			error_alleles+=1
+
+	if len(validAlleles)>0:
+		# self-scores of all alleles are computed at once
+		proteins={str(i): allele[3] for i,allele in enumerate(validAlleles)}
+		if analytic:
+			scores=self_scores.analytic_self_scores(proteins)
+		else:
+			scores=self_scores.blast_self_scores(proteins,blastPath,tempgene,'alleles')
+
+		# alleles without a self-score cannot be compared
+		scoredAlleles=[]
+		for i,allele in enumerate(validAlleles):
+			if scores.get(str(i),0)>0:
+				scoredAlleles.append((allele,scores[str(i)]))
+			else:
 				error_alleles+=1
+		validAlleles=[allele for allele,score in scoredAlleles]
+		selfscores=[score for allele,score in scoredAlleles]
 
-		#~ print ("processed " +gene)
-		
-		if error_alleles<total_alleles:
+	if len(validAlleles)>0:
+		reps=select_representatives([allele[3] for allele in validAlleles],selfscores,blastPath,tempgene)
 
-			with open(geneScorePickle,'wb') as f:
-				pickle.dump(var, f)
+		var={validAlleles[i][1]: selfscores[i] for i in reps}
+		with open(geneScorePickle,'wb') as f:
+			pickle.dump(var, f)
 
-			with open(shortgene,'w') as f:
-				f.write(shortfasta)
-		
-		else:
-			print ("ATTENTION!!!111 \n"+str(gene)+" has no correct aleles, the file will be removed!!")
-			os.remove(gene)
-		
-		if corrected_alleles>=1 or error_alleles>=1:
-			with open(gene,'w') as f:
-				f.write(fasta_corrected)
+		with open(shortgene,'w') as f:
+			f.write(''.join('>'+validAlleles[i][0]+'\n'+validAlleles[i][2]+'\n' for i in reps))
+
+	if error_alleles==total_alleles:
+		print ("ATTENTION!!!111 \n"+str(gene)+" has no correct aleles, the file will be removed!!")
+		os.remove(gene)
 
-		#print status bar
-		if gene in auxBar:
-			auxlen=len(auxBar)
-			index=auxBar.index(gene)
-			print ( "["+"="*index+">"+" "*(auxlen-index)+"] processed "+str(int((float(index)/auxlen)*100))+"%")
+	elif corrected_alleles>=1 or error_alleles>=1:
+		with open(gene,'w') as f:
+			f.write(fasta_corrected)
 
+	shutil.rmtree(tempgene)
 
+	#print status bar
+	if gene in auxBar:
+		auxlen=len(auxBar)
+		index=auxBar.index(gene)
+		print ( "["+"="*index+">"+" "*(auxlen-index)+"] processed "+str(int((float(index)/auxlen)*100))+"%")
 
 	return	True
 
-def translateSeq(DNASeq):
-	seq=DNASeq
-	reversedSeq=False
-	tableid=11
-	originalSeq=True
-	try:
-		myseq= Seq(seq)
-		protseq=Seq.translate(myseq, table=tableid,cds=True)
-	except:
-		reversedSeq=True
-		originalSeq=False
-		try:
-			seq=reverseComplement(seq)
-			myseq= Seq(seq)
-			protseq=Seq.translate(myseq, table=tableid,cds=True)
+def get_short_loci(genesList,cpu,analytic=False,blastPath='blastp'):
+	"""Selects the representatives of a list of loci in a pool of processes.
+
+	Args:
+		genesList (list): paths to the loci files.
+		cpu (int): number of processes.
+		analytic (bool): compute the self-scores from the scoring matrix.
+		blastPath (str): path to the blastp executable.
+	Returns:
+		True
+	"""
+	tasks=[(str(gene),[],analytic,blastPath) for gene in genesList]
+
+	if cpu>1:
+		task_runner.run_tasks(get_Short,tasks,cpu,progress=task_runner.report_progress)
+	else:
+		for i,task in enumerate(tasks):
+			get_Short(*task)
+			task_runner.report_progress(i+1,len(tasks))
+
+	# the temporary directory of each locus is removed when it is processed
+	for tempFolder in set(os.path.join(os.path.dirname(gene),"short","temp") for gene in genesList):
+		if os.path.isdir(tempFolder) and len(os.listdir(tempFolder))==0:
+			os.rmdir(tempFolder)
+
+	return True
+
+def cds_translation(translated):
+	"""Gets the protein, the DNA sequence in the coding orientation and
+	if the sequence was in the original orientation from the result of
+	translating a sequence with the translation module. Raises ValueError
+	if the sequence is not a valid CDS."""
+	code, protseq, seq, orientation = translated
+	if code != translation.VALID:
+		raise ValueError("sequence is not translatable to a protein")
+
+	return protseq, seq, orientation == translation.SENSE
 
-		except:
-			try:
-				seq=seq[::-1]
-				myseq= Seq(seq)
-				protseq=Seq.translate(myseq, table=tableid,cds=True)
-			except:
-				reversedSeq=False
-				try:
-					seq=seq[::-1]
-					seq=reverseComplement(seq)
-					myseq= Seq(seq)
-					protseq=Seq.translate(myseq, table=tableid,cds=True)
-				except Exception as e:
-					#~ print ("translation error")
-					#~ print (e)
-					raise
-	return protseq, seq, originalSeq
-
-def reverseComplement(strDNA):
-
-	basecomplement = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A'}
-	strDNArevC = ''
-	for l in strDNA:
-
-		strDNArevC += basecomplement[l]
-
-	return strDNArevC[::-1]
+def translateSeq(DNASeq):
+	return cds_translation(translation.translate_cds(DNASeq, 11, ambiguous=True))
 
 def check_if_list_or_folder(folder_or_list):
 	list_files = []
@@ -345,24 +339,19 @@ def main(geneFiles,cpu2use):
 
 	listGenes=check_if_list_or_folder(geneFiles)
 
-	#test down bar
-	auxBar=[]
-	step=int((len(listGenes))/10)+1
-	counter=0
-	while counter < len(listGenes):
-		auxBar.append(listGenes[counter])
-		counter+=step
-
-
 	tempFolder=''
 
-	pool = multiprocessing.Pool(cpu2use)
-	for gene in listGenes:
-
-		pool.apply_async(get_Short,args=[str(gene),auxBar])
-		tempFolder= os.path.join(os.path.dirname(gene),"short","temp")
-	pool.close()
-	pool.join()
+	# self-scores are computed from the scoring matrix if it gives the
+	# same values as BLAST for a sample of the schema alleles
+	analytic=False
+	if len(listGenes) > 0:
+		schemaDir=os.path.dirname(listGenes[0])
+		tempFolder=os.path.join(schemaDir,"short","temp")
+		if not os.path.exists(tempFolder):
+			os.makedirs(tempFolder)
+		analytic=self_scores.analytic_scores_valid(listGenes,schemaDir,'blastp',tempFolder)
+
+	get_short_loci(listGenes,cpu2use,analytic)
 
 	try:
 		shutil.rmtree(tempFolder)
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Purpose
+-------
+This module indexes protein sequences by their k-mer minimizers and uses
+the index to find proteins that are equal to or contained in other
+proteins without comparing each protein to all the others.
+
+The minimizer of a window of `w` consecutive k-mers is the k-mer with the
+smallest hash value in the window (the leftmost if there are ties). A
+sequence is indexed by the positions of the minimizers of all its
+windows. If a protein is contained in another protein, the first window
+of the protein is also a window of the other protein, so the minimizer
+of that window is in the index with the position of the protein in the
+other protein. Containment is only verified for the sequences found with
+that single lookup, so finding the contained proteins in a set of
+proteins takes time proportional to the total length of the proteins
+(plus the verification of the candidates).
+
+The same index is used to group proteins that share a minimum fraction
+of their minimizers (:py:func:`similar_clusters`), so that only proteins
+that are likely to be similar are aligned, instead of aligning all
+proteins against all proteins.
+
+The indexes are dictionaries that can be updated as proteins are added
+(:py:func:`add_minimizers`, :py:func:`add_seed`), so that proteins can
+be compared to a growing set of proteins one set of proteins at a time.
+
+K-mers are converted to integers with NumPy (5 bits per residue), so
+the k-mers and minimizers of a sequence are determined without creating
+a string for each k-mer.
+
+Code documentation
+------------------
+"""
+
+import collections
+
+import numpy as np
+
+
+# default k-mer and window sizes, proteins shorter than a
+# window (k + w - 1 residues) are compared to all sequences
+KMER_SIZE = 5
+WINDOW_SIZE = 8
+
+# window size used to find similar proteins, smaller windows select
+# more minimizers and find proteins with more substitutions
+CLUSTER_WINDOW_SIZE = 3
+# fraction of the minimizers of the protein with less minimizers, and
+# minimum number of minimizers, that two proteins have to share to be
+# in the same cluster
+CLUSTER_MIN_SHARED = 0.05
+CLUSTER_MIN_COUNT = 2
+# minimizers of more proteins are in low complexity regions
+# and are not used to find similar proteins
+CLUSTER_MAX_OCCURRENCES = 1000
+
+# odd multiplier used to shuffle the order of the k-mer integers
+# so that minimizers are not biased towards some residues
+HASH_MULTIPLIER = 2654435761
+HASH_MASK = 0xFFFFFFFF
+
+
+def kmer_codes(sequence, k=KMER_SIZE):
+    """ Converts the k-mers of a sequence to integers.
+
+        Parameters
+        ----------
+        sequence : str
+            Protein sequence.
+        k : int
+            Size of the k-mers.
+
+        Returns
+        -------
+        numpy.ndarray
+            Integer of each k-mer, in the order of the k-mers
+            in the sequence. Residues are encoded with 5 bits,
+            so k-mers up to 12 residues have unique integers.
+    """
+
+    residues = (np.frombuffer(sequence.encode('ascii'), dtype=np.uint8) & 31).astype(np.int64)
+    total_kmers = len(residues) - k + 1
+    if total_kmers < 1:
+        return np.zeros(0, dtype=np.int64)
+
+    codes = np.zeros(total_kmers, dtype=np.int64)
+    for i in range(k):
+        codes = (codes << 5) | residues[i:i+total_kmers]
+
+    return codes
+
+
+def minimizers(sequence, k=KMER_SIZE, w=WINDOW_SIZE):
+    """ Determines the minimizers of all windows of a sequence.
+
+        Parameters
+        ----------
+        sequence : str
+            Protein sequence.
+        k : int
+            Size of the k-mers.
+        w : int
+            Number of k-mers in each window.
+
+        Returns
+        -------
+        list
+            Integers of the minimizers (see :py:func:`kmer_codes`)
+            and their positions in the sequence, without repeated
+            positions, in the order of the windows. Empty if the
+            sequence is shorter than a window.
+    """
+
+    codes = kmer_codes(sequence, k)
+    total_windows = len(codes) - w + 1
+    if total_windows < 1:
+        return []
+
+    hashes = (codes * HASH_MULTIPLIER) & HASH_MASK
+    windows = np.array([hashes[i:i+total_windows] for i in range(w)])
+    positions = np.argmin(windows, axis=0) + np.arange(total_windows)
+    # consecutive windows usually share their minimizer
+    positions = positions[np.concatenate(([True], positions[1:] != positions[:-1]))]
+
+    return list(zip(codes[positions].tolist(), positions.tolist()))
+
+
+def first_minimizer(sequence, k=KMER_SIZE, w=WINDOW_SIZE):
+    """ Determines the minimizer of the first window of a sequence.
+
+        Returns
+        -------
+        tuple
+            Integer of the minimizer and its position in the
+            sequence, or None if the sequence is shorter than
+            a window.
+    """
+
+    codes = kmer_codes(sequence[:k+w-1], k)
+    if len(codes) < w:
+        return None
+
+    position = int(np.argmin((codes * HASH_MULTIPLIER) & HASH_MASK))
+
+    return (int(codes[position]), position)
+
+
+def add_minimizers(index, identifier, sequence, k=KMER_SIZE, w=WINDOW_SIZE):
+    """ Adds the minimizers of a protein, and their positions,
+        to an index used with :py:func:`contained_in`.
+    """
+
+    for code, position in minimizers(sequence, k, w):
+        index.setdefault(code, []).append((identifier, position))
+
+
+def add_seed(seeds, identifier, sequence, k=KMER_SIZE, w=WINDOW_SIZE):
+    """ Adds the minimizer of the first window of a protein, and its
+        position, to an index used with :py:func:`containing`.
+        Proteins shorter than a window are not added.
+    """
+
+    seed = first_minimizer(sequence, k, w)
+    if seed is not None:
+        seeds.setdefault(seed[0], []).append((identifier, seed[1]))
+
+
+def contained_in(index, sequences, protein, seed, candidates=None):
+    """ Finds an indexed protein that contains or is equal to a protein.
+
+        Parameters
+        ----------
+        index : dict
+            Index created with :py:func:`add_minimizers`.
+        sequences : dict or list
+            Sequences of the indexed proteins.
+        protein : str
+            Protein sequence.
+        seed : tuple
+            Minimizer of the first window of the protein
+            (see :py:func:`first_minimizer`).
+        candidates : set
+            Identifiers of the indexed proteins that are considered,
+            or None to consider all indexed proteins.
+
+        Returns
+        -------
+        Identifier of the protein that contains the protein,
+        or None if it is not contained in any protein.
+    """
+
+    code, position = seed
+    length = len(protein)
+    for j, start in index.get(code, []):
+        offset = start - position
+        if (offset >= 0 and (candidates is None or j in candidates) and
+                sequences[j][offset:offset+length] == protein):
+            return j
+
+    return None
+
+
+def containing(seeds, sequences, protein, k=KMER_SIZE, w=WINDOW_SIZE, candidates=None):
+    """ Finds the indexed proteins that are contained in or equal to
+        a protein. A protein that contains another protein has the
+        minimizer of the first window of that protein at the
+        position where that protein starts plus the position of the
+        minimizer.
+
+        Parameters
+        ----------
+        seeds : dict
+            Index created with :py:func:`add_seed`.
+        sequences : dict or list
+            Sequences of the indexed proteins.
+        protein : str
+            Protein sequence.
+        k : int
+            Size of the k-mers.
+        w : int
+            Number of k-mers in each window.
+        candidates : set
+            Identifiers of the indexed proteins that are considered,
+            or None to consider all indexed proteins.
+
+        Returns
+        -------
+        list
+            Identifiers of the contained proteins.
+    """
+
+    contained = []
+    for code, position in minimizers(protein, k, w):
+        for j, start in seeds.get(code, []):
+            offset = position - start
+            if (offset >= 0 and (candidates is None or j in candidates) and j not in contained and
+                    protein[offset:offset+len(sequences[j])] == sequences[j]):
+                contained.append(j)
+
+    return contained
+
+
+def find_contained(sequences, k=KMER_SIZE, w=WINDOW_SIZE):
+    """ Finds the proteins that are equal to or contained in other
+        proteins of a set of proteins.
+
+        Proteins are processed from the longest to the shortest
+        (proteins with the same length in the order they are given)
+        and a protein is only kept if it is not contained in a protein
+        that was kept before, the same result that is obtained by
+        comparing each protein to all longer proteins.
+
+        Parameters
+        ----------
+        sequences : list
+            Protein sequences.
+        k : int
+            Size of the k-mers.
+        w : int
+            Number of k-mers in each window.
+
+        Returns
+        -------
+        list
+            Index of the kept protein that contains each protein,
+            or None for the proteins that are kept.
+    """
+
+    order = sorted(range(len(sequences)), key=lambda i: -len(sequences[i]))
+
+    containers = [None] * len(sequences)
+    # minimizer -> indexes of the kept proteins and positions
+    index = {}
+    kept = []
+    for i in order:
+        protein = sequences[i]
+        seed = first_minimizer(protein, k, w)
+
+        if seed is not None:
+            container = contained_in(index, sequences, protein, seed)
+        else:
+            # proteins shorter than a window have no seed
+            container = next((j for j in kept if protein in sequences[j]), None)
+
+        if container is not None:
+            containers[i] = container
+            continue
+
+        kept.append(i)
+        add_minimizers(index, i, protein, k, w)
+
+    return containers
+
+
+def minimizers_set(sequence, k=KMER_SIZE, w=CLUSTER_WINDOW_SIZE):
+    """ Gets the set of minimizers of a protein used to find
+        similar proteins.
+    """
+
+    return set(code for code, position in minimizers(sequence, k, w))
+
+
+def similar_proteins(index, codes, sizes, min_shared=CLUSTER_MIN_SHARED, min_count=CLUSTER_MIN_COUNT,
+                     max_occurrences=CLUSTER_MAX_OCCURRENCES):
+    """ Finds the indexed proteins that share enough minimizers with
+        a protein to be similar to it.
+
+        Parameters
+        ----------
+        index : dict
+            Minimizers as keys and collections with the identifiers
+            of the proteins that have each minimizer as values.
+        codes : set
+            Minimizers of the protein (see :py:func:`minimizers_set`).
+        sizes : dict or list
+            Number of minimizers of each indexed protein.
+        min_shared : float
+            Minimum fraction of the minimizers of the protein
+            with less minimizers that are shared.
+        min_count : int
+            Minimum number of shared minimizers.
+        max_occurrences : int
+            Minimizers found in more proteins are not used.
+
+        Returns
+        -------
+        list
+            Identifiers of the similar proteins, including the
+            protein if it is in the index.
+    """
+
+    shared = collections.Counter()
+    for code in codes:
+        proteins = index.get(code, ())
+        if len(proteins) <= max_occurrences:
+            shared.update(proteins)
+
+    return [j for j, count in shared.items()
+            if count >= max(min_count, min_shared * min(len(codes), sizes[j]))]
+
+
+def similar_clusters(sequences, min_shared=CLUSTER_MIN_SHARED, min_count=CLUSTER_MIN_COUNT,
+                     k=KMER_SIZE, w=CLUSTER_WINDOW_SIZE, max_occurrences=CLUSTER_MAX_OCCURRENCES):
+    """ Groups proteins that share minimizers. Two proteins are linked
+        if they share at least a fraction of the minimizers of the
+        protein with less minimizers, and at least a minimum number of
+        minimizers, and clusters are the groups of proteins that are
+        linked directly or through other proteins.
+
+        Parameters
+        ----------
+        sequences : list
+            Protein sequences.
+        min_shared : float
+            Minimum fraction of shared minimizers.
+        min_count : int
+            Minimum number of shared minimizers.
+        k : int
+            Size of the k-mers.
+        w : int
+            Number of k-mers in each window.
+        max_occurrences : int
+            Minimizers found in more proteins are not used.
+
+        Returns
+        -------
+        list
+            Clusters with the indexes of the proteins in increasing
+            order, ordered by the first protein of each cluster.
+            Proteins that are not linked to other proteins are in
+            clusters with a single protein.
+    """
+
+    proteins_minimizers = [minimizers_set(protein, k, w) for protein in sequences]
+    sizes = [len(codes) for codes in proteins_minimizers]
+
+    index = {}
+    for i, codes in enumerate(proteins_minimizers):
+        for code in codes:
+            index.setdefault(code, []).append(i)
+
+    parents = list(range(len(sequences)))
+
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    for i, codes in enumerate(proteins_minimizers):
+        for j in similar_proteins(index, codes, sizes, min_shared, min_count, max_occurrences):
+            if j > i:
+                root_i, root_j = find(i), find(j)
+                if root_i != root_j:
+                    parents[max(root_i, root_j)] = min(root_i, root_j)
+
+    clusters = {}
+    for i in range(len(sequences)):
+        clusters.setdefault(find(i), []).append(i)
+
+    return list(clusters.values())
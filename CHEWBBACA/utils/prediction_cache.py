@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Purpose
+-------
+This module stores the gene predictions of the genomes given to the
+AlleleCall and CreateSchema processes so that Prodigal does not have to
+run again for genomes that were already processed with the same training
+file and genetic code.
+
+The cache is a directory with one entry per combination of assembly,
+Prodigal training file and genetic code. Entries are identified by a key
+derived from the BLAKE2b hashes of the assembly and training files (the
+same hashes determined by `auxiliary_functions.hash_file`), the genetic
+code, the Prodigal version and the format of the cached files
+(:py:data:`CACHE_FORMAT`), so renaming or moving a genome file does not
+invalidate its entry, but changing Prodigal or the files does.
+Each entry is a directory with the files created for the genome by each
+process:
+
+    - 'ORF.txt': CDS coordinates per contig (CreateSchema).
+    - 'CDS.seq', 'CDS.offsets', 'contigs.txt': CDS store (AlleleCall).
+    - 'Protein.fasta': translated CDSs (AlleleCall).
+    - 'CDS_hashes.txt', 'protein_hashes.txt': hash tables used to find
+      exact matches (AlleleCall).
+
+Files are added to an entry with a rename, so processes that use the same
+cache concurrently never read incomplete files. Failing to read or write
+the cache never stops a process, genes are predicted as if there was no
+cache.
+
+The cache is limited in size (:py:data:`MAX_CACHE_SIZE`). Entries are
+marked when they are used and :py:func:`prune` removes the least recently
+used entries when the cache exceeds the limit.
+
+Code documentation
+------------------
+"""
+
+import os
+import shutil
+import hashlib
+import tempfile
+import functools
+import subprocess
+
+
+# size of the chunks read to hash files
+CHUNK_SIZE = 2**20
+# version of the layout and contents of the cached files, changed
+# to stop reusing the entries created by previous versions
+CACHE_FORMAT = 2
+# maximum size of the cache in bytes
+MAX_CACHE_SIZE = 10 * 2**30
+
+
+def file_hash(file):
+    """ Determines the BLAKE2b hash of a file, reading it in chunks.
+
+        Parameters
+        ----------
+        file : str
+            Path to the file.
+
+        Returns
+        -------
+        str
+            Hexadecimal digest, equal to the one determined by
+            `auxiliary_functions.hash_file(file, 'rb')`.
+    """
+
+    hash_obj = hashlib.blake2b()
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            hash_obj.update(chunk)
+
+    return hash_obj.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def prodigal_version(prodigal_path='prodigal'):
+    """ Gets the version reported by Prodigal, or an empty
+        string if it cannot be determined.
+    """
+
+    try:
+        proc = subprocess.Popen([prodigal_path, '-v'], stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        stdout, stderr = proc.communicate()
+    except OSError:
+        return ''
+
+    # the version is written to stderr
+    output = (stdout + stderr).decode('utf-8', 'replace').strip()
+
+    return output.split('\n')[0]
+
+
+def cache_key(genome_file, ptf_path, translation_table):
+    """ Determines the key of the cache entry of a genome.
+
+        Parameters
+        ----------
+        genome_file : str
+            Path to the FASTA file with the assembly.
+        ptf_path : str or bool
+            Path to the Prodigal training file, or False
+            ("False") if Prodigal runs without training file.
+        translation_table : int
+            Genetic code used to predict genes.
+
+        Returns
+        -------
+        str
+            Hexadecimal key of the cache entry.
+    """
+
+    genome_hash = file_hash(genome_file)
+    if ptf_path in [False, 'False', None]:
+        ptf_hash = ''
+    else:
+        ptf_hash = file_hash(ptf_path)
+
+    key_text = '{0}:{1}:{2}:{3}:{4}'.format(genome_hash, ptf_hash, translation_table,
+                                            prodigal_version(), CACHE_FORMAT)
+
+    return hashlib.blake2b(key_text.encode('ascii')).hexdigest()
+
+
+def entry_path(cache_directory, key):
+    """ Path to the directory of a cache entry. Entries are split
+        by the first characters of their keys to avoid directories
+        with too many files.
+    """
+
+    return os.path.join(cache_directory, key[:2], key)
+
+
+def fetch(cache_directory, key, files):
+    """ Copies the files of a cache entry to their destinations.
+
+        Parameters
+        ----------
+        cache_directory : str
+            Path to the cache directory.
+        key : str
+            Key of the cache entry.
+        files : dict
+            Names of the files in the cache entry as keys
+            and destination paths as values.
+
+        Returns
+        -------
+        bool
+            True if the entry had all the files and they
+            were copied, False otherwise.
+    """
+
+    entry = entry_path(cache_directory, key)
+    sources = {name: os.path.join(entry, name) for name in files}
+    if not all(os.path.isfile(source) for source in sources.values()):
+        return False
+
+    try:
+        for name, destination in files.items():
+            shutil.copyfile(sources[name], destination)
+        # the modification time of the entry is its last use
+        os.utime(entry)
+    except OSError:
+        return False
+
+    return True
+
+
+def store(cache_directory, key, files):
+    """ Adds files to a cache entry.
+
+        Parameters
+        ----------
+        cache_directory : str
+            Path to the cache directory.
+        key : str
+            Key of the cache entry.
+        files : dict
+            Names of the files in the cache entry as keys
+            and paths to the files that are copied as values.
+
+        Returns
+        -------
+        bool
+            True if all the files were added, False otherwise.
+    """
+
+    entry = entry_path(cache_directory, key)
+    try:
+        os.makedirs(entry, exist_ok=True)
+        for name, source in files.items():
+            # copy to a temporary file in the entry directory and
+            # rename it, other processes only see complete files
+            handle, temp_file = tempfile.mkstemp(dir=entry, prefix='.tmp_')
+            os.close(handle)
+            try:
+                shutil.copyfile(source, temp_file)
+                os.replace(temp_file, os.path.join(entry, name))
+            except OSError:
+                os.remove(temp_file)
+                raise
+    except OSError:
+        return False
+
+    return True
+
+
+def prune(cache_directory, max_size=MAX_CACHE_SIZE):
+    """ Removes the least recently used entries until the
+        size of the cache is not above a limit.
+
+        Parameters
+        ----------
+        cache_directory : str
+            Path to the cache directory.
+        max_size : int
+            Maximum size of the cache in bytes.
+
+        Returns
+        -------
+        int
+            Number of entries that were removed.
+    """
+
+    entries = []
+    total_size = 0
+    try:
+        for prefix in os.listdir(cache_directory):
+            prefix_path = os.path.join(cache_directory, prefix)
+            if not os.path.isdir(prefix_path):
+                continue
+            for key in os.listdir(prefix_path):
+                entry = os.path.join(prefix_path, key)
+                size = sum(os.path.getsize(os.path.join(entry, name))
+                           for name in os.listdir(entry))
+                entries.append((os.path.getmtime(entry), size, entry))
+                total_size += size
+    except OSError:
+        return 0
+
+    removed = 0
+    for mtime, size, entry in sorted(entries):
+        if total_size <= max_size:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total_size -= size
+        removed += 1
+
+    return removed
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Purpose
+-------
+This module stores the results of the allele call in a matrix with one
+row per locus and one column per genome. Each field of a call is stored
+in a separate memory-mapped file with fixed-width values:
+
+    - 'allele' (int32): allele identifier of exact matches and inferred
+      alleles. Identifiers of novel alleles ('*<N>') are stored as -N.
+    - 'status' (int8): classification of the call (see the status codes).
+    - 'contig' (int32): index of the contig in the contigs of the genome.
+    - 'start' and 'end' (int32): position of the CDS in the contig, with
+      start > end for CDSs in the reverse strand.
+
+Locus workers open the matrix and write the row of their locus when they
+finish, marking the locus as done, so the main process does not need to
+load per-locus result files and resumed runs know which loci are done.
+
+Code documentation
+------------------
+"""
+
+import os
+import json
+import functools
+
+import numpy as np
+
+try:
+    from utils import cds_store
+except:
+    from CHEWBBACA.utils import cds_store
+
+
+# status codes, 0 for calls that were not made yet
+PENDING = 0
+EXC = 1
+INF = 2
+LNF = 3
+PLOT3 = 4
+PLOT5 = 5
+LOTSC = 6
+NIPH = 7
+NIPHEM = 8
+ALM = 9
+ASM = 10
+ERROR = 11
+
+# label of the classifications that have no allele identifier
+STATUS_LABELS = {LNF: 'LNF', PLOT3: 'PLOT3', PLOT5: 'PLOT5', LOTSC: 'LOTSC',
+                 NIPH: 'NIPH', NIPHEM: 'NIPHEM', ALM: 'ALM', ASM: 'ASM',
+                 ERROR: 'ERROR'}
+
+COLUMNS = [('allele', np.int32), ('status', np.int8), ('contig', np.int32),
+           ('start', np.int32), ('end', np.int32)]
+
+MATRIX_DIRECTORY = 'results_matrix'
+METADATA_FILE = 'matrix.json'
+
+
+def matrix_path(basepath, name):
+    """ Gets the path to a file of the results matrix."""
+
+    return os.path.join(basepath, MATRIX_DIRECTORY, name)
+
+
+def create_matrix(basepath, loci, genomes):
+    """ Creates an empty results matrix.
+
+        Parameters
+        ----------
+        basepath : str
+            Path to the temporary directory of the allele call.
+        loci : list
+            Paths to the loci files, in the order of the rows.
+        genomes : list
+            Paths to the genome files, in the order of the columns.
+    """
+
+    os.makedirs(os.path.join(basepath, MATRIX_DIRECTORY), exist_ok=True)
+
+    shape = (max(len(loci), 1), max(len(genomes), 1))
+    for name, dtype in COLUMNS:
+        column = np.memmap(matrix_path(basepath, name + '.dat'), dtype=dtype,
+                           mode='w+', shape=shape)
+        column.flush()
+        del column
+
+    done = np.memmap(matrix_path(basepath, 'done.dat'), dtype=np.int8,
+                     mode='w+', shape=(shape[0],))
+    done.flush()
+    del done
+
+    with open(matrix_path(basepath, METADATA_FILE), 'w') as outfile:
+        json.dump({'loci': list(loci), 'genomes': list(genomes)}, outfile)
+
+
+def open_matrix(basepath, mode='r'):
+    """ Opens a results matrix.
+
+        Parameters
+        ----------
+        basepath : str
+            Path to the temporary directory of the allele call.
+        mode : str
+            'r' to read the matrix or 'r+' to write calls.
+
+        Returns
+        -------
+        dict
+            The lists of loci and genomes, a memory-mapped array per
+            column and the array that marks the loci that are done.
+    """
+
+    with open(matrix_path(basepath, METADATA_FILE), 'r') as infile:
+        matrix = json.load(infile)
+
+    shape = (max(len(matrix['loci']), 1), max(len(matrix['genomes']), 1))
+    for name, dtype in COLUMNS:
+        matrix[name] = np.memmap(matrix_path(basepath, name + '.dat'),
+                                 dtype=dtype, mode=mode, shape=shape)
+    matrix['done'] = np.memmap(matrix_path(basepath, 'done.dat'), dtype=np.int8,
+                               mode=mode, shape=(shape[0],))
+
+    return matrix
+
+
+def matrix_exists(basepath):
+    """ Checks if the temporary directory has a results matrix."""
+
+    return os.path.isfile(matrix_path(basepath, METADATA_FILE))
+
+
+def same_run(basepath, loci, genomes):
+    """ Checks if the results matrix in a temporary directory was
+        created for the same genomes and for loci in a list of loci
+        (loci that cannot be translated are not in the matrix).
+    """
+
+    if not matrix_exists(basepath):
+        return False
+
+    with open(matrix_path(basepath, METADATA_FILE), 'r') as infile:
+        matrix = json.load(infile)
+
+    return matrix['genomes'] == list(genomes) and set(matrix['loci']) <= set(loci)
+
+
+def empty_calls(total_genomes):
+    """ Creates the arrays with the calls of a locus for all genomes,
+        written to the matrix with :py:func:`write_locus`.
+    """
+
+    return {name: np.zeros(total_genomes, dtype=dtype) for name, dtype in COLUMNS}
+
+
+def allele_number(allele_id):
+    """ Converts an allele identifier ('5' or '*5') to the
+        integer stored in the matrix.
+    """
+
+    allele_id = str(allele_id).strip()
+    if allele_id.startswith('*'):
+        return -int(allele_id[1:])
+
+    return int(allele_id)
+
+
+def set_call(calls, genome_index, status, allele_id=0, contig=-1, start=0, end=0):
+    """ Sets the call of a locus in a genome.
+
+        Parameters
+        ----------
+        calls : dict
+            Arrays created with :py:func:`empty_calls`.
+        genome_index : int
+            Index of the genome.
+        status : int
+            Status code of the call.
+        allele_id : str
+            Allele identifier, for exact matches and inferred alleles.
+        contig : int
+            Index of the contig of the CDS.
+        start : int
+            Start position of the CDS (1-based).
+        end : int
+            End position of the CDS, smaller than the start
+            position if the CDS is in the reverse strand.
+    """
+
+    calls['status'][genome_index] = status
+    calls['allele'][genome_index] = allele_number(allele_id)
+    calls['contig'][genome_index] = contig
+    calls['start'][genome_index] = start
+    calls['end'][genome_index] = end
+
+
+def write_locus(basepath, locus, calls):
+    """ Writes the calls of a locus to its row of the matrix
+        and marks the locus as done.
+
+        Parameters
+        ----------
+        basepath : str
+            Path to the temporary directory of the allele call.
+        locus : str
+            Path to the locus file.
+        calls : dict
+            Arrays created with :py:func:`empty_calls`.
+    """
+
+    matrix = open_matrix(basepath, 'r+')
+    row = matrix['loci'].index(locus)
+    for name, dtype in COLUMNS:
+        matrix[name][row] = calls[name]
+        matrix[name].flush()
+
+    # only marked as done after all columns are on disk
+    matrix['done'][row] = 1
+    matrix['done'].flush()
+
+
+@functools.lru_cache(maxsize=None)
+def contig_names(basepath, genome_file):
+    """ Gets the names of the contigs of a genome, in the order
+        used to store contig indexes. Cached because locus workers
+        need the contigs of every genome for each locus.
+    """
+
+    return list(cds_store.open_store(basepath, genome_file)[2])
+
+
+@functools.lru_cache(maxsize=None)
+def contig_indexes(basepath, genome_file):
+    """ Gets a dictionary with the index of each contig of a genome."""
+
+    return {contig: i for i, contig in enumerate(contig_names(basepath, genome_file))}
+
+
+def allele_label(status, allele):
+    """ Gets the label of a call in the alleles matrix
+        ('5', '*5', 'INF-6', 'LNF', ...).
+    """
+
+    if status == EXC or status == INF:
+        label = str(allele) if allele > 0 else '*' + str(-allele)
+        if status == INF:
+            label = 'INF-' + label
+        return label
+
+    return STATUS_LABELS.get(status, '')
+
+
+def contig_label(status, contig, start, end, names):
+    """ Gets the label of a call in the contigs matrix
+        ('<contig>&<start>-<end>&<strand>', 'LNF', ...).
+
+        Parameters
+        ----------
+        status : int
+            Status code of the call.
+        contig : int
+            Index of the contig.
+        start : int
+            Start position of the CDS.
+        end : int
+            End position of the CDS.
+        names : list
+            Names of the contigs of the genome.
+    """
+
+    if status == EXC or status == INF:
+        strand = '-' if start > end else '+'
+        return '{0}&{1}-{2}&{3}'.format(names[contig], start, end, strand)
+
+    return STATUS_LABELS.get(status, '')
+
+
+def contained_path(basepath, locus):
+    """ Gets the path to the file with the alleles of a locus that
+        are contained in or contain other alleles of the locus.
+    """
+
+    return os.path.join(basepath, os.path.basename(locus) + '_contained.tsv')
+
+
+def write_contained(basepath, locus, contained):
+    """ Writes the alleles of a locus that are contained in or
+        contain other alleles (genome, allele and tag per line).
+    """
+
+    with open(contained_path(basepath, locus), 'w') as outfile:
+        outfile.write(''.join('\t'.join(record) + '\n' for record in contained))
+
+
+def read_contained(basepath, locus):
+    """ Reads the file written by :py:func:`write_contained`,
+        returning an empty list if there is no file.
+    """
+
+    path = contained_path(basepath, locus)
+    if not os.path.isfile(path):
+        return []
+
+    with open(path, 'r') as infile:
+        return [line.rstrip('\n').split('\t') for line in infile if line.strip()]
+
+
+# columns of the statistics of each genome and the status codes
+# counted in each column, other codes are counted as exact matches
+STATISTICS = ['EXC', 'INF', 'LNF', 'PLOT', 'NIPH', 'ALM', 'ASM']
+STATISTICS_COLUMNS = {INF: 1, LNF: 2, PLOT3: 3, PLOT5: 3, NIPH: 4, NIPHEM: 4,
+                      ALM: 5, ASM: 6}
+
+
+def genome_alleles(matrix, genome_index):
+    """ Gets the labels of the calls of all loci in a genome
+        for the alleles matrix.
+    """
+
+    total_loci = len(matrix['loci'])
+    status = matrix['status'][:total_loci, genome_index].tolist()
+    alleles = matrix['allele'][:total_loci, genome_index].tolist()
+
+    return [allele_label(s, a) for s, a in zip(status, alleles)]
+
+
+def genome_contigs(matrix, genome_index, names):
+    """ Gets the labels of the calls of all loci in a genome
+        for the contigs matrix.
+
+        Parameters
+        ----------
+        matrix : dict
+            Matrix returned by :py:func:`open_matrix`.
+        genome_index : int
+            Index of the genome.
+        names : list
+            Names of the contigs of the genome.
+    """
+
+    total_loci = len(matrix['loci'])
+    columns = [matrix[name][:total_loci, genome_index].tolist()
+               for name in ['status', 'contig', 'start', 'end']]
+
+    return [contig_label(s, c, start, end, names) for s, c, start, end in zip(*columns)]
+
+
+def genome_statistics(matrix, genome_index):
+    """ Counts the calls of each classification in a genome.
+
+        Returns
+        -------
+        list
+            Number of calls in each of the :py:data:`STATISTICS`
+            columns.
+    """
+
+    total_loci = len(matrix['loci'])
+    counts = np.bincount(matrix['status'][:total_loci, genome_index].astype(np.int64),
+                         minlength=ERROR + 1)
+
+    statistics = [0] * len(STATISTICS)
+    for status, count in enumerate(counts.tolist()):
+        statistics[STATISTICS_COLUMNS.get(status, 0)] += count
+
+    return statistics
+
+
+def write_tsv(output_file, header, rows):
+    """ Writes a table to a TSV file one row at a time.
+
+        Parameters
+        ----------
+        output_file : str
+            Path to the output file.
+        header : list
+            Column names.
+        rows : iterable
+            Lists with the values of each row. Can be a generator,
+            rows are written as they are created.
+    """
+
+    with open(output_file, 'w') as outfile:
+        outfile.write('\t'.join(header))
+        for row in rows:
+            outfile.write('\n' + '\t'.join(map(str, row)))
+
+
+def write_json(output_file, header, rows):
+    """ Writes a table to a JSON file one row at a time, with
+        the column names under 'header' and the values of each
+        row under the first value of the row.
+
+        Parameters
+        ----------
+        output_file : str
+            Path to the output file.
+        header : list
+            Column names, without the name of the first column.
+        rows : iterable
+            Lists with the values of each row.
+    """
+
+    with open(output_file, 'w') as outfile:
+        outfile.write('{' + json.dumps('header') + ': ' + json.dumps(header))
+        for row in rows:
+            outfile.write(', ' + json.dumps(str(row[0])) + ': ' +
+                          json.dumps([str(value) for value in row[1:]]))
+        outfile.write('}')
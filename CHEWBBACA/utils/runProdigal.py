@@ -3,86 +3,93 @@ import os
 import pickle
 import subprocess
 
+try:
+    from utils import prediction_cache
+except:
+    from CHEWBBACA.utils import prediction_cache
 
-def main(input_file,tempPath,choosenTaxon,translation_table):
 
-    contigsFasta = input_file
+def stream_genes(input_file, choosenTaxon, translation_table):
+    """ Runs Prodigal and parses its output while it is being written.
 
-    basepath = tempPath
+        Args:
+            input_file (str): path to the FASTA file with the contigs.
+            choosenTaxon (str): path to the training file or "False".
+            translation_table (int): genetic code.
+
+        Yields:
+            Tuple with the contig identifier, the start (0-based) and
+            end positions of the CDS and the strand ('+' or '-').
+
+        Raises:
+            ValueError: if Prodigal fails, after all the CDSs it
+            predicted were yielded. Callers must not save results
+            until the generator is exhausted.
+    """
 
     # ------------ #
     # RUN PRODIGAL #
     # ------------ #
     # prodigal_path='prodigal'
 
-    if choosenTaxon == "False":
+    prodigal_cmd = ['prodigal', '-i', input_file, '-c', '-m', '-g', str(translation_table),
+                    '-p', 'single', '-f', 'sco', '-q']
+    if choosenTaxon != "False":
+        prodigal_cmd.extend(['-t', choosenTaxon])
 
-        proc = subprocess.Popen(
-            ['prodigal', '-i', contigsFasta, '-c', '-m', '-g', str(translation_table), '-p', 'single', '-f', 'sco', '-q'],
-            stdout=subprocess.PIPE)
-    else:
-        proc = subprocess.Popen(
-            ['prodigal', '-i', contigsFasta, '-c', '-m', '-g', str(translation_table), '-p', 'single', '-f', 'sco', '-q', '-t',
-             choosenTaxon], stdout=subprocess.PIPE)
+    proc = subprocess.Popen(prodigal_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
-    cdsDict = {}
-    tempList = []
-    line = ' '
-    while line != '':
+    contigTag = ''
+    for line in proc.stdout:
+        line = line.decode("utf-8")
 
         # when it finds a contig tag
         if "seqhdr" in line:
-            # add contig to cdsDict and start new entry
-
-            if len(tempList) > 0:
-
-                # --- brute force parsing of the contig tag - better solution is advisable --- #
-
-                i = 0
-                for l in contigTag:
-                    if l == ' ':
-                        break
-                    i += 1
-                contigTag = contigTag[:i]
-
-                cdsDict[contigTag.replace("\r", "")] = tempList
-                tempList = []
-
-            contigTag = line.split('"')[-2]
+            contigTag = line.split('"')[-2].split(' ')[0].replace("\r", "")
 
         # when it finds a line with cds indexes
         elif line[0] == '>':
+            cdsL = line.rstrip().split('_')
+            # start index correction needed because prodigal indexes start in 1 instead of 0
+            yield (contigTag, int(cdsL[1]) - 1, int(cdsL[2]), cdsL[3])
 
-            # parsing
-            cdsL = line.split('_')
+    # Prodigal only writes to stderr if it fails, because of '-q'
+    stderr = proc.stderr.read().decode("utf-8")
+    proc.wait()
+    if proc.returncode != 0:
+        raise ValueError("Prodigal failed on {0} with exit code {1}:\n{2}".format(input_file,
+                                                                                 proc.returncode,
+                                                                                 stderr))
 
-            # --- each element of this list is a pair of indices - the start and the end of a CDS --- #
 
-            tempList.append([int(cdsL[1]) - 1, int(
-                cdsL[2])])  # start index correction needed because prodigal indexes start in 1 instead of 0
+def main(input_file,tempPath,choosenTaxon,translation_table,cache_directory=None):
 
-        # reads the stdout from 'prodigal'
-        line = proc.stdout.readline().decode("utf-8")
+    contigsFasta = input_file
 
-    # ADD LAST
-    if len(tempList) > 0:
+    basepath = tempPath
 
-        # --- brute force parsing of the contig tag - better solution is advisable --- #
+    filepath = os.path.join(basepath, str(os.path.basename(contigsFasta)) + "_ORF.txt")
 
-        i = 0
-        for l in contigTag:
-            if l == ' ':
-                break
-            i += 1
-        contigTag = contigTag[:i]
+    # reuse the coordinates predicted in a previous run
+    if cache_directory is not None:
+        key = prediction_cache.cache_key(contigsFasta, choosenTaxon, translation_table)
+        if prediction_cache.fetch(cache_directory, key, {'ORF.txt': filepath}):
+            print("reused prodigal run on:" + str(os.path.basename(contigsFasta)))
+            return True
 
-        cdsDict[contigTag.replace("\r", "")] = tempList
+    # --- each element of the lists is a pair of indices - the start and the end of a CDS --- #
+    # the file is only written and cached if Prodigal succeeded
+    cdsDict = {}
+    for contigTag, start, end, strand in stream_genes(contigsFasta, choosenTaxon, translation_table):
+        cdsDict.setdefault(contigTag, []).append([start, end])
 
-    filepath = os.path.join(basepath, str(os.path.basename(contigsFasta)) + "_ORF.txt")
     with open(filepath, 'wb') as f:
         var = cdsDict
         pickle.dump(var, f)
 
+    if cache_directory is not None:
+        prediction_cache.store(cache_directory, key, {'ORF.txt': filepath})
+
     print("done prodigal run on:" + str(os.path.basename(contigsFasta)))
 
     return True
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Purpose
+-------
+This module creates and maintains a persistent index of the sequences in a
+schema (sequence hash -> locus and allele identifier) and uses it to find
+all exact matches between the coding sequences of a set of genomes and the
+alleles of all loci in a single pass. The index also includes the hashes of
+the translated alleles, used to find CDSs that code for the same protein as
+an allele but have a different DNA sequence (synonymous variants).
+
+The index is stored in the schema directory and is only updated for the
+loci whose FASTA files changed since the index was last saved.
+
+Code documentation
+------------------
+"""
+
+import os
+import pickle
+import hashlib
+
+from Bio import SeqIO
+
+try:
+    from utils import translation
+except:
+    from CHEWBBACA.utils import translation
+
+
+# name of the file with the index in the schema directory
+INDEX_FILE = '.sequences_index'
+# translation table used to translate alleles and genome CDSs
+TABLE_ID = 11
+
+
+def sequence_hash(sequence):
+    """ Computes the hash of a sequence.
+
+        Parameters
+        ----------
+        sequence : str
+            DNA or protein sequence.
+
+        Returns
+        -------
+        str
+            The sha256 hash of the sequence.
+    """
+
+    return hashlib.sha256(sequence.encode('utf-8')).hexdigest()
+
+
+def file_signature(file):
+    """ Determines the modification time and size of a file, used to
+        detect loci that changed since they were indexed.
+    """
+
+    stats = os.stat(file)
+
+    return (stats.st_mtime_ns, stats.st_size)
+
+
+def translate_alleles(sequences, table_id=TABLE_ID):
+    """ Translates alleles with the same rules used to translate
+        the CDSs of the genomes (see :py:mod:`translation`).
+
+        Parameters
+        ----------
+        sequences : list
+            DNA sequences of the alleles.
+        table_id : int
+            Translation table identifier.
+
+        Returns
+        -------
+        list
+            The protein sequence of each allele, or None for the
+            alleles that could not be translated.
+    """
+
+    return [protein if code == translation.VALID else None
+            for code, protein, dna, orientation
+            in translation.translate_sequences(sequences, table_id, ambiguous=True)]
+
+
+def index_locus(locus_file):
+    """ Maps the hash of each allele in a locus, and of the protein
+        it codes for, to the allele identifiers.
+
+        Parameters
+        ----------
+        locus_file : str
+            Path to the FASTA file with the locus alleles.
+
+        Returns
+        -------
+        locus_index : dict
+            Sequence hashes as keys and lists with the identifiers
+            of the alleles with that sequence, in file order, as
+            values.
+        protein_index : dict
+            Protein hashes as keys and lists with the identifiers
+            of the alleles that code for that protein, in file order,
+            as values.
+    """
+
+    locus_index = {}
+    protein_index = {}
+    alleles = [(allele.id, str(allele.seq.upper())) for allele in SeqIO.parse(locus_file, 'fasta')]
+    proteins = translate_alleles([sequence for alleleid, sequence in alleles])
+    for (alleleid, sequence), protein in zip(alleles, proteins):
+        locus_index.setdefault(sequence_hash(sequence), []).append(alleleid)
+        if protein is not None:
+            protein_index.setdefault(sequence_hash(protein), []).append(alleleid)
+
+    return locus_index, protein_index
+
+
+def load_schema_index(loci_files, schema_directory):
+    """ Loads the index of the schema sequences, updating the entries
+        of loci that were added or changed since the last update.
+
+        Parameters
+        ----------
+        loci_files : list
+            Paths to the FASTA files of the loci to include.
+        schema_directory : str
+            Path to the schema directory, where the index is stored.
+
+        Returns
+        -------
+        schema_index : dict
+            Loci files basenames as keys and tuples with the DNA
+            and protein indexes of each locus (see
+            :py:func:`index_locus`) as values.
+    """
+
+    index_file = os.path.join(schema_directory, INDEX_FILE)
+    stored = {}
+    if os.path.isfile(index_file):
+        try:
+            with open(index_file, 'rb') as f:
+                stored = pickle.load(f)
+        except Exception:
+            stored = {}
+
+    updated = False
+    schema_index = {}
+    for locus_file in loci_files:
+        locus = os.path.basename(locus_file)
+        signature = file_signature(locus_file)
+        entry = stored.get(locus)
+        if entry is None or entry[0] != signature or len(entry[1]) != 2:
+            entry = (signature, index_locus(locus_file))
+            stored[locus] = entry
+            updated = True
+        schema_index[locus] = entry[1]
+
+    if updated:
+        # write to temporary file first to avoid corrupting
+        # the index if the process is interrupted
+        with open(index_file + '.tmp', 'wb') as f:
+            pickle.dump(stored, f)
+        os.replace(index_file + '.tmp', index_file)
+
+    return schema_index
+
+
+def invert_schema_index(schema_index, protein=False):
+    """ Creates a lookup table from sequence hashes to the loci and
+        alleles with that sequence.
+
+        Parameters
+        ----------
+        schema_index : dict
+            Index returned by :py:func:`load_schema_index`.
+        protein : bool
+            Create the lookup table for the protein hashes instead
+            of the DNA hashes.
+
+        Returns
+        -------
+        lookup : dict
+            Sequence hashes as keys and lists of tuples with the locus
+            basename and the identifier of the first allele with that
+            sequence in the locus as values.
+    """
+
+    lookup = {}
+    for locus, locus_indexes in schema_index.items():
+        locus_index = locus_indexes[1] if protein else locus_indexes[0]
+        for seq_hash, alleles in locus_index.items():
+            lookup.setdefault(seq_hash, []).append((locus, alleles[0]))
+
+    return lookup
+
+
+def genome_hashes_path(basepath, genome_file):
+    """ Path to the file with the hash table of a genome's CDSs."""
+
+    return os.path.join(basepath, os.path.basename(genome_file) + '_CDS_hashes.txt')
+
+
+def genome_protein_hashes_path(basepath, genome_file):
+    """ Path to the file with the hash table of a genome's proteins."""
+
+    return os.path.join(basepath, os.path.basename(genome_file) + '_protein_hashes.txt')
+
+
+def locus_exact_path(basepath, locus_file):
+    """ Path to the file with the exact matches determined for a locus."""
+
+    return os.path.join(basepath, os.path.basename(locus_file) + '_exact.txt')
+
+
+def find_exact_matches(schema_index, genomes, loci_files, basepath):
+    """ Finds the exact matches between the CDSs of all genomes and the
+        alleles of all loci and saves them in one file per locus.
+
+        CDSs that do not match any allele of a locus at the DNA level
+        but code for the same protein as one of the alleles are stored
+        as protein matches.
+
+        Parameters
+        ----------
+        schema_index : dict
+            Index returned by :py:func:`load_schema_index`.
+        genomes : list
+            Paths to the genome files. The position of each genome in
+            this list is used to identify it in the results.
+        loci_files : list
+            Paths to the loci files.
+        basepath : str
+            Path to the temporary directory with the genomes hash tables.
+
+        Returns
+        -------
+        total_matches : int
+            Number of (locus, genome) pairs with at least one exact match.
+            Each locus file (see :py:func:`locus_exact_path`) has a tuple
+            with the DNA and protein matches. Both are dictionaries with
+            genome indexes as keys and a dictionary as value, mapping the
+            hashes of the matched sequences to the list of CDS identifiers
+            with that sequence and the identifier of the allele.
+    """
+
+    dna_lookup = invert_schema_index(schema_index)
+    protein_lookup = invert_schema_index(schema_index, protein=True)
+
+    exact_matches = {os.path.basename(locus): ({}, {}) for locus in loci_files}
+    for genome_index, genome in enumerate(genomes):
+        with open(genome_hashes_path(basepath, genome), 'rb') as f:
+            hash_table = pickle.load(f)
+
+        for seq_hash, cdsids in hash_table.items():
+            for locus, allele in dna_lookup.get(seq_hash, []):
+                if locus in exact_matches:
+                    genome_matches = exact_matches[locus][0].setdefault(genome_index, {})
+                    genome_matches[seq_hash] = (cdsids, allele)
+
+        with open(genome_protein_hashes_path(basepath, genome), 'rb') as f:
+            protein_table = pickle.load(f)
+
+        for prot_hash, cdsids in protein_table.items():
+            for locus, allele in protein_lookup.get(prot_hash, []):
+                # DNA exact matches are classified first
+                if locus in exact_matches and genome_index not in exact_matches[locus][0]:
+                    genome_matches = exact_matches[locus][1].setdefault(genome_index, {})
+                    genome_matches[prot_hash] = (cdsids, allele)
+
+    total_matches = 0
+    for locus_file in loci_files:
+        locus_matches = exact_matches[os.path.basename(locus_file)]
+        total_matches += len(locus_matches[0])
+        with open(locus_exact_path(basepath, locus_file), 'wb') as f:
+            pickle.dump(locus_matches, f)
+
+    return total_matches
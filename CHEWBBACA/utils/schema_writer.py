@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Purpose
+-------
+This module applies the changes made to the schema during the allele
+call. Locus workers do not append new alleles to the schema files.
+Each worker writes all the alleles it inferred, and the self-scores of
+the locus representatives, to a write-ahead log (WAL) in the temporary
+directory, and the main process commits the logs of all loci after the
+allele call.
+
+A log is written to a temporary file and renamed, so a log either has
+all the changes of a locus or does not exist. Committing a log rewrites
+each file of the locus to a temporary file that replaces the original
+file, so processes that read the schema during the allele call (a
+schema download, an evaluation...) always read a complete file. Files
+are synced once per log and per committed file, not once per allele.
+
+Committing is idempotent: alleles whose identifiers are already in a
+file are not added again, so a log can be committed again if the
+process is interrupted before the log is removed.
+
+Code documentation
+------------------
+"""
+
+import os
+import glob
+import json
+import pickle
+
+
+WAL_DIRECTORY = 'schema_wal'
+WAL_EXTENSION = '.wal'
+
+
+def wal_path(temppath, locus):
+    """ Gets the path to the write-ahead log of a locus."""
+
+    return os.path.join(temppath, WAL_DIRECTORY, os.path.basename(locus) + WAL_EXTENSION)
+
+
+def atomic_write(output_file, data, mode='w'):
+    """ Writes data to a temporary file in the directory of the
+        output file and replaces the output file with it.
+
+        Parameters
+        ----------
+        output_file : str
+            Path to the output file.
+        data : str or bytes
+            Contents of the file.
+        mode : str
+            'w' for text or 'wb' for bytes.
+    """
+
+    temp_file = '{0}.{1}.tmp'.format(output_file, os.getpid())
+    with open(temp_file, mode) as outfile:
+        outfile.write(data)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+
+    os.replace(temp_file, output_file)
+
+
+def fasta_identifiers(fasta_file):
+    """ Gets the identifiers of the records in a FASTA file,
+        returning an empty set if the file does not exist.
+    """
+
+    if not os.path.isfile(fasta_file):
+        return set()
+
+    with open(fasta_file, 'r') as infile:
+        return {line[1:].split()[0] for line in infile
+                if line.startswith('>') and len(line) > 2}
+
+
+def stage_locus(temppath, locus, alleles, scores=None):
+    """ Writes the changes to the files of a locus to its
+        write-ahead log.
+
+        Parameters
+        ----------
+        temppath : str
+            Path to the temporary directory of the allele call.
+        locus : str
+            Path to the locus file.
+        alleles : dict
+            Paths to FASTA files as keys and lists with the
+            identifiers and DNA sequences of the alleles that
+            are added to each file as values.
+        scores : list
+            Path to the file with the self-scores of the locus
+            representatives and the dictionary with the scores,
+            or None if the scores did not change.
+
+        Returns
+        -------
+        str
+            Path to the log, or None if there are no changes.
+    """
+
+    alleles = {fasta: records for fasta, records in alleles.items() if len(records) > 0}
+    if len(alleles) == 0 and scores is None:
+        return None
+
+    log = {'locus': locus,
+           'alleles': {fasta: [[name, sequence] for name, sequence in records]
+                       for fasta, records in alleles.items()},
+           'scores': None}
+    if scores is not None:
+        log['scores'] = [scores[0], {str(k): v for k, v in scores[1].items()}]
+
+    os.makedirs(os.path.join(temppath, WAL_DIRECTORY), exist_ok=True)
+    output_file = wal_path(temppath, locus)
+    atomic_write(output_file, json.dumps(log))
+
+    return output_file
+
+
+def commit_log(log_file):
+    """ Applies the changes in a write-ahead log to the schema
+        and removes the log.
+
+        Parameters
+        ----------
+        log_file : str
+            Path to the log written by :py:func:`stage_locus`.
+
+        Returns
+        -------
+        int
+            Number of alleles added to the files of the locus.
+    """
+
+    with open(log_file, 'r') as infile:
+        log = json.load(infile)
+
+    added = 0
+    for fasta, records in log['alleles'].items():
+        identifiers = fasta_identifiers(fasta)
+        new_records = []
+        for name, sequence in records:
+            if name not in identifiers:
+                identifiers.add(name)
+                new_records.append('>{0}\n{1}\n'.format(name, sequence))
+
+        if len(new_records) > 0:
+            current = ''
+            if os.path.isfile(fasta):
+                with open(fasta, 'r') as infile:
+                    current = infile.read()
+            if len(current) > 0 and not current.endswith('\n'):
+                current += '\n'
+            atomic_write(fasta, current + ''.join(new_records))
+            added += len(new_records)
+
+    if log['scores'] is not None:
+        scores_file, scores = log['scores']
+        atomic_write(scores_file, pickle.dumps(scores), 'wb')
+
+    os.remove(log_file)
+
+    return added
+
+
+def commit_all(temppath):
+    """ Commits the write-ahead logs of all loci.
+
+        Parameters
+        ----------
+        temppath : str
+            Path to the temporary directory of the allele call.
+
+        Returns
+        -------
+        list
+            Number of loci and number of alleles that were
+            added to the schema.
+    """
+
+    logs = sorted(glob.glob(os.path.join(temppath, WAL_DIRECTORY, '*' + WAL_EXTENSION)))
+    added = 0
+    for log_file in logs:
+        added += commit_log(log_file)
+
+    return [len(logs), added]
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Purpose
+-------
+This module manages a schema-level store with the BLAST raw scores of the
+self-alignment of the representative alleles, used as denominator when
+computing BLAST Score Ratios (BSR).
+
+Scores are stored per protein hash, so that representatives that change
+get new entries automatically, and are grouped by BLAST version and scoring
+matrix, so that scores computed with a different setup are never reused.
+Missing scores are computed with a single BLAST search per locus or,
+if the BLAST setup was validated to report the same values, directly
+from the diagonal of the BLOSUM62 matrix.
+
+Code documentation
+------------------
+"""
+
+import os
+import pickle
+import subprocess
+
+import numpy as np
+from Bio import SeqIO
+from Bio.Blast.Applications import NcbiblastpCommandline
+
+try:
+    from utils import schema_index
+except:
+    from CHEWBBACA.utils import schema_index
+
+
+# name of the file with the self-scores in the schema directory
+STORE_FILE = '.self_scores'
+# scoring matrix used by BLASTp in the allele call
+SCORING_MATRIX = 'BLOSUM62'
+# number of representatives BLASTed to validate the analytic scores
+VALIDATION_SAMPLE = 200
+
+# diagonal of the BLOSUM62 matrix used by BLAST, residues
+# that are not in the matrix are scored as 'X'
+BLOSUM62_DIAGONAL = {'A': 4, 'R': 5, 'N': 6, 'D': 6, 'C': 9, 'Q': 5, 'E': 5,
+                     'G': 6, 'H': 8, 'I': 4, 'L': 4, 'K': 5, 'M': 5, 'F': 6,
+                     'P': 7, 'S': 4, 'T': 5, 'W': 11, 'Y': 7, 'V': 4, 'B': 4,
+                     'J': 3, 'Z': 4, 'X': -1, '*': 1}
+
+
+def diagonal_lookup_table(diagonal=BLOSUM62_DIAGONAL):
+    """ Creates an array indexed by ASCII code with the score of
+        aligning each residue against itself.
+    """
+
+    table = np.full(256, diagonal['X'], dtype=np.int64)
+    for residue, score in diagonal.items():
+        table[ord(residue)] = score
+        table[ord(residue.lower())] = score
+
+    return table
+
+
+DIAGONAL_TABLE = diagonal_lookup_table()
+
+
+def max_segment_score(values):
+    """ Determines the score of the highest scoring segment
+        of an ungapped alignment.
+    """
+
+    best = 0
+    current = 0
+    for value in values:
+        current = max(0, current + int(value))
+        best = max(best, current)
+
+    return best
+
+
+def analytic_self_scores(proteins):
+    """ Computes the raw score of the ungapped alignment of each protein
+        against itself from the diagonal of the BLOSUM62 matrix.
+
+        Parameters
+        ----------
+        proteins : dict
+            Sequence identifiers as keys and protein sequences as values.
+
+        Returns
+        -------
+        scores : dict
+            Sequence identifiers as keys and self-scores as values.
+    """
+
+    seqids = [seqid for seqid, protein in proteins.items() if len(protein) > 0]
+    if len(seqids) == 0:
+        return {}
+
+    sequences = [proteins[seqid] for seqid in seqids]
+    lengths = np.array([len(seq) for seq in sequences], dtype=np.int64)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+    residues = np.frombuffer(''.join(sequences).encode('ascii'), dtype=np.uint8)
+    values = DIAGONAL_TABLE[residues]
+
+    totals = np.add.reduceat(values, starts)
+    negatives = np.add.reduceat((values < 0).astype(np.int64), starts)
+
+    scores = {}
+    for i, seqid in enumerate(seqids):
+        # local alignment may not include residues with negative scores
+        if negatives[i] > 0:
+            scores[seqid] = max_segment_score(values[starts[i]:starts[i]+lengths[i]])
+        else:
+            scores[seqid] = int(totals[i])
+
+    return scores
+
+
+def blast_version(blast_path):
+    """ Gets the version of a BLAST executable.
+
+        Parameters
+        ----------
+        blast_path : str
+            Path to the BLAST executable.
+
+        Returns
+        -------
+        str
+            The version reported by BLAST (e.g.: '2.9.0+').
+    """
+
+    proc = subprocess.Popen([blast_path, '-version'],
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    stdout, stderr = proc.communicate()
+
+    return stdout.decode('utf-8').split('\n')[0].split(' ')[-1]
+
+
+def store_key(blast_path, matrix=SCORING_MATRIX):
+    """ Key used to group the self-scores in the store."""
+
+    return (blast_version(blast_path), matrix)
+
+
+def read_store(schema_directory):
+    """ Reads the file with the self-scores of a schema."""
+
+    store_file = os.path.join(schema_directory, STORE_FILE)
+    if os.path.isfile(store_file):
+        try:
+            with open(store_file, 'rb') as f:
+                return pickle.load(f)
+        except Exception:
+            pass
+
+    return {}
+
+
+def load_store(schema_directory, key):
+    """ Loads the self-scores computed with a given BLAST setup.
+
+        Parameters
+        ----------
+        schema_directory : str
+            Path to the schema directory.
+        key : tuple
+            BLAST version and scoring matrix (see :py:func:`store_key`).
+
+        Returns
+        -------
+        dict
+            Protein hashes as keys and self-scores as values.
+    """
+
+    return read_store(schema_directory).get(key, {})
+
+
+def save_store(schema_directory, key, value):
+    """ Saves the self-scores computed with a given BLAST setup,
+        keeping the scores computed with other setups.
+    """
+
+    store_file = os.path.join(schema_directory, STORE_FILE)
+    store = read_store(schema_directory)
+    store[key] = value
+
+    with open(store_file + '.tmp', 'wb') as f:
+        pickle.dump(store, f)
+    os.replace(store_file + '.tmp', store_file)
+
+
+def blast_self_scores(proteins, blast_path, output_directory, name):
+    """ Computes the self-scores of a set of proteins with a single
+        BLAST search.
+
+        Parameters
+        ----------
+        proteins : dict
+            Sequence identifiers as keys and protein sequences as values.
+            Identifiers cannot have spaces.
+        blast_path : str
+            Path to the blastp executable.
+        output_directory : str
+            Directory where the temporary files are created.
+        name : str
+            Basename for the temporary files.
+
+        Returns
+        -------
+        scores : dict
+            Sequence identifiers as keys and the raw score of the
+            alignment of each protein against itself as values.
+    """
+
+    fasta_file = os.path.join(output_directory, name + '_self.fasta')
+    with open(fasta_file, 'w') as f:
+        for seqid, protein in proteins.items():
+            f.write('>{0}\n{1}\n'.format(seqid, protein))
+
+    database = os.path.join(output_directory, name + '_self_db')
+    makeblastdb_cmd = ['makeblastdb', '-in', fasta_file, '-out', database,
+                       '-dbtype', 'prot', '-logfile', database + '_blast.log']
+    subprocess.call(makeblastdb_cmd)
+
+    # raw scores do not depend on the database size, no need to
+    # limit the e-value as long as every protein finds itself
+    cline = NcbiblastpCommandline(cmd=blast_path, query=fasta_file,
+                                  db=database, outfmt='6 qseqid score stitle',
+                                  max_target_seqs=len(proteins), max_hsps=1,
+                                  num_threads=1)
+    out, err = cline()
+
+    scores = {}
+    for line in out.splitlines():
+        if line == '':
+            continue
+        qseqid, score, stitle = line.split('\t', 2)
+        if qseqid == stitle.split(' ', 1)[0]:
+            scores[qseqid] = max(int(score), scores.get(qseqid, 0))
+
+    for file in os.listdir(output_directory):
+        if file.startswith(name + '_self'):
+            os.remove(os.path.join(output_directory, file))
+
+    return scores
+
+
+def locus_self_scores(locus, proteins, blast_path, output_directory,
+                      analytic=False):
+    """ Computes the self-scores of the proteins of a locus.
+
+        Parameters
+        ----------
+        locus : str
+            Locus identifier, used to name temporary files.
+        proteins : dict
+            Protein hashes as keys and protein sequences as values.
+        blast_path : str
+            Path to the blastp executable.
+        output_directory : str
+            Directory where the temporary files are created.
+        analytic : bool
+            Compute the scores from the BLOSUM62 matrix instead
+            of running BLAST.
+
+        Returns
+        -------
+        dict
+            Protein hashes as keys and self-scores as values.
+    """
+
+    if analytic:
+        return analytic_self_scores(proteins)
+
+    # BLAST identifiers are the order of each protein
+    hashes = list(proteins.keys())
+    ordered = {str(i): proteins[h] for i, h in enumerate(hashes)}
+    scores = blast_self_scores(ordered, blast_path, output_directory, locus)
+
+    return {hashes[int(i)]: score for i, score in scores.items()}
+
+
+def validate_analytic_scores(proteins, blast_path, output_directory):
+    """ Compares the self-scores computed from the BLOSUM62 matrix
+        with the ones reported by BLAST.
+
+        Parameters
+        ----------
+        proteins : dict
+            Sequence identifiers as keys and protein sequences as values.
+        blast_path : str
+            Path to the blastp executable.
+        output_directory : str
+            Directory where the temporary files are created.
+
+        Returns
+        -------
+        mismatches : list
+            List with one tuple per protein whose scores differ, with
+            the sequence identifier, the BLAST score and the analytic
+            score. Proteins that BLAST did not score are included with
+            a BLAST score of None.
+    """
+
+    blast_scores = blast_self_scores(proteins, blast_path,
+                                     output_directory, 'validation')
+    analytic_scores = analytic_self_scores(proteins)
+
+    mismatches = [(seqid, blast_scores.get(seqid), analytic_scores.get(seqid))
+                  for seqid in proteins
+                  if blast_scores.get(seqid) != analytic_scores.get(seqid)]
+
+    return mismatches
+
+
+def representative_proteins(short_file):
+    """ Translates the representative alleles of a locus.
+
+        Returns
+        -------
+        list
+            List with one tuple per representative, with the
+            allele identifier used as key in the '_bsr.txt' files,
+            the protein sequence and the protein hash.
+    """
+
+    representatives = []
+    alleles = list(SeqIO.parse(short_file, 'fasta'))
+    proteins = schema_index.translate_alleles([str(allele.seq.upper()) for allele in alleles])
+    for allele, protein in zip(alleles, proteins):
+        aux = allele.id.split('_')
+        allele_id = str(aux[0]) if len(aux) < 2 else str(aux[-1])
+        if protein is not None:
+            representatives.append((allele_id, protein,
+                                    schema_index.sequence_hash(protein)))
+
+    return representatives
+
+
+def sample_representatives(short_files, sample_size=VALIDATION_SAMPLE):
+    """ Selects representatives from evenly spaced loci.
+
+        Returns
+        -------
+        dict
+            Identifiers ('<locus index>-<allele id>') as keys
+            and protein sequences as values.
+    """
+
+    step = max(1, len(short_files) // sample_size)
+    sample = {}
+    for i in range(0, len(short_files), step):
+        for allele_id, protein, prot_hash in representative_proteins(short_files[i])[:1]:
+            sample['{0}-{1}'.format(i, allele_id)] = protein
+        if len(sample) >= sample_size:
+            break
+
+    return sample
+
+
+def analytic_scores_valid(short_files, schema_directory, blast_path,
+                          output_directory):
+    """ Determines if the self-scores reported by the BLAST setup can be
+        computed from the BLOSUM62 matrix, checking a sample of the
+        representatives of the schema. The result is stored and only
+        determined once per BLAST version.
+
+        Returns
+        -------
+        bool
+            True if BLAST reported the analytic score for all
+            representatives in the sample, False otherwise.
+    """
+
+    validation_key = ('validation',) + store_key(blast_path)
+    valid = read_store(schema_directory).get(validation_key)
+    if valid is None:
+        sample = sample_representatives(short_files)
+        mismatches = validate_analytic_scores(sample, blast_path,
+                                              output_directory)
+        valid = len(mismatches) == 0
+        print('Self-scores computed from the {0} matrix differ from BLAST '
+              'for {1} of {2} sampled representatives.'.format(SCORING_MATRIX,
+                                                                len(mismatches),
+                                                                len(sample)))
+        save_store(schema_directory, validation_key, valid)
+
+    return valid
+
+
+def update_schema_scores(short_files, schema_directory, blast_path,
+                         output_directory, pool, analytic=False):
+    """ Makes sure the store has the self-scores of the representatives
+        of all loci and writes the '_bsr.txt' file of each locus from
+        the store, replacing previous values.
+
+        Parameters
+        ----------
+        short_files : list
+            Paths to the files with the representatives of each locus.
+        schema_directory : str
+            Path to the schema directory.
+        blast_path : str
+            Path to the blastp executable.
+        output_directory : str
+            Directory where the temporary files are created.
+        pool : multiprocessing.Pool
+            Pool used to compute the scores of several loci in parallel.
+        analytic : bool
+            Compute the missing scores from the BLOSUM62 matrix
+            instead of running BLAST.
+
+        Returns
+        -------
+        total_computed : int
+            Number of self-scores that had to be computed.
+    """
+
+    key = store_key(blast_path)
+    scores = load_store(schema_directory, key)
+
+    loci_reps = {}
+    missing = {}
+    for short_file in short_files:
+        representatives = representative_proteins(short_file)
+        loci_reps[short_file] = representatives
+        locus_missing = {h: p for i, p, h in representatives if h not in scores}
+        if len(locus_missing) > 0:
+            missing[short_file] = locus_missing
+
+    total_computed = 0
+    if analytic:
+        all_missing = {}
+        for proteins in missing.values():
+            all_missing.update(proteins)
+        computed = analytic_self_scores(all_missing)
+        total_computed += len(computed)
+        scores.update(computed)
+    else:
+        results = [pool.apply_async(locus_self_scores,
+                                    (os.path.basename(short_file), proteins,
+                                     blast_path, output_directory))
+                   for short_file, proteins in missing.items()]
+
+        for result in results:
+            locus_scores = result.get()
+            total_computed += len(locus_scores)
+            scores.update(locus_scores)
+
+    if total_computed > 0:
+        save_store(schema_directory, key, scores)
+
+    for short_file, representatives in loci_reps.items():
+        var = {i: scores[h] for i, p, h in representatives if h in scores}
+        with open(os.path.abspath(short_file) + '_bsr.txt', 'wb') as f:
+            pickle.dump(var, f)
+
+    return total_computed
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Purpose
+-------
+This module runs the tasks of a process (one task per genome, locus,
+pair of genomes...) in a pool of worker processes. It is used instead
+of submitting all tasks with `apply_async` so that:
+
+    - tasks are submitted with `imap_unordered`, in chunks, and only a
+      bounded number of tasks is queued at any time. Task arguments are
+      created and pickled as the workers need them, instead of keeping
+      the arguments of all tasks in memory.
+    - exceptions raised by a task are propagated to the main process as
+      a :py:class:`TaskError` with the traceback from the worker, and
+      the remaining tasks are cancelled.
+    - a callback is called each time a task finishes, to report progress.
+
+Code documentation
+------------------
+"""
+
+import sys
+import threading
+import traceback
+import multiprocessing
+
+
+# tasks queued per worker process when no limit is given
+TASKS_PER_PROCESS = 4
+
+
+class TaskError(Exception):
+    """ Raised when a task fails in a worker process.
+
+        Parameters
+        ----------
+        task : str
+            Description of the task (the first argument of the task).
+        remote_traceback : str
+            Traceback of the exception raised in the worker.
+    """
+
+    def __init__(self, task, remote_traceback):
+        self.task = task
+        self.remote_traceback = remote_traceback
+        super().__init__('task {0} failed:\n{1}'.format(task, remote_traceback))
+
+
+def call_task(job):
+    """ Runs a task in a worker process, capturing any exception
+        so that the main process knows which task failed.
+
+        Parameters
+        ----------
+        job : tuple
+            Index of the task, function and arguments.
+
+        Returns
+        -------
+        list
+            Index of the task, True if the task succeeded and the
+            value returned by the function, or False and the
+            traceback of the exception.
+    """
+
+    index, function, args = job
+    try:
+        return [index, True, function(*args)]
+    except Exception:
+        return [index, False, traceback.format_exc()]
+
+
+def report_progress(completed, total):
+    """ Progress callback that prints the number and percentage
+        of tasks completed in the same line.
+    """
+
+    if total:
+        sys.stdout.write('\r  {0}/{1} ({2}%)'.format(completed, total,
+                                                     int(completed*100/total)))
+        if completed == total:
+            sys.stdout.write('\n')
+    else:
+        sys.stdout.write('\r  {0}'.format(completed))
+    sys.stdout.flush()
+
+
+def imap_tasks(function, tasks, processes=1, max_in_flight=None,
+               chunksize=1, progress=None):
+    """ Runs a function for each set of arguments in a pool of
+        processes, yielding the results as tasks finish.
+
+        Parameters
+        ----------
+        function : func
+            Function executed by the workers. Must be defined at
+            the top level of a module.
+        tasks : iterable
+            Tuples with the arguments of each task. Can be a
+            generator, arguments are only created when there
+            is space for more tasks.
+        processes : int
+            Number of worker processes.
+        max_in_flight : int
+            Maximum number of tasks submitted and not yet finished.
+            Defaults to 4 tasks per process. Always at least
+            `chunksize`.
+        chunksize : int
+            Number of tasks sent to a worker at a time.
+        progress : func
+            Called with the number of tasks completed and the total
+            number of tasks (None if `tasks` has no length) each time
+            a task finishes.
+
+        Yields
+        ------
+        tuple
+            Index of the task in `tasks` and the value returned
+            by the function, in the order tasks finish.
+
+        Raises
+        ------
+        TaskError
+            If a task raises an exception. Tasks that have not
+            finished are cancelled.
+    """
+
+    total = len(tasks) if hasattr(tasks, '__len__') else None
+    if max_in_flight is None:
+        max_in_flight = processes * TASKS_PER_PROCESS
+    max_in_flight = max(max_in_flight, chunksize)
+
+    slots = threading.Semaphore(max_in_flight)
+    stop = threading.Event()
+    labels = {}
+
+    def jobs():
+        # runs in the thread of the pool that submits tasks, blocking
+        # while the maximum number of tasks is in flight
+        for index, args in enumerate(tasks):
+            while not slots.acquire(timeout=0.1):
+                if stop.is_set():
+                    return
+            if stop.is_set():
+                return
+            labels[index] = args[0] if len(args) > 0 else index
+            yield (index, function, args)
+
+    pool = multiprocessing.Pool(processes)
+    finished = False
+    completed = 0
+    try:
+        for index, success, result in pool.imap_unordered(call_task, jobs(), chunksize):
+            slots.release()
+            label = labels.pop(index)
+            if not success:
+                raise TaskError(label, result)
+
+            completed += 1
+            if progress is not None:
+                progress(completed, total)
+
+            yield (index, result)
+        finished = True
+    finally:
+        stop.set()
+        if finished:
+            pool.close()
+        else:
+            pool.terminate()
+        pool.join()
+
+
+def run_tasks(function, tasks, processes=1, max_in_flight=None,
+              chunksize=1, progress=None):
+    """ Runs a function for each set of arguments in a pool of
+        processes (see :py:func:`imap_tasks`).
+
+        Returns
+        -------
+        list
+            Values returned by the function, in the order of `tasks`.
+    """
+
+    results = dict(imap_tasks(function, tasks, processes, max_in_flight,
+                              chunksize, progress))
+
+    return [results[i] for i in range(len(results))]
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Purpose
+-------
+This module translates coding sequences (CDSs) and checks if DNA
+sequences are valid CDSs. A sequence is a valid CDS in an orientation
+if, read in that orientation, its length is a multiple of 3, it starts
+with a start codon, ends with a stop codon and has no other in-frame
+stop codons (the same rules applied by Biopython with `cds=True`).
+Sequences are checked in four orientations, in the following order:
+
+    - 'sense': the sequence as given.
+    - 'antisense': the reverse complement.
+    - 'revsense': the reverse.
+    - 'revantisense': the complement (reverse of the reverse complement).
+
+Codons are translated with lookup tables built from the Biopython codon
+tables. Bases are converted to integers with NumPy, so sequences are
+translated without creating Biopython objects or catching exceptions for
+each orientation that is not valid. :py:func:`translate_sequences`
+translates many sequences at once, with a single lookup for all the
+sequences that are checked in each orientation.
+
+Sequences with ambiguous bases (IUPAC codes) are not valid CDSs for the
+lookup tables. :py:func:`translate_ambiguous` translates them with
+Biopython, with ambiguous codons translated to 'X' when they can code
+for more than one amino acid, so that callers can keep the CDSs of
+genomes with ambiguous bases.
+
+Code documentation
+------------------
+"""
+
+import functools
+
+import numpy as np
+from Bio.Data import CodonTable
+from Bio.Data.CodonTable import TranslationError
+from Bio.Seq import translate, reverse_complement as ambiguous_reverse_complement
+
+
+# orientations checked to find the coding strand, in order
+SENSE = 'sense'
+ANTISENSE = 'antisense'
+REVSENSE = 'revsense'
+REVANTISENSE = 'revantisense'
+ORIENTATIONS = [SENSE, ANTISENSE, REVSENSE, REVANTISENSE]
+
+# validity codes
+VALID = 0
+INVALID_CHARACTERS = 1
+INVALID_LENGTH = 2
+NOT_CDS = 3
+# assigned by callers that filter sequences by length
+SHORT = 4
+
+# integer code of each base, any other character is invalid
+BASES = 'ACGT'
+INVALID_BASE = 4
+BASE_CODES = np.full(256, INVALID_BASE, dtype=np.uint8)
+for i, base in enumerate(BASES):
+    BASE_CODES[ord(base)] = i
+    BASE_CODES[ord(base.lower())] = i
+
+COMPLEMENT = str.maketrans('ACGTacgt', 'TGCATGCA')
+# characters deleted to check that a sequence only has valid bases
+VALID_BASES = str.maketrans('', '', 'ACGTacgt')
+
+STOP = ord('*')
+
+
+def reverse_complement(dna_sequence):
+    """ Determines the reverse complement of a DNA sequence.
+
+        Parameters
+        ----------
+        dna_sequence : str
+            DNA sequence.
+
+        Returns
+        -------
+        str
+            The reverse complement of the DNA sequence, in uppercase.
+
+        Raises
+        ------
+        KeyError
+            If the sequence has characters other than 'ACGT'.
+    """
+
+    invalid = str.translate(dna_sequence, VALID_BASES)
+    if len(invalid) > 0:
+        raise KeyError(invalid[0])
+
+    return dna_sequence.translate(COMPLEMENT)[::-1].upper()
+
+
+def orient(dna_sequence, orientation):
+    """ Gets a DNA sequence in one of the orientations checked
+        to find the coding strand.
+    """
+
+    if orientation == SENSE:
+        return dna_sequence
+    elif orientation == ANTISENSE:
+        return reverse_complement(dna_sequence)
+    elif orientation == REVSENSE:
+        return dna_sequence[::-1]
+    elif orientation == REVANTISENSE:
+        return reverse_complement(dna_sequence)[::-1]
+
+
+@functools.lru_cache(maxsize=None)
+def codon_table(table_id):
+    """ Creates the lookup tables used to translate codons.
+
+        Codons are indexed by the codes of their bases
+        (16*first + 4*second + third).
+
+        Parameters
+        ----------
+        table_id : int
+            Translation table identifier.
+
+        Returns
+        -------
+        list
+            Array with the amino acid (ASCII code, '*' for
+            stop codons) of each codon and boolean array
+            that is True for start codons.
+    """
+
+    table = CodonTable.unambiguous_dna_by_id[table_id]
+
+    amino_acids = np.zeros(64, dtype=np.uint8)
+    starts = np.zeros(64, dtype=bool)
+    for i in range(64):
+        codon = BASES[i // 16] + BASES[(i // 4) % 4] + BASES[i % 4]
+        if codon in table.stop_codons:
+            amino_acids[i] = STOP
+        else:
+            amino_acids[i] = ord(table.forward_table[codon])
+        starts[i] = codon in table.start_codons
+
+    return [amino_acids, starts]
+
+
+def encode(dna_sequence):
+    """ Converts a DNA sequence into an array with
+        the integer code of each base.
+    """
+
+    data = dna_sequence.encode('ascii', 'replace')
+
+    return BASE_CODES[np.frombuffer(data, dtype=np.uint8)]
+
+
+def oriented_codes(codes, orientation):
+    """ Gets the codes of a sequence in one of the orientations
+        checked to find the coding strand.
+    """
+
+    if orientation == SENSE:
+        return codes
+    elif orientation == ANTISENSE:
+        return 3 - codes[::-1]
+    elif orientation == REVSENSE:
+        return codes[::-1]
+    elif orientation == REVANTISENSE:
+        return 3 - codes
+
+
+def translate_codes(arrays, table_id):
+    """ Translates several sequences in a single lookup.
+
+        Parameters
+        ----------
+        arrays : list
+            Arrays with the codes of the sequences. All
+            sequences must have at least two codons.
+        table_id : int
+            Translation table identifier.
+
+        Returns
+        -------
+        list
+            Protein sequence of each input sequence, without the
+            stop codon, or None for sequences that are not CDSs.
+    """
+
+    if len(arrays) == 0:
+        return []
+
+    amino_acids, starts = codon_table(table_id)
+
+    codons = np.concatenate(arrays).reshape(-1, 3)
+    indexes = codons[:, 0]*16 + codons[:, 1]*4 + codons[:, 2]
+    translated = amino_acids[indexes]
+
+    lengths = np.array([len(a) // 3 for a in arrays], dtype=np.int64)
+    ends = np.cumsum(lengths)
+    firsts = ends - lengths
+
+    # first codon is a start codon, last codon is the only stop codon
+    stops = np.add.reduceat((translated == STOP).astype(np.int64), firsts)
+    valid = starts[indexes[firsts]] & (translated[ends-1] == STOP) & (stops == 1)
+
+    protein_bytes = translated.tobytes()
+    proteins = []
+    for first, end, is_valid in zip(firsts.tolist(), ends.tolist(), valid.tolist()):
+        if is_valid:
+            # start codons are always translated to methionine
+            proteins.append('M' + protein_bytes[first+1:end-1].decode('ascii'))
+        else:
+            proteins.append(None)
+
+    return proteins
+
+
+def translate_sequences(sequences, table_id=11, orientations=ORIENTATIONS,
+                        ambiguous=False):
+    """ Translates DNA sequences, checking each sequence in
+        the four orientations until one is a valid CDS.
+
+        Parameters
+        ----------
+        sequences : list
+            DNA sequences (uppercase or lowercase).
+        table_id : int
+            Translation table identifier.
+        orientations : list
+            Orientations that are checked, in order. Used to
+            translate sequences with a known coding strand.
+        ambiguous : bool
+            Translate sequences with ambiguous bases with
+            :py:func:`translate_ambiguous` instead of
+            classifying them as invalid.
+
+        Returns
+        -------
+        list
+            One list per input sequence with the validity code,
+            the protein sequence (empty string if the sequence
+            is not valid), the uppercase DNA sequence in the
+            orientation that was translated (or as given if the
+            sequence is not valid) and the orientation (None if
+            the sequence is not valid).
+    """
+
+    results = [None] * len(sequences)
+    codes = {}
+    for i, sequence in enumerate(sequences):
+        sequence_codes = encode(sequence)
+        if len(sequence_codes) > 0 and sequence_codes.max() == INVALID_BASE:
+            results[i] = [INVALID_CHARACTERS, '', sequence.upper(), None]
+        elif len(sequence_codes) % 3 != 0:
+            results[i] = [INVALID_LENGTH, '', sequence.upper(), None]
+        # a CDS needs a start and a stop codon
+        elif len(sequence_codes) < 6:
+            results[i] = [NOT_CDS, '', sequence.upper(), None]
+        else:
+            codes[i] = sequence_codes
+
+    pending = list(codes)
+    for orientation in orientations:
+        proteins = translate_codes([oriented_codes(codes[i], orientation) for i in pending],
+                                   table_id)
+        not_translated = []
+        for i, protein in zip(pending, proteins):
+            if protein is None:
+                not_translated.append(i)
+            else:
+                results[i] = [VALID, protein,
+                              orient(sequences[i].upper(), orientation),
+                              orientation]
+        pending = not_translated
+
+    for i in pending:
+        results[i] = [NOT_CDS, '', sequences[i].upper(), None]
+
+    if ambiguous:
+        for i, result in enumerate(results):
+            if result[0] == INVALID_CHARACTERS:
+                results[i] = translate_ambiguous(sequences[i], table_id, orientations)
+
+    return results
+
+
+def orient_ambiguous(dna_sequence, orientation):
+    """ Gets a DNA sequence with ambiguous bases in one of the
+        orientations checked to find the coding strand.
+    """
+
+    if orientation == SENSE:
+        return dna_sequence
+    elif orientation == ANTISENSE:
+        return ambiguous_reverse_complement(dna_sequence)
+    elif orientation == REVSENSE:
+        return dna_sequence[::-1]
+    elif orientation == REVANTISENSE:
+        return ambiguous_reverse_complement(dna_sequence)[::-1]
+
+
+def translate_ambiguous(dna_sequence, table_id=11, orientations=ORIENTATIONS):
+    """ Translates a DNA sequence that can have ambiguous bases,
+        checking the given orientations until one is a valid CDS.
+        Much slower than :py:func:`translate_sequences`, only used
+        for the sequences that have ambiguous bases.
+
+        Returns
+        -------
+        list
+            Validity code, protein sequence, DNA sequence in the
+            translated orientation and orientation (see
+            :py:func:`translate_sequences`).
+    """
+
+    dna_sequence = dna_sequence.upper()
+    for orientation in orientations:
+        try:
+            sequence = orient_ambiguous(dna_sequence, orientation)
+            protein = translate(sequence, table=table_id, cds=True)
+        except (TranslationError, ValueError, KeyError):
+            continue
+        return [VALID, str(protein), sequence, orientation]
+
+    return [INVALID_CHARACTERS, '', dna_sequence, None]
+
+
+def translate_cds(dna_sequence, table_id=11, orientations=ORIENTATIONS,
+                  ambiguous=False):
+    """ Translates a DNA sequence, checking the four orientations
+        (or the given orientations) until one is a valid CDS.
+
+        Returns
+        -------
+        list
+            Validity code, protein sequence, DNA sequence in the
+            translated orientation and orientation (see
+            :py:func:`translate_sequences`).
+    """
+
+    return translate_sequences([dna_sequence], table_id, orientations, ambiguous)[0]
+
+
+def orientation_errors(dna_sequence, table_id=11):
+    """ Determines why a DNA sequence is not a valid CDS
+        in each orientation.
+
+        Parameters
+        ----------
+        dna_sequence : str
+            DNA sequence with a length that is a multiple
+            of 3 and only valid bases.
+        table_id : int
+            Translation table identifier.
+
+        Returns
+        -------
+        list
+            One string per orientation with the orientation
+            and the reason, e.g. "sense(Final codon 'TTT' is
+            not a stop codon)". Orientations that are valid
+            CDSs are not included.
+    """
+
+    amino_acids, starts = codon_table(table_id)
+
+    errors = []
+    for orientation in ORIENTATIONS:
+        sequence = orient(dna_sequence.upper(), orientation)
+        codons = oriented_codes(encode(dna_sequence), orientation).reshape(-1, 3)
+        indexes = codons[:, 0]*16 + codons[:, 1]*4 + codons[:, 2]
+        translated = amino_acids[indexes]
+        if len(indexes) == 0 or not starts[indexes[0]]:
+            reason = "First codon '{0}' is not a start codon".format(sequence[:3])
+        elif translated[-1] != STOP:
+            reason = "Final codon '{0}' is not a stop codon".format(sequence[-3:])
+        elif (translated[:-1] == STOP).any():
+            reason = 'Extra in frame stop codon found.'
+        else:
+            continue
+        errors.append('{0}({1})'.format(orientation, reason))
+
+    return errors
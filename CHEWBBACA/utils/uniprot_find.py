@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
 
-from Bio.Seq import Seq
 from Bio import SeqIO
 import os
 import argparse
 from SPARQLWrapper import SPARQLWrapper, JSON
 import csv
 from collections import defaultdict
+
+try:
+    from utils import translation
+except ImportError:
+    from CHEWBBACA.utils import translation
 import multiprocessing
 virtuoso_server=SPARQLWrapper('http://sparql.uniprot.org/sparql')
 
@@ -30,15 +34,11 @@ def translateSeq(DNASeq, verbose):
     else:
         verboseprint = lambda *a: None  # do-nothing function
 
-    seq = DNASeq
-    tableid = 11
-    inverted = False
-
-    myseq = Seq(seq)
-    protseq = Seq.translate(myseq, table=tableid, cds=True)
-
+    code, protseq, seq, orientation = translation.translate_cds(DNASeq, 11, [translation.SENSE])
+    if code != translation.VALID:
+        raise ValueError("sequence is not translatable to a protein")
 
-    return str(protseq)
+    return protseq
 
 def check_if_list_or_folder(folder_or_list):
     list_files = []